@@ -14,6 +14,7 @@ import sys, os
 from operator import add
 from math import sqrt
 from numpy import median, mean
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -22,29 +23,34 @@ from numpy import median, mean
 TR     = 2000.0
 OFFSET = 2
 
-BLOCK          = 0
-TRIAL          = 0
-PROBLEM_ONSET  = 0
-PROBLEM_RT     = 0
-CHOICE_ONSET   = 0
-CHOICE_RT      = 0
-CHOICE_ACC     = 0
-LOGIC          = 0
-RULES          = 0
-NUM_OF_RULES   = 0
-
-# A different set of variables for the "Special" problem,
-# which is recorded at the "Block" level (instead of "Trial"
-# level).
-
-S_PROBLEM_ONSET = 0
-S_PROBLEM_RT    = 0
-S_CHOICE_ONSET  = 0
-S_CHOICE_RT     = 0
-S_CHOICE_ACC    = 0
-S_LOGIC         = 0
-S_RULES         = 0
-S_NUM_OF_RULES  = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py).  The
+## '[Trial]' columns are used if they exist, and the plain ones
+## otherwise.  The '[Block]' columns of the special problem (#17)
+## are optional, but all of them are needed to use it.
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'BLOCK'           : "BlockNum",
+    'PROBLEM_ONSET'   : ("Problem.OnsetTime[Trial]", "Problem.OnsetTime"),
+    'PROBLEM_RT'      : ("Problem.RT[Trial]", "Problem.RT"),
+    'CHOICE_ONSET'    : ("Choice.OnsetTime[Trial]", "Choice.OnsetTime"),
+    'CHOICE_RT'       : ("Choice.RT[Trial]", "Choice.RT"),
+    'CHOICE_ACC'      : ("Choice.ACC[Trial]", "Choice.ACC"),
+    'LOGIC'           : ("Logic[Trial]", "Logic"),
+    'RULES'           : ("Rules[Trial]", "Rules"),
+    'NUM_OF_RULES'    : ("NumRules[Trial]", "NumRules"),
+    'S_PROBLEM_ONSET' : "Problem.OnsetTime[Block]",
+    'S_PROBLEM_RT'    : "Problem.RT[Block]",
+    'S_CHOICE_ONSET'  : "Choice.OnsetTime[Block]",
+    'S_CHOICE_RT'     : "Choice.RT[Block]",
+    'S_CHOICE_ACC'    : "Choice.ACC[Block]",
+    'S_LOGIC'         : "Logic[Block]",
+    'S_RULES'         : "Rules[Block]",
+    'S_NUM_OF_RULES'  : "NumRules[Block]",
+    }
+
+SPECIAL = [x for x in COLUMNS.keys() if x.startswith("S_")]
 
 
 class Trial:
@@ -53,8 +59,9 @@ class Trial:
     (Encoding, Execution, Response), with associated Onsets and
     Durations (ie. RTs), followed by randomly-varying Delays.
     """
-    def __init__(self, tokens, subject=None):
+    def __init__(self, tokens, schema, subject=None):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         self.subject = subject
         try:
@@ -67,7 +74,7 @@ class Trial:
                 self.CreateSpecial(tokens)
                 self.Initialize()
             except ValueError as v:
-                sys.stderr.write("ValueError: %s; Trying Last Chance\n" % (v))
+                sys.stderr.write("ValueError: %s; Skipping trial\n" % (v))
                 self.ok = False
 
         except IndexError:
@@ -97,29 +104,31 @@ class Trial:
 
     def Create(self, tokens):
         """Performs the necessary initialization"""
-        self.block        = int(tokens[BLOCK])
-        self.problemOnset = int(tokens[PROBLEM_ONSET])
-        self.problemRt    = int(tokens[PROBLEM_RT])
-        self.choiceOnset  = int(tokens[CHOICE_ONSET])
-        self.choiceRt     = int(tokens[CHOICE_RT])
-        self.choiceAcc    = int(tokens[CHOICE_ACC])
+        self.block        = int(tokens[self.schema.BLOCK])
+        self.problemOnset = int(tokens[self.schema.PROBLEM_ONSET])
+        self.problemRt    = int(tokens[self.schema.PROBLEM_RT])
+        self.choiceOnset  = int(tokens[self.schema.CHOICE_ONSET])
+        self.choiceRt     = int(tokens[self.schema.CHOICE_RT])
+        self.choiceAcc    = int(tokens[self.schema.CHOICE_ACC])
 
-        self.logic        = tokens[LOGIC]
-        self.rules        = tokens[RULES]
-        self.numrules     = int(tokens[NUM_OF_RULES])
+        self.logic        = tokens[self.schema.LOGIC]
+        self.rules        = tokens[self.schema.RULES]
+        self.numrules     = int(tokens[self.schema.NUM_OF_RULES])
 
     def CreateSpecial(self, tokens):
         """Performs the necessary initialization for the Special Problem"""
+        if len([x for x in SPECIAL if not x in self.schema]) > 0:
+            raise ValueError, "No Special Problem columns"
         self.block        = 2 # By default, the second block
-        self.problemOnset = int(tokens[S_PROBLEM_ONSET])
-        self.problemRt    = int(tokens[S_PROBLEM_RT])
-        self.choiceOnset  = int(tokens[S_CHOICE_ONSET])
-        self.choiceRt     = int(tokens[S_CHOICE_RT])
-        self.choiceAcc    = int(tokens[S_CHOICE_ACC])
+        self.problemOnset = int(tokens[self.schema.S_PROBLEM_ONSET])
+        self.problemRt    = int(tokens[self.schema.S_PROBLEM_RT])
+        self.choiceOnset  = int(tokens[self.schema.S_CHOICE_ONSET])
+        self.choiceRt     = int(tokens[self.schema.S_CHOICE_RT])
+        self.choiceAcc    = int(tokens[self.schema.S_CHOICE_ACC])
 
-        self.logic        = tokens[S_LOGIC]
-        self.rules        = tokens[S_RULES]
-        self.numrules     = int(tokens[S_NUM_OF_RULES])
+        self.logic        = tokens[self.schema.S_LOGIC]
+        self.rules        = tokens[self.schema.S_RULES]
+        self.numrules     = int(tokens[self.schema.S_NUM_OF_RULES])
 
 
     def RelativeTime(self, val):
@@ -142,26 +151,6 @@ class Trial:
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global BLOCK           
-    global TRIAL           
-    global PROBLEM_ONSET
-    global PROBLEM_RT   
-    global CHOICE_ONSET 
-    global CHOICE_RT    
-    global CHOICE_ACC   
-    global LOGIC
-    global RULES
-    global NUM_OF_RULES
-
-    global S_PROBLEM_ONSET
-    global S_PROBLEM_RT   
-    global S_CHOICE_ONSET 
-    global S_CHOICE_RT    
-    global S_CHOICE_ACC   
-    global S_LOGIC
-    global S_RULES
-    global S_NUM_OF_RULES
-
     fin      = open(filename, 'rU')
     subject  = filename.split('-')[1]
     lines    = fin.readlines()
@@ -170,88 +159,11 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    # --- Block info ----------------------------------------------- #
-    try:
-        BLOCK          = colNames.index("BlockNum")
-    except ValueError as e:
-        sys.stderr.write("Cannot find 'Block' info. Aborting\n")
-        sys.exit(0)
-        
-    # --- Problem onset -------------------------------------------- #
-    try:
-        PROBLEM_ONSET  = colNames.index("Problem.OnsetTime[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Problem.OnsetTime' info at 'Trial' level\n")
-        PROBLEM_ONSET  = colNames.index("Problem.OnsetTime")
-        
-    # --- Problem RT ----------------------------------------------- #
-    try:
-        PROBLEM_RT     = colNames.index("Problem.RT[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Problem.RT' info at 'Trial' level\n")
-        PROBLEM_RT     = colNames.index("Problem.RT")
-
-    # --- Choice Onset --------------------------------------------- #
-    try:
-        CHOICE_ONSET   = colNames.index("Choice.OnsetTime[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Choice.Onset' info at 'Trial' level\n")
-        CHOICE_ONSET   = colNames.index("Choice.OnsetTime")
-
-    # --- Choice RT ------------------------------------------------ #
-
-    try:
-        CHOICE_RT      = colNames.index("Choice.RT[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Choice.RT' info at 'Trial' level\n")
-        CHOICE_RT      = colNames.index("Choice.RT")
-
-    # --- Choice Accuracy ------------------------------------------ #
-
-    try:
-        CHOICE_ACC     = colNames.index("Choice.ACC[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Choice.ACC' info at 'Trial' level\n")
-        CHOICE_ACC     = colNames.index("Choice.ACC")        
-    
-    # --- Logic ---------------------------------------------------- #
-        
-    try:
-        LOGIC          = colNames.index("Logic[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Logic' info at 'Trial' level\n")
-        LOGIC          = colNames.index("Logic")
-
-    # --- Rules ---------------------------------------------------- #
-    try:
-        RULES          = colNames.index("Rules[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Rules' info at 'Trial' level\n")
-        RULES          = colNames.index("Rules")
-    
-    # --- NumRules ------------------------------------------------- #
-    try:
-        NUM_OF_RULES   = colNames.index("NumRules[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'NumRules' info at 'Trial' level\n")
-        NUM_OF_RULES   = colNames.index("NumRules")
-
-    # --- Attempts to identify the fields for the Special XOR problem #
-
-    try:
-        S_PROBLEM_ONSET  = colNames.index("Problem.OnsetTime[Block]")
-        S_PROBLEM_RT     = colNames.index("Problem.RT[Block]")
-        S_CHOICE_ONSET   = colNames.index("Choice.OnsetTime[Block]")
-        S_CHOICE_RT      = colNames.index("Choice.RT[Block]")
-        S_CHOICE_ACC     = colNames.index("Choice.ACC[Block]")
-        S_LOGIC          = colNames.index("Logic[Block]")
-        S_RULES          = colNames.index("Rules[Block]")
-        S_NUM_OF_RULES   = colNames.index("NumRules[Block]")
-
-    except ValueError as e:
+    schema   = TableSchema(colNames, COLUMNS, SPECIAL)
+    if len([x for x in SPECIAL if not x in schema]) > 0:
         sys.stderr.write("Cannot find Special Problem, skipping...\n")
 
-    trials = [Trial(r, subject=subject) for r in rows]
+    trials = [Trial(r, schema, subject=subject) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     # Preprocess trials and saves data
@@ -11,6 +11,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of contrasts vectors (calculated per session)
@@ -24,35 +25,34 @@ from math import sqrt
 TR     = 2000.0
 OFFSET = 2
 
-BLOCK                = 0
-TRIAL                = 0
-PROBLEM_ONSET       = 0
-PROBLEM_RT          = 0
-CHOICE_ONSET      = 0
-CHOICE_RT         = 0
-CHOICE_ACC   = 0
-LOGIC = 0
-RULES = 0
-NUM_OF_RULES = 0
-
-S_PROBLEM_ONSET       = 0
-S_PROBLEM_RT          = 0
-S_CHOICE_ONSET      = 0
-S_CHOICE_RT         = 0
-S_CHOICE_ACC   = 0
-S_LOGIC = 0
-S_RULES = 0
-S_NUM_OF_RULES = 0
-
-LC_BLOCK = 0
-LC_PROBLEM_ONSET       = 0
-LC_PROBLEM_RT          = 0
-LC_CHOICE_ONSET      = 0
-LC_CHOICE_RT         = 0
-LC_CHOICE_ACC   = 0
-LC_LOGIC = 0
-LC_RULES = 0
-LC_NUM_OF_RULES = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py).  The
+## '[Trial]' columns are used if they exist, and the plain ones
+## otherwise.  The '[Block]' columns of the special problem (#17)
+## are optional, but all of them are needed to use it.
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'BLOCK'           : "BlockNum",
+    'PROBLEM_ONSET'   : ("Problem.OnsetTime[Trial]", "Problem.OnsetTime"),
+    'PROBLEM_RT'      : ("Problem.RT[Trial]", "Problem.RT"),
+    'CHOICE_ONSET'    : ("Choice.OnsetTime[Trial]", "Choice.OnsetTime"),
+    'CHOICE_RT'       : ("Choice.RT[Trial]", "Choice.RT"),
+    'CHOICE_ACC'      : ("Choice.ACC[Trial]", "Choice.ACC"),
+    'LOGIC'           : ("Logic[Trial]", "Logic"),
+    'RULES'           : ("Rules[Trial]", "Rules"),
+    'NUM_OF_RULES'    : ("NumRules[Trial]", "NumRules"),
+    'S_PROBLEM_ONSET' : "Problem.OnsetTime[Block]",
+    'S_PROBLEM_RT'    : "Problem.RT[Block]",
+    'S_CHOICE_ONSET'  : "Choice.OnsetTime[Block]",
+    'S_CHOICE_RT'     : "Choice.RT[Block]",
+    'S_CHOICE_ACC'    : "Choice.ACC[Block]",
+    'S_LOGIC'         : "Logic[Block]",
+    'S_RULES'         : "Rules[Block]",
+    'S_NUM_OF_RULES'  : "NumRules[Block]",
+    }
+
+SPECIAL = [x for x in COLUMNS.keys() if x.startswith("S_")]
 
 
 class Trial:
@@ -64,8 +64,9 @@ class Trial:
     LOGIC = {"Logic" : 2, "Non-Logic" : 1,};
     RULES = {"Low" : 0, "High" : 2}
 
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         self.trial = -1
         self.before = 0.0
@@ -80,7 +81,7 @@ class Trial:
                 self.CreateSpecial(tokens)
                 self.Initialize()
             except ValueError as v:
-                sys.stderr.write("ValueError: %s; Trying Last Chance\n" % (v))
+                sys.stderr.write("ValueError: %s; Skipping trial\n" % (v))
                 self.ok = False
 
         except IndexError:
@@ -110,45 +111,32 @@ class Trial:
 
     def Create(self, tokens):
         """Performs the necessary initialization"""
-        self.block        = int(tokens[BLOCK])
-        self.problemOnset = int(tokens[PROBLEM_ONSET])
-        self.problemRt    = int(tokens[PROBLEM_RT])
-        self.choiceOnset  = int(tokens[CHOICE_ONSET])
-        self.choiceRt     = int(tokens[CHOICE_RT])
-        self.choiceAcc    = int(tokens[CHOICE_ACC])
+        self.block        = int(tokens[self.schema.BLOCK])
+        self.problemOnset = int(tokens[self.schema.PROBLEM_ONSET])
+        self.problemRt    = int(tokens[self.schema.PROBLEM_RT])
+        self.choiceOnset  = int(tokens[self.schema.CHOICE_ONSET])
+        self.choiceRt     = int(tokens[self.schema.CHOICE_RT])
+        self.choiceAcc    = int(tokens[self.schema.CHOICE_ACC])
 
-        self.logic        = tokens[LOGIC]
-        self.rules        = tokens[RULES]
-        self.numrules     = int(tokens[NUM_OF_RULES])
+        self.logic        = tokens[self.schema.LOGIC]
+        self.rules        = tokens[self.schema.RULES]
+        self.numrules     = int(tokens[self.schema.NUM_OF_RULES])
 
     def CreateSpecial(self, tokens):
         """Performs the necessary initialization for the Special Problem"""
+        if len([x for x in SPECIAL if not x in self.schema]) > 0:
+            raise ValueError, "No Special Problem columns"
         self.block        = -1 # By default, the second block
-        self.problemOnset = int(tokens[S_PROBLEM_ONSET])
-        self.problemRt    = int(tokens[S_PROBLEM_RT])
-        self.choiceOnset  = int(tokens[S_CHOICE_ONSET])
-        self.choiceRt     = int(tokens[S_CHOICE_RT])
-        self.choiceAcc    = int(tokens[S_CHOICE_ACC])
-
-        self.logic        = tokens[S_LOGIC]
-        self.rules        = tokens[S_RULES]
-        self.numrules     = int(tokens[S_NUM_OF_RULES])
-
-
-    def CreateLastChance(self, tokens):
-        """
-Performs initialization when the data table is corrupted.
-""" 
-        self.block        = int(tokens[LC_BLOCK])
-        self.problemOnset = int(tokens[LC_PROBLEM_ONSET])
-        self.problemRt    = int(tokens[LC_PROBLEM_RT])
-        self.choiceOnset  = int(tokens[LC_CHOICE_ONSET])
-        self.choiceRt     = int(tokens[LC_CHOICE_RT])
-        self.choiceAcc    = int(tokens[LC_CHOICE_ACC])
-
-        self.logic        = tokens[LC_LOGIC]
-        self.rules        = tokens[LC_RULES]
-        self.numrules     = int(tokens[LC_NUM_OF_RULES])
+        self.problemOnset = int(tokens[self.schema.S_PROBLEM_ONSET])
+        self.problemRt    = int(tokens[self.schema.S_PROBLEM_RT])
+        self.choiceOnset  = int(tokens[self.schema.S_CHOICE_ONSET])
+        self.choiceRt     = int(tokens[self.schema.S_CHOICE_RT])
+        self.choiceAcc    = int(tokens[self.schema.S_CHOICE_ACC])
+
+        self.logic        = tokens[self.schema.S_LOGIC]
+        self.rules        = tokens[self.schema.S_RULES]
+        self.numrules     = int(tokens[self.schema.S_NUM_OF_RULES])
+
 
     def Difficulty(self):
         """Calculates the problem difficulty as a number between 1 and 4"""
@@ -167,36 +155,6 @@ Performs initialization when the data table is corrupted.
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global BLOCK           
-    global TRIAL           
-    global PROBLEM_ONSET
-    global PROBLEM_RT   
-    global CHOICE_ONSET 
-    global CHOICE_RT    
-    global CHOICE_ACC   
-    global LOGIC
-    global RULES
-    global NUM_OF_RULES
-
-    global S_PROBLEM_ONSET
-    global S_PROBLEM_RT   
-    global S_CHOICE_ONSET 
-    global S_CHOICE_RT    
-    global S_CHOICE_ACC   
-    global S_LOGIC
-    global S_RULES
-    global S_NUM_OF_RULES
-
-    global LC_BLOCK
-    global LC_PROBLEM_ONSET
-    global LC_PROBLEM_RT   
-    global LC_CHOICE_ONSET 
-    global LC_CHOICE_RT    
-    global LC_CHOICE_ACC   
-    global LC_LOGIC
-    global LC_RULES
-    global LC_NUM_OF_RULES
-
     fin      = open(filename, 'rU')
     subject  = filename.split('-')[1]
     lines    = fin.readlines()
@@ -205,88 +163,11 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    # --- Block info
-    try:
-        BLOCK          = colNames.index("BlockNum")
-        #TRIAL          = colNames.index("Trial")
-    except ValueError as e:
-        sys.stderr.write("Cannot find 'Block' info. Aborting\n")
-        sys.exit(0)
-        
-    # --- Problem onset
-    try:
-        PROBLEM_ONSET  = colNames.index("Problem.OnsetTime[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Problem.OnsetTime' info at 'Trial' level\n")
-        PROBLEM_ONSET  = colNames.index("Problem.OnsetTime")
-        
-    # --- Problem RT
-    try:
-        PROBLEM_RT     = colNames.index("Problem.RT[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Problem.RT' info at 'Trial' level\n")
-        PROBLEM_RT     = colNames.index("Problem.RT")
-
-    # --- Choice Onset
-    try:
-        CHOICE_ONSET   = colNames.index("Choice.OnsetTime[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Choice.Onset' info at 'Trial' level\n")
-        CHOICE_ONSET   = colNames.index("Choice.OnsetTime")
-
-    # --- Choice RT
-
-    try:
-        CHOICE_RT      = colNames.index("Choice.RT[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Choice.RT' info at 'Trial' level\n")
-        CHOICE_RT      = colNames.index("Choice.RT")
-
-    # --- Choice Accuracy
-
-    try:
-        CHOICE_ACC     = colNames.index("Choice.ACC[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Choice.ACC' info at 'Trial' level\n")
-        CHOICE_ACC     = colNames.index("Choice.ACC")        
-    
-    # --- Logic
-        
-    try:
-        LOGIC          = colNames.index("Logic[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Logic' info at 'Trial' level\n")
-        LOGIC          = colNames.index("Logic")
-
-    # --- Rules
-    try:
-        RULES          = colNames.index("Rules[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'Rules' info at 'Trial' level\n")
-        RULES          = colNames.index("Rules")
-    
-    # --- NumRules
-    try:
-        NUM_OF_RULES   = colNames.index("NumRules[Trial]")
-    except ValueError as e:
-        sys.stderr.write("Could not find 'NumRules' info at 'Trial' level\n")
-        NUM_OF_RULES   = colNames.index("NumRules")
-
-    try:
-        # Special marks for the "special" problem(#17)
-        S_PROBLEM_ONSET  = colNames.index("Problem.OnsetTime[Block]")
-        S_PROBLEM_RT     = colNames.index("Problem.RT[Block]")
-        S_CHOICE_ONSET   = colNames.index("Choice.OnsetTime[Block]")
-        S_CHOICE_RT      = colNames.index("Choice.RT[Block]")
-        S_CHOICE_ACC     = colNames.index("Choice.ACC[Block]")
-        S_LOGIC          = colNames.index("Logic[Block]")
-        S_RULES          = colNames.index("Rules[Block]")
-        S_NUM_OF_RULES   = colNames.index("NumRules[Block]")
-
-    except ValueError as e:
+    schema   = TableSchema(colNames, COLUMNS, SPECIAL)
+    if len([x for x in SPECIAL if not x in schema]) > 0:
         sys.stderr.write("Cannot find Special Problem, skipping...\n")
 
-    trials = [Trial(r) for r in rows]
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     FIRST_TRIALS = []
@@ -303,20 +184,15 @@ def Parse(filename):
             FIRST_TRIALS.append(t)
         previous = t 
 
-    print len(trials)
-        
     for f in FIRST_TRIALS:
         subset = [t for t in trials if t.block == f.block]
         for s in subset:
-            print f, s.problemOnset, f.problemOnset
             s.blockBegin = f.problemOnset - (OFFSET * TR)
 
     BLOCKS = set(t.block for t in trials)
     BLOCKS = list(BLOCKS)
     BLOCKS.sort()
     
-    print(FIRST_TRIALS)
-    print FIRST_TRIALS[1].problemOnset
     fout = open("s%s_sessions_dcm.m" % subject, 'w')
 
     I = 0 # Total of i counters
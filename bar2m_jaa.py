@@ -11,6 +11,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of contrasts vectors (calculated per session)
@@ -24,26 +25,31 @@ from math import sqrt
 TR     = 2000.0
 OFFSET = 2
 
-DELAY1               = 0
-DELAY2               = 0
-BLOCK                = 0
-TRIAL                = 0
-PROBLEM_ONSET       = 0
-PROBLEM_RT          = 0
-CHOICE_ONSET      = 0
-CHOICE_RT         = 0
-CHOICE_ACC   = 0
-LOGIC = 0
-RULES = 0
-NUM_OF_RULES = 0
-S_PROBLEM_ONSET       = 0
-S_PROBLEM_RT          = 0
-S_CHOICE_ONSET      = 0
-S_CHOICE_RT         = 0
-S_CHOICE_ACC   = 0
-S_LOGIC = 0
-S_RULES = 0
-S_NUM_OF_RULES = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'DELAY1'          : "Delay1[Trial]",
+    'DELAY2'          : "Delay2[Trial]",
+    'BLOCK'           : "BlockNum",
+    'PROBLEM_ONSET'   : "Problem.OnsetTime[Trial]",
+    'PROBLEM_RT'      : "Problem.RT[Trial]",
+    'CHOICE_ONSET'    : "Choice.OnsetTime[Trial]",
+    'CHOICE_RT'       : "Choice.RT[Trial]",
+    'CHOICE_ACC'      : "Choice.ACC[Trial]",
+    'LOGIC'           : "Logic[Trial]",
+    'RULES'           : "Rules[Trial]",
+    'NUM_OF_RULES'    : "NumRules[Trial]",
+    'S_PROBLEM_ONSET' : "Problem.OnsetTime[Block]",
+    'S_PROBLEM_RT'    : "Problem.RT[Block]",
+    'S_CHOICE_ONSET'  : "Choice.OnsetTime[Block]",
+    'S_CHOICE_RT'     : "Choice.RT[Block]",
+    'S_CHOICE_ACC'    : "Choice.ACC[Block]",
+    'S_LOGIC'         : "Logic[Block]",
+    'S_RULES'         : "Rules[Block]",
+    'S_NUM_OF_RULES'  : "NumRules[Block]",
+    }
 
 class Trial:
     """
@@ -51,8 +57,9 @@ class Trial:
     (Encoding, Execution, Response), with associated Onsets and
     Durations (ie. RTs), followed by randomly-varying Delays.
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         try:
             self.Create(tokens)
@@ -95,31 +102,31 @@ class Trial:
     def Create(self, tokens):
         """Performs the necessary initialization"""
         
-        self.delay1       = int(tokens[DELAY1])
-        self.delay2       = int(tokens[DELAY2])
-        self.block        = int(tokens[BLOCK])
-        self.problemOnset = int(tokens[PROBLEM_ONSET])
-        self.problemRt    = int(tokens[PROBLEM_RT])
-        self.choiceOnset  = int(tokens[CHOICE_ONSET])
-        self.choiceRt     = int(tokens[CHOICE_RT])
-        self.choiceAcc    = int(tokens[CHOICE_ACC])
-
-        self.logic        = tokens[LOGIC]
-        self.rules        = tokens[RULES]
-        self.numrules     = int(tokens[NUM_OF_RULES])
+        self.delay1       = int(tokens[self.schema.DELAY1])
+        self.delay2       = int(tokens[self.schema.DELAY2])
+        self.block        = int(tokens[self.schema.BLOCK])
+        self.problemOnset = int(tokens[self.schema.PROBLEM_ONSET])
+        self.problemRt    = int(tokens[self.schema.PROBLEM_RT])
+        self.choiceOnset  = int(tokens[self.schema.CHOICE_ONSET])
+        self.choiceRt     = int(tokens[self.schema.CHOICE_RT])
+        self.choiceAcc    = int(tokens[self.schema.CHOICE_ACC])
+
+        self.logic        = tokens[self.schema.LOGIC]
+        self.rules        = tokens[self.schema.RULES]
+        self.numrules     = int(tokens[self.schema.NUM_OF_RULES])
 
     def CreateSpecial(self, tokens):
         """Performs the necessary initialization"""
         self.block        = 2 # By default, the second block
-        self.problemOnset = int(tokens[S_PROBLEM_ONSET])
-        self.problemRt    = int(tokens[S_PROBLEM_RT])
-        self.choiceOnset  = int(tokens[S_CHOICE_ONSET])
-        self.choiceRt     = int(tokens[S_CHOICE_RT])
-        self.choiceAcc    = int(tokens[S_CHOICE_ACC])
-
-        self.logic        = tokens[S_LOGIC]
-        self.rules        = tokens[S_RULES]
-        self.numrules     = int(tokens[S_NUM_OF_RULES])
+        self.problemOnset = int(tokens[self.schema.S_PROBLEM_ONSET])
+        self.problemRt    = int(tokens[self.schema.S_PROBLEM_RT])
+        self.choiceOnset  = int(tokens[self.schema.S_CHOICE_ONSET])
+        self.choiceRt     = int(tokens[self.schema.S_CHOICE_RT])
+        self.choiceAcc    = int(tokens[self.schema.S_CHOICE_ACC])
+
+        self.logic        = tokens[self.schema.S_LOGIC]
+        self.rules        = tokens[self.schema.S_RULES]
+        self.numrules     = int(tokens[self.schema.S_NUM_OF_RULES])
         
     def RelativeTime(self, val):
         "Time since the beginning of the block"
@@ -134,29 +141,6 @@ class Trial:
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global DELAY1
-    global DELAY2
-    global BLOCK           
-    global TRIAL           
-    global PROBLEM_ONSET
-    global PROBLEM_RT   
-    global CHOICE_ONSET 
-    global CHOICE_RT    
-    global CHOICE_ACC   
-    global LOGIC
-    global RULES
-    global NUM_OF_RULES
-
-    global S_PROBLEM_ONSET
-    global S_PROBLEM_RT   
-    global S_CHOICE_ONSET 
-    global S_CHOICE_RT    
-    global S_CHOICE_ACC   
-    global S_LOGIC
-    global S_RULES
-    global S_NUM_OF_RULES
-
-
     fin      = open(filename, 'rU')
     subject  = filename.split('_')[1]
     lines    = fin.readlines()
@@ -165,30 +149,12 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    DELAY1         = colNames.index("Delay1[Trial]")
-    DELAY2         = colNames.index("Delay2[Trial]")
-    BLOCK          = colNames.index("BlockNum")
-    PROBLEM_ONSET  = colNames.index("Problem.OnsetTime[Trial]")
-    PROBLEM_RT     = colNames.index("Problem.RT[Trial]")
-    CHOICE_ONSET   = colNames.index("Choice.OnsetTime[Trial]")
-    CHOICE_RT      = colNames.index("Choice.RT[Trial]")
-    CHOICE_ACC     = colNames.index("Choice.ACC[Trial]")
-    LOGIC          = colNames.index("Logic[Trial]")
-    RULES          = colNames.index("Rules[Trial]")
-    NUM_OF_RULES   = colNames.index("NumRules[Trial]")
+    schema   = TableSchema(colNames, COLUMNS)
 
     # Special marks for the "special" problem(#17)
 
-    S_PROBLEM_ONSET  = colNames.index("Problem.OnsetTime[Block]")
-    S_PROBLEM_RT     = colNames.index("Problem.RT[Block]")
-    S_CHOICE_ONSET   = colNames.index("Choice.OnsetTime[Block]")
-    S_CHOICE_RT      = colNames.index("Choice.RT[Block]")
-    S_CHOICE_ACC     = colNames.index("Choice.ACC[Block]")
-    S_LOGIC          = colNames.index("Logic[Block]")
-    S_RULES          = colNames.index("Rules[Block]")
-    S_NUM_OF_RULES   = colNames.index("NumRules[Block]")
 
-    trials = [Trial(r) for r in rows]
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     FIRST_TRIALS = []
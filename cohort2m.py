@@ -0,0 +1,272 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## COHORT2M
+## ---------------------------------------------------------------- ##
+## Generates the onsets of a whole cohort with spec2m.py.  Instead
+## of running a *2m.py script once per table (and guessing the
+## subject from the file name), it reads a manifest of subjects and
+## tables, processes the tables in parallel (one worker process per
+## table), and writes the outputs of each subject in a separate
+## directory.  At the end, it writes a summary with the number of
+## trials, errors and outliers of each subject and block.
+##
+## Builds are incremental: a build manifest records, for every
+## subject, the hash of its table, the hash of the spec (and of the
+## options), the files written, and the block counts.  The next run
+## only regenerates the subjects whose table or spec changed, or
+## whose outputs are missing.
+## ---------------------------------------------------------------- ##
+
+import sys, os, time, hashlib
+import multiprocessing
+
+import eparse
+import spec2m
+
+SUMMARY_COLUMNS = ("Subject", "Block", "Trials", "Errors", "Outliers")
+BUILD_COLUMNS   = ("Subject", "File", "FileHash", "SpecHash", "Outputs", "Counts")
+BUILD_MANIFEST  = "build.tsv"
+
+
+def ReadManifest(filename, subjectColumn="Subject", fileColumn="File"):
+    """
+    Reads a tab-separated manifest with (at least) a subject and a
+    file column, and returns a list of (subject, file) pairs.  Files
+    are relative to the manifest's directory.
+    """
+    fin      = open(filename, 'rU')
+    colNames = [x.strip() for x in fin.readline().split('\t')]
+    for column in (subjectColumn, fileColumn):
+        if not column in colNames:
+            raise Exception, "Manifest %s has no '%s' column" % (filename, column)
+    S        = colNames.index(subjectColumn)
+    F        = colNames.index(fileColumn)
+    base     = os.path.dirname(filename)
+    entries  = []
+    subjects = set()
+    for line in fin:
+        tokens = [x.strip() for x in line.split('\t')]
+        if len(tokens) <= max(S, F) or tokens[F] == "":
+            continue
+        if tokens[S] in subjects:
+            raise Exception, "Subject %s appears twice in %s" % (tokens[S], filename)
+        subjects.add(tokens[S])
+        entries.append((tokens[S], os.path.join(base, tokens[F])))
+    fin.close()
+    return entries
+
+
+## ---------------------------------------------------------------- ##
+## BUILD MANIFEST
+## ---------------------------------------------------------------- ##
+
+def FileHash(filename, *options):
+    """SHA-1 of a file's contents (and of a list of options)"""
+    h = hashlib.sha1()
+    h.update("|".join([str(x) for x in options]) + "|")
+    fin = open(filename, 'rb')
+    try:
+        chunk = fin.read(eparse.CHUNK_SIZE)
+        while chunk:
+            h.update(chunk)
+            chunk = fin.read(eparse.CHUNK_SIZE)
+    finally:
+        fin.close()
+    return h.hexdigest()
+
+
+def FormatCounts(counts):
+    """Block counts as 'block:trials:errors:outliers' items"""
+    return " ".join([":".join(["%d" % y for y in x]) for x in counts])
+
+
+def ParseCounts(text):
+    return [tuple([int(y) for y in x.split(":")]) for x in text.split()]
+
+
+def ReadBuildManifest(filename):
+    """
+    Reads a build manifest into a dictionary of subject -> (file,
+    file hash, spec hash, outputs, counts).  Missing manifests are
+    empty.
+    """
+    entries = {}
+    if not os.path.exists(filename):
+        return entries
+    fin = open(filename, 'rU')
+    fin.readline()
+    for line in fin:
+        tokens = line.rstrip("\r\n").split('\t')
+        if len(tokens) != len(BUILD_COLUMNS):
+            continue
+        subject, infile, fileHash, specHash, outputs, counts = tokens
+        entries[subject] = (infile, fileHash, specHash,
+                            [x for x in outputs.split(",") if x != ""],
+                            ParseCounts(counts))
+    fin.close()
+    return entries
+
+
+def WriteBuildManifest(filename, entries, order):
+    """Writes the entries of the subjects in 'order' (atomically)"""
+    tmp  = "%s.%d.tmp" % (filename, os.getpid())
+    fout = open(tmp, 'w')
+    fout.write("\t".join(BUILD_COLUMNS) + "\n")
+    for subject in order:
+        if subject in entries:
+            infile, fileHash, specHash, outputs, counts = entries[subject]
+            fout.write("\t".join([subject, infile, fileHash, specHash,
+                                   ",".join(outputs), FormatCounts(counts)]) + "\n")
+    fout.close()
+    os.rename(tmp, filename)
+
+
+def UpToDate(entry, infile, fileHash, specHash):
+    """True if a subject's last build used the same table and spec"""
+    if entry is None:
+        return False
+    oldFile, oldFileHash, oldSpecHash, outputs, counts = entry
+    return (oldFile == infile and oldFileHash == fileHash and
+            oldSpecHash == specHash and
+            len([x for x in outputs if not os.path.exists(x)]) == 0)
+
+
+## ---------------------------------------------------------------- ##
+## COHORT
+## ---------------------------------------------------------------- ##
+
+def CohortJob(job):
+    """
+    Generates the onsets of a single subject.  Returns the subject, the
+    block counts, the files written, the time it took, and the error
+    message (if any).
+    """
+    specFile, subject, filename, outdir, mat, mcode, events = job
+    start = time.time()
+    try:
+        spec = spec2m.LoadSpec(specFile)
+        sessions, counts, outputs = spec2m.Parse(spec, filename, outdir, mat, mcode,
+                                                 subject=subject, verbose=False,
+                                                 events=events)
+        return (subject, counts, outputs, time.time() - start, None)
+    except Exception, e:
+        return (subject, [], [], time.time() - start,
+                "%s: %s" % (e.__class__.__name__, e))
+
+
+def WriteSummary(filename, results):
+    """Writes the (subject, counts) results as a table"""
+    fout = open(filename, 'w')
+    fout.write("\t".join(SUMMARY_COLUMNS) + "\n")
+    for subject, counts in results:
+        for block, trials, errors, outliers in counts:
+            fout.write("%s\t%d\t%d\t%d\t%d\n" % (subject, block, trials, errors, outliers))
+    fout.close()
+
+
+def ParseCohort(specFile, manifest, outdir=".", mat=True, mcode=False,
+                processes=None, summary="summary.tsv", force=False, events=False):
+    """
+    Generates the onsets of every subject in a manifest, using a pool
+    of processes.  The outputs of each subject go to a directory
+    under 'outdir' (outdir/<subject>; 'outdir' can also contain
+    %(subject)s, e.g. 'subjects/%(subject)s/behav').  Subjects whose
+    table and spec did not change since the last build are skipped,
+    unless 'force' is True.  BIDS events files are also written if
+    'events' is True (see spec2m.Parse).  Writes the summary table and the build
+    manifest in 'outdir', and returns the subjects that failed.
+    """
+    if not "%(subject)s" in outdir:
+        outdir = os.path.join(outdir, "%(subject)s")
+    baseDir = outdir.split("%(subject)s")[0] or "."
+    if not os.path.isdir(baseDir):
+        os.makedirs(baseDir)
+
+    buildFile = os.path.join(baseDir, BUILD_MANIFEST)
+    built     = ReadBuildManifest(buildFile)
+    specHash  = FileHash(specFile, spec2m.ENGINE_VERSION, outdir, mat, mcode, events)
+    entries   = ReadManifest(manifest)
+    jobs      = []
+    hashes    = {}
+    for subject, filename in entries:
+        try:
+            hashes[subject] = FileHash(filename)
+        except IOError:
+            hashes[subject] = ""    # The job will report the error
+        if force or not UpToDate(built.get(subject), filename, hashes[subject], specHash):
+            jobs.append((specFile, subject, filename, outdir, mat, mcode, events))
+
+    print "%d subjects, %d up to date" % (len(entries), len(entries) - len(jobs))
+    start    = time.time()
+    failures = []
+    if len(jobs) > 0:
+        pool = multiprocessing.Pool(processes)
+        for subject, counts, outputs, elapsed, error in pool.imap_unordered(CohortJob, jobs):
+            if error is None:
+                print "%-20s %4d blocks %8.2fs" % (subject, len(counts), elapsed)
+                filename = dict(entries)[subject]
+                built[subject] = (filename, hashes[subject], specHash, outputs, counts)
+            else:
+                print "%-20s %8.2fs  FAILED (%s)" % (subject, elapsed, error)
+                failures.append(subject)
+                if subject in built:
+                    del built[subject]
+        pool.close()
+        pool.join()
+
+    # The summary and the build manifest follow the order of the manifest
+    order = [x[0] for x in entries]
+    WriteBuildManifest(buildFile, built, order)
+    WriteSummary(os.path.join(baseDir, summary),
+                 [(x, built[x][4]) for x in order if x in built])
+    print "Processed %d subjects (%d failed) in %.2fs" % (len(jobs) - len(failures),
+                                                        len(failures),
+                                                        time.time() - start)
+    return failures
+
+
+HLP_MSG = """
+Usage:
+
+   cohort2m.py [--outdir=<dir>] [--processes=<n>] [--mcode] [--no-mat]
+               [--events] [--summary=<file>] [--force] <spec file> <manifest>
+
+Where:
+
+   * <spec file> describes a study (see spec2m.py and specs/)
+   * <manifest> is a tab-separated table with a 'Subject' and a
+     'File' column (the eparse.py table of each subject, relative
+     to the manifest)
+   * --outdir is where the subject directories are created (default:
+     the current directory).  It can contain %(subject)s, e.g.
+     --outdir=subjects/%(subject)s/behav
+   * --processes is the number of worker processes (default: one per
+     CPU)
+   * --mcode also writes the M-code, --no-mat only writes the M-code
+   * --events also writes BIDS events.tsv files (one per session)
+   * --summary is the name of the summary table (default summary.tsv)
+     with the trials, errors and outliers of each subject and block
+   * --force regenerates all the subjects, even those that did not
+     change since the last run (see build.tsv in the output
+     directory)
+"""
+
+if __name__ == "__main__":
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    args    = [x for x in sys.argv[1:] if not x.startswith("--")]
+    if len(args) != 2:
+        print HLP_MSG
+    else:
+        processes = eparse.Option(options, "processes")
+        if processes is not None:
+            processes = int(processes)
+        failures = ParseCohort(args[0], args[1],
+                               outdir=eparse.Option(options, "outdir", "."),
+                               mat=not "--no-mat" in options,
+                               mcode="--mcode" in options or "--no-mat" in options,
+                               processes=processes,
+                               summary=eparse.Option(options, "summary", "summary.tsv"),
+                               force="--force" in options,
+                               events="--events" in options)
+        if len(failures) > 0:
+            sys.exit(1)
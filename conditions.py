@@ -0,0 +1,329 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## CONDITIONS
+## ---------------------------------------------------------------- ##
+## Writers for SPM's "multiple conditions" files.  Each session (a
+## block of trials) is described by three cell arrays: names (one
+## string per regressor), onsets and durations (one vector, in
+## seconds, per regressor).
+##
+## The *2m.py scripts write them as M-code that has to be run in
+## Matlab to create the session%d.mat files.  WriteMat creates the
+## .mat files directly (through scipy.io), so that Matlab is only
+## needed for the SPM analysis itself.  WriteMCode still produces
+## the M-code, for the scripts that want it.
+##
+## The same onsets and durations usually go to several files (the
+## M-code, the .mat files, the conds.txt and obs.txt files of the
+## inst2m scripts, and BIDS events.tsv files).  A Regressor rounds
+## and formats its vectors once, as whole arrays, and every "sink"
+## reuses them.  Sinks keep what they have to write in memory and
+## write each file at once:
+##
+##   sinks = [MCodeSink("sessions.m"), ObsSink("obs.txt", labels)]
+##   for block, regressors in ...:
+##       WriteSession(sinks, block, [Regressor(n, o, d, 1) for ...])
+##   CloseSinks(sinks)
+## ---------------------------------------------------------------- ##
+
+import os
+import numpy as np
+import scipy.io as io
+
+
+## ---------------------------------------------------------------- ##
+## Sessions are lists of (block, regressors, weights) tuples, and
+## regressors are (name, onsets, durations) triples (see spec2m.py)
+## ---------------------------------------------------------------- ##
+
+def RoundVector(values, precision):
+    """
+    Rounds a vector to 'precision' decimals and formats it.  Halves
+    are rounded away from zero, like round() does, and unlike "%f"
+    and np.round().  Returns the rounded values and their text.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    if precision is None:
+        return values, np.char.mod("%r", values)
+    text  = np.char.mod("%%.%df" % precision, values)
+
+    # Exact halves are the values for which x * 2^(p+1) is an odd
+    # integer (scaling by a power of 2 is exact).
+    twice  = values * 2.0 ** (precision + 1)
+    halves = (twice == np.floor(twice)) & (np.fmod(twice, 2) != 0)
+    if halves.any():
+        scale = 10.0 ** precision
+        away  = np.sign(values[halves]) * (np.floor(np.abs(values[halves]) * scale) + 1) / scale
+        text[halves] = np.char.mod("%%.%df" % precision, away)
+    return text.astype(float), text
+
+
+class Regressor:
+    """The name, onsets and durations of a condition, formatted once"""
+    def __init__(self, name, onsets, durations, precision=None, columns=()):
+        """
+        'columns' is an optional list of (name, values) pairs, with one
+        value per event (such as RTs), for the BIDS events files.
+        """
+        self.name    = name
+        self.onsets, self.onsetText = RoundVector(onsets, precision)
+        self.durations, self.durationText = RoundVector(durations, precision)
+        self.columns = list(columns)
+
+    def __len__(self):
+        return len(self.onsets)
+
+    def OnsetString(self):
+        return " ".join(self.onsetText)
+
+    def DurationString(self):
+        return " ".join(self.durationText)
+
+
+def Regressors(regressors, precision=None):
+    """Turns (name, onsets, durations) triples into Regressors"""
+    return [Regressor(name, ons, durs, precision) for name, ons, durs in regressors]
+
+
+def CellArrays(regressors):
+    """
+    Returns the names, onsets, and durations of a list of Regressors
+    as 1xN object arrays (which scipy.io saves as cell arrays).
+    """
+    n         = len(regressors)
+    names     = np.empty((1, n), dtype=object)
+    onsets    = np.empty((1, n), dtype=object)
+    durations = np.empty((1, n), dtype=object)
+    for i, regressor in enumerate(regressors):
+        names[0, i]     = regressor.name
+        onsets[0, i]    = regressor.onsets.reshape(1, -1)
+        durations[0, i] = regressor.durations.reshape(1, -1)
+    return names, onsets, durations
+
+
+def SaveMat(filename, regressors):
+    """Saves a list of Regressors as a .mat file"""
+    names, onsets, durations = CellArrays(regressors)
+    io.savemat(filename, {'names' : names, 'onsets' : onsets,
+                          'durations' : durations}, oned_as='row')
+
+
+def ReadMat(filename):
+    """Reads a session .mat file as a list of (name, onsets, durations)"""
+    contents  = io.loadmat(filename)
+    names     = contents['names'].ravel()
+    onsets    = contents['onsets'].ravel()
+    durations = contents['durations'].ravel()
+    return [(str(np.ravel(n)[0]) if np.size(n) > 0 else "",
+             np.asarray(o, dtype=float).ravel(), np.asarray(d, dtype=float).ravel())
+            for n, o, d in zip(names, onsets, durations)]
+
+
+## ---------------------------------------------------------------- ##
+## SINKS
+## ---------------------------------------------------------------- ##
+## A sink receives the Regressors of each session (Session) and
+## writes its files when it is closed (Close), or as soon as it has
+## a whole file.  Close returns the names of the files written.
+## ---------------------------------------------------------------- ##
+
+class MatSink:
+    """One .mat file per session"""
+    def __init__(self, directory=".", template="session%d.mat"):
+        self.directory = directory
+        self.template  = template
+        self.filenames = []
+
+    def Session(self, block, regressors):
+        filename = os.path.join(self.directory, self.template % block)
+        SaveMat(filename, regressors)
+        self.filenames.append(filename)
+
+    def Close(self):
+        return self.filenames
+
+
+class MCodeSink:
+    """A single M-file that saves one .mat file per session"""
+    def __init__(self, filename, template="session%d.mat"):
+        self.filename = filename
+        self.template = template
+        self.lines    = []
+
+    def Session(self, block, regressors):
+        n = len(regressors)
+        self.lines.append("names=cell(1,%d);" % n)
+        self.lines.append("onsets=cell(1,%d);" % n)
+        self.lines.append("durations=cell(1,%d);" % n)
+        for i, regressor in enumerate(regressors):
+            self.lines.append("names{%d}='%s';" % (i + 1, regressor.name))
+            self.lines.append("onsets{%d}=[%s];" % (i + 1, regressor.OnsetString()))
+            self.lines.append("durations{%d}=[%s];" % (i + 1, regressor.DurationString()))
+        self.lines.append("save('%s', 'names', 'onsets', 'durations');" % (self.template % block))
+
+    def Close(self):
+        fout = open(self.filename, 'w')
+        fout.write("\n".join(self.lines + [""]))
+        fout.close()
+        return [self.filename]
+
+
+class CondsSink:
+    """
+    One text file per session with the onsets and durations.  Each
+    regressor is written with its own format, from a dictionary of
+    name -> format (with %(onsets)s and %(durations)s, where every
+    value is followed by a space); regressors without a format are
+    left out.
+    """
+    def __init__(self, template, formats):
+        self.template  = template
+        self.formats   = formats
+        self.filenames = []
+
+    def Session(self, block, regressors):
+        text = []
+        for regressor in regressors:
+            if regressor.name in self.formats:
+                values = {'onsets'    : "".join([x + " " for x in regressor.onsetText]),
+                          'durations' : "".join([x + " " for x in regressor.durationText])}
+                text.append(self.formats[regressor.name] % values)
+        filename = self.template % block
+        fout     = open(filename, 'w')
+        fout.write("".join(text))
+        fout.close()
+        self.filenames.append(filename)
+
+    def Close(self):
+        return self.filenames
+
+
+class ObsSink:
+    """
+    A text file with the number of events of every regressor that
+    has a label in 'labels' (a dictionary of name -> label)
+    """
+    def __init__(self, filename, labels):
+        self.filename = filename
+        self.labels   = labels
+        self.lines    = []
+
+    def Session(self, block, regressors):
+        for regressor in regressors:
+            if regressor.name in self.labels:
+                self.lines.append("SESSION %d / %s \t %d" % (block, self.labels[regressor.name],
+                                                            len(regressor)))
+
+    def Close(self):
+        fout = open(self.filename, 'w')
+        fout.write("\n".join(self.lines + [""]))
+        fout.close()
+        return [self.filename]
+
+
+def EventColumn(values):
+    """Formats a column of a BIDS events file (missing values are n/a)"""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), "n/a", np.char.mod("%g", values))
+    elif values.dtype.kind in "iub":
+        return np.char.mod("%d", values)
+    values = values.astype(str)
+    return np.where(values == "", "n/a", values)
+
+
+def Concatenate(arrays):
+    """Concatenates a (possibly empty) list of text arrays"""
+    return np.concatenate(list(arrays) + [np.zeros(0, dtype=str)])
+
+
+class EventsSink:
+    """
+    One BIDS events.tsv file per session (a 'run' in BIDS): the onset,
+    duration and trial_type of each event, plus the columns of the
+    Regressors, sorted by onset.
+    """
+    def __init__(self, template, names=None):
+        """
+        'template' is the file name of each run, where %(run)d and the
+        keys of 'names' are replaced.
+        """
+        self.template  = template
+        self.names     = dict(names or {})
+        self.filenames = []
+
+    def Session(self, block, regressors):
+        regressors = [x for x in regressors if len(x) > 0]
+        header     = ["onset", "duration", "trial_type"]
+        for regressor in regressors:
+            header += [c for c, v in regressor.columns if not c in header]
+
+        # Every column is formatted as a whole, and the rows are then
+        # put together one column at a time
+        columns = [Concatenate([x.onsetText for x in regressors]),
+                   Concatenate([x.durationText for x in regressors]),
+                   Concatenate([np.repeat(x.name, len(x)) for x in regressors])]
+        for column in header[3:]:
+            values = []
+            for regressor in regressors:
+                found = dict(regressor.columns)
+                if column in found:
+                    values.append(EventColumn(found[column]))
+                else:
+                    values.append(np.repeat("n/a", len(regressor)))
+            columns.append(Concatenate(values))
+
+        order = np.argsort(np.concatenate([x.onsets for x in regressors] + [np.zeros(0)]),
+                           kind='mergesort')
+        rows  = columns[0][order]
+        for column in columns[1:]:
+            rows = np.char.add(np.char.add(rows, "\t"), column[order])
+
+        filename = self.template % dict(self.names, run=block)
+        fout     = open(filename, 'w')
+        fout.write("\n".join(["\t".join(header)] + list(rows) + [""]))
+        fout.close()
+        self.filenames.append(filename)
+
+    def Close(self):
+        return self.filenames
+
+
+def WriteSession(sinks, block, regressors):
+    """Passes the Regressors of a session to every sink"""
+    for sink in sinks:
+        sink.Session(block, regressors)
+
+
+def CloseSinks(sinks):
+    """Closes all the sinks, and returns the names of the files written"""
+    filenames = []
+    for sink in sinks:
+        filenames += sink.Close()
+    return filenames
+
+
+## ---------------------------------------------------------------- ##
+## Shortcuts for whole lists of sessions
+## ---------------------------------------------------------------- ##
+
+def WriteSessions(sinks, sessions, precision=None):
+    """Writes a list of sessions to a list of sinks"""
+    for block, regressors, weights in sessions:
+        WriteSession(sinks, block, Regressors(regressors, precision))
+    return CloseSinks(sinks)
+
+
+def WriteMat(filename, regressors, precision=None):
+    """Writes the names, onsets and durations of a session as a .mat file"""
+    SaveMat(filename, Regressors(regressors, precision))
+
+
+def WriteMats(directory, sessions, precision=None, template="session%d.mat"):
+    """Writes one .mat file per session; returns their names"""
+    return WriteSessions([MatSink(directory, template)], sessions, precision)
+
+
+def WriteMCode(filename, sessions, precision=3, template="session%d.mat"):
+    """Writes the M-code that creates one .mat file per session"""
+    WriteSessions([MCodeSink(filename, template)], sessions, precision)
@@ -0,0 +1,233 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## DESIGN-EFFICIENCY
+## ---------------------------------------------------------------- ##
+## Checks the designs of a cohort before SPM estimates them.  For
+## every subject, it builds the design matrix from the session .mat
+## files (see design.py), and reports:
+##
+##  * the efficiency of every contrast in the subject's contrasts
+##    file (1 / c (X'X)^-1 c'), and whether it is estimable;
+##  * the variance inflation factor (VIF) of every regressor, and
+##    the regressor of the same session it correlates most with;
+##  * rank-deficient designs, empty regressors (e.g. a 'Discard'
+##    condition without trials), collinear regressors (VIF above
+##    a limit), and contrasts that do not fit the design.
+##
+## Subjects are checked in parallel (one worker process each).  The
+## subjects come from cohort2m.py's build manifest (build.tsv), or
+## from directories with session*.mat and *contrasts.txt files.
+## ---------------------------------------------------------------- ##
+
+import sys, os, re, time, glob
+import multiprocessing
+import numpy as np
+
+import eparse
+import design
+from cohort2m import ReadBuildManifest
+
+EFFICIENCY_COLUMNS   = ("Subject", "Contrast", "Efficiency", "Estimable")
+COLLINEARITY_COLUMNS = ("Subject", "Session", "Regressor", "VIF",
+                        "MaxCorrelation", "CorrelatedWith")
+
+## The HRF lasts 32s: when the number of scans is not given, each
+## session is assumed to end 32s after its last event.
+HRF_LENGTH = 32.0
+
+
+def SessionNumber(filename):
+    """The number in a session file name (session12.mat -> 12)"""
+    numbers = re.findall(r"\d+", os.path.basename(filename))
+    if len(numbers) == 0:
+        return 0
+    return int(numbers[-1])
+
+
+def Subjects(sources):
+    """
+    Returns a list of (subject, .mat files, contrasts file) for a
+    list of build manifests and directories.
+    """
+    subjects = []
+    for source in sources:
+        if os.path.isdir(source):
+            mats      = sorted(glob.glob(os.path.join(source, "session*.mat")),
+                               key=SessionNumber)
+            contrasts = glob.glob(os.path.join(source, "*contrasts.txt"))
+            subjects.append((source, mats, (contrasts + [None])[0]))
+        else:
+            built = ReadBuildManifest(source)
+            for subject in sorted(built.keys()):
+                outputs   = built[subject][3]
+                mats      = [x for x in outputs if x.endswith(".mat")]
+                contrasts = [x for x in outputs if x.endswith("contrasts.txt")]
+                subjects.append((subject, mats, (contrasts + [None])[0]))
+    return subjects
+
+
+def EstimateScans(sessions, TR):
+    """The number of scans of each session, from its last event"""
+    scans = []
+    for block, regressors, weights in sessions:
+        ends = [np.max(np.ravel(o) + np.ravel(d)) for n, o, d in regressors if np.size(o) > 0]
+        scans.append(int(np.ceil((max(ends + [0.0]) + HRF_LENGTH) / TR)))
+    return scans
+
+
+def Check(X, contrasts, vifLimit=10.0):
+    """
+    Checks a Design.  Returns the efficiency rows, the collinearity
+    rows, and a list of warnings.
+    """
+    warnings = []
+    rank     = X.Rank()
+    if rank < X.X.shape[1]:
+        warnings.append("rank %d < %d columns" % (rank, X.X.shape[1]))
+    empty = X.Empty()
+    if len(empty) > 0:
+        warnings.append("empty: %s" % ", ".join([X.names[i] for i in empty]))
+
+    efficiency = []
+    for name, weights in contrasts:
+        try:
+            if X.Estimable(weights):
+                efficiency.append((name, X.Efficiency(weights), True))
+            else:
+                efficiency.append((name, np.nan, False))
+                warnings.append("contrast '%s' is not estimable" % name)
+        except Exception, e:
+            efficiency.append((name, np.nan, False))
+            warnings.append("contrast '%s': %s" % (name, e))
+
+    collinearity = []
+    for s in range(len(X.scans)):
+        columns = X.Columns(s)
+        vif     = X.VIF(s)
+        R       = np.abs(X.Correlations(s))
+        R[np.arange(len(R)), np.arange(len(R))] = np.nan
+        for i, j in enumerate(columns):
+            if np.isnan(R[i]).all():
+                r, other = np.nan, ""
+            else:
+                k        = np.nanargmax(R[i])
+                r, other = R[i, k], X.names[columns[k]]
+            collinearity.append((X.blocks[s], X.names[j], vif[i], r, other))
+            if vif[i] > vifLimit and not j in empty:
+                warnings.append("%s: VIF %.1f" % (X.names[j], vif[i]))
+    return efficiency, collinearity, warnings
+
+
+def CheckJob(job):
+    """
+    Checks the design of a single subject.  Returns the subject, the
+    results of Check, the time it took, and the error (if any).
+    """
+    subject, mats, contrastFile, TR, scans, vifLimit = job
+    start = time.time()
+    try:
+        if len(mats) == 0:
+            raise Exception, "No session .mat files"
+        sessions  = design.ReadSessions(mats)
+        if scans is None:
+            scans = EstimateScans(sessions, TR)
+        X         = design.Design(sessions, TR, scans)
+        contrasts = []
+        if contrastFile is not None:
+            contrasts = design.ReadContrasts(contrastFile)
+        return (subject, Check(X, contrasts, vifLimit), time.time() - start, None)
+    except Exception, e:
+        return (subject, None, time.time() - start, "%s: %s" % (e.__class__.__name__, e))
+
+
+def CheckCohort(sources, TR, scans=None, processes=None, vifLimit=10.0,
+                output="design"):
+    """
+    Checks the designs of all the subjects in a list of build manifests
+    and directories, in parallel, and writes the <output>.efficiency.tsv
+    and <output>.collinearity.tsv tables.  Returns the subjects that
+    failed or have warnings.
+    """
+    jobs    = [(s, m, c, TR, scans, vifLimit) for s, m, c in Subjects(sources)]
+    pool    = multiprocessing.Pool(processes)
+    results = {}
+    flagged = []
+    start   = time.time()
+    for subject, result, elapsed, error in pool.imap_unordered(CheckJob, jobs):
+        if error is not None:
+            print "%-20s %8.2fs  FAILED (%s)" % (subject, elapsed, error)
+            flagged.append(subject)
+            continue
+        results[subject] = result
+        warnings = result[2]
+        print "%-20s %8.2fs  %s" % (subject, elapsed,
+                                    "; ".join(warnings) if warnings else "OK")
+        if len(warnings) > 0:
+            flagged.append(subject)
+    pool.close()
+    pool.join()
+
+    efficiency   = open(output + ".efficiency.tsv", 'w')
+    collinearity = open(output + ".collinearity.tsv", 'w')
+    efficiency.write("\t".join(EFFICIENCY_COLUMNS) + "\n")
+    collinearity.write("\t".join(COLLINEARITY_COLUMNS) + "\n")
+    for subject in [x[0] for x in jobs if x[0] in results]:
+        contrasts, regressors, warnings = results[subject]
+        for name, e, estimable in contrasts:
+            efficiency.write("%s\t%s\t%.6g\t%d\n" % (subject, name, e, estimable))
+        for block, name, vif, r, other in regressors:
+            collinearity.write("%s\t%d\t%s\t%.6g\t%.4f\t%s\n" % (subject, block, name,
+                                                               vif, r, other))
+    efficiency.close()
+    collinearity.close()
+    print "Checked %d subjects (%d flagged) in %.2fs" % (len(jobs), len(flagged),
+                                                        time.time() - start)
+    return flagged
+
+
+HLP_MSG = """
+Usage:
+
+   design-efficiency.py --tr=<s> [--scans=<n>[,<n>...]] [--processes=<n>]
+                        [--vif=<limit>] [--output=<prefix>]
+                        <build.tsv | directory> ...
+
+Where:
+
+   * build.tsv is the build manifest written by cohort2m.py (all its
+     subjects are checked), and a directory contains the session*.mat
+     and *contrasts.txt files of a single subject
+   * --tr is the repetition time, in seconds
+   * --scans is the number of scans of each session (default: until
+     32s after the last event of each session)
+   * --processes is the number of worker processes (default: one per
+     CPU)
+   * --vif is the VIF above which a regressor is flagged (default 10)
+   * --output is the prefix of the <prefix>.efficiency.tsv and
+     <prefix>.collinearity.tsv tables (default: design)
+
+Subjects with rank-deficient designs, empty or collinear regressors,
+or contrasts that do not fit their design are flagged, and then the
+script exits with status 1.
+"""
+
+if __name__ == "__main__":
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    args    = [x for x in sys.argv[1:] if not x.startswith("--")]
+    TR      = eparse.Option(options, "tr")
+    if len(args) == 0 or TR is None:
+        print HLP_MSG
+    else:
+        scans = eparse.Option(options, "scans")
+        if scans is not None:
+            scans = [int(x) for x in scans.split(",")]
+            if len(scans) == 1:
+                scans = scans[0]
+        processes = eparse.Option(options, "processes")
+        if processes is not None:
+            processes = int(processes)
+        flagged = CheckCohort(args, float(TR), scans, processes,
+                              float(eparse.Option(options, "vif", 10.0)),
+                              eparse.Option(options, "output", "design"))
+        if len(flagged) > 0:
+            sys.exit(1)
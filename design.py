@@ -0,0 +1,302 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## DESIGN
+## ---------------------------------------------------------------- ##
+## Builds the design matrix of a set of sessions (the names, onsets
+## and durations written by the *2m.py scripts) the way SPM does in
+## fmri_spec, without Matlab.
+##
+## Like SPM (see spm_get_ons.m), every regressor is first built as
+## a stimulus function at "microtime" resolution (T bins of dt s per
+## scan, 16 by default), where each event is a boxcar that begins
+## round(onset / dt) bins after the padding, and lasts
+## round(duration / dt) + 1 bins.  When
+## all the durations of a regressor are 0, its events are spikes of
+## unit area (height 1 / dt).  The stimulus functions are then
+## convolved with SPM's canonical HRF (see spm_hrf.m), and sampled
+## once per scan at the T0-th microtime bin (8 by default).
+## Sessions are arranged block-diagonally, each with its own
+## constant.
+##
+## All the regressors of all the sessions are built in a single
+## array, and convolved at once through the FFT, so that the design
+## of a whole cohort can be previewed in seconds.
+## ---------------------------------------------------------------- ##
+
+import sys
+import numpy as np
+from scipy.stats import gamma
+
+import eparse
+from conditions import ReadMat
+from trialtable import Round
+
+## SPM's defaults: microtime resolution and onset (in bins), and the
+## parameters of the canonical HRF (see spm_hrf.m): delay of the
+## response and of the undershoot, their dispersions, the ratio of
+## response to undershoot, the onset and the length of the kernel
+## (all in s).
+MICROTIME_RESOLUTION = 16
+MICROTIME_ONSET      = 8
+HRF_PARAMETERS       = (6, 16, 1, 1, 6, 0, 32)
+
+## SPM pads the stimulus functions with 32 microtime bins
+PADDING              = 32
+
+
+def CanonicalHRF(dt, p=HRF_PARAMETERS):
+    """SPM's canonical HRF, sampled every 'dt' seconds (sums to 1)"""
+    t   = np.arange(0, int(np.floor(p[6] / dt)) + 1) * dt - p[5]
+    hrf = gamma.pdf(t, p[0] / p[2], scale=p[2]) - gamma.pdf(t, p[1] / p[3], scale=p[3]) / p[4]
+    return hrf / hrf.sum()
+
+
+def Convolve(signals, kernel):
+    """Convolves every column of 'signals' with a kernel (by FFT)"""
+    n = len(signals) + len(kernel) - 1
+    n = 1 << int(np.ceil(np.log2(max(n, 1))))
+    S = np.fft.rfft(signals, n, axis=0)
+    K = np.fft.rfft(kernel, n)
+    return np.fft.irfft(S * K[:, np.newaxis], n, axis=0)[:len(signals)]
+
+
+class Design:
+    """The design matrix of a set of sessions"""
+    def __init__(self, sessions, TR, scans, T=MICROTIME_RESOLUTION,
+                 T0=MICROTIME_ONSET):
+        """
+        'sessions' is a list of (block, regressors, weights) tuples,
+        where the regressors are (name, onsets, durations) triples in
+        seconds (see conditions.py), and 'scans' is the number of
+        scans of each session (or a single number for all of them).
+        """
+        if np.isscalar(scans):
+            scans = [scans] * len(sessions)
+        if len(scans) != len(sessions):
+            raise Exception, "%d sessions, but %d scan counts" % (len(sessions), len(scans))
+        self.TR     = float(TR)
+        self.T      = T
+        self.T0     = T0
+        self.dt     = self.TR / T
+        self.scans  = np.array(scans, dtype=int)
+        self.blocks = [x[0] for x in sessions]
+
+        # One column per regressor, one row per microtime bin (the
+        # sessions are aligned at their beginning).
+        self.names   = []
+        self.session = []
+        columns      = []
+        for s, session in enumerate(sessions):
+            for name, onsets, durations in session[1]:
+                self.names.append("Sn(%d) %s*bf(1)" % (s + 1, name))
+                self.session.append(s)
+                columns.append((onsets, durations))
+        self.session = np.array(self.session, dtype=int)
+        self.bins    = self.scans.max() * T + PADDING
+        self.stimuli = self.StimulusFunctions(columns)
+        self.hrf     = CanonicalHRF(self.dt)
+        self.X       = self.Sample(Convolve(self.stimuli, self.hrf))
+        self.names  += ["Sn(%d) constant" % (s + 1) for s in range(len(self.scans))]
+
+    def StimulusFunctions(self, columns):
+        """
+        The stimulus function of every regressor.  Events are added
+        as +1 at their onset and -1 at their offset, and integrated.
+        """
+        n      = self.bins + 1
+        counts = [len(np.ravel(x[0])) for x in columns]
+        col    = np.repeat(np.arange(len(columns)), counts)
+        if len(col) == 0:
+            return np.zeros((self.bins, len(columns)))
+        # A single duration applies to all the events of a regressor
+        onsets    = np.concatenate([np.ravel(x[0]) for x in columns]).astype(float)
+        durations = np.concatenate([np.ravel(d) + np.zeros(c) for (o, d), c
+                                    in zip(columns, counts)]).astype(float)
+
+        # SPM's bins are 1-based (onsets at round(onset / dt) + 33,
+        # ie, right after the padding), and every event lasts one
+        # more bin than its duration.  Like Matlab's round(), halves
+        # are rounded away from 0.
+        ton       = Round(onsets / self.dt).astype(int) + PADDING
+        tof       = Round(durations / self.dt).astype(int) + ton + 1
+
+        # Regressors whose durations are all 0 are spikes of unit area
+        spikes    = np.array([not np.any(np.ravel(d)) for o, d in columns])
+        height    = np.where(spikes[col], 1.0 / self.dt, 1.0)
+        ton       = np.clip(ton, 0, n - 1)
+        tof       = np.clip(tof, 0, n - 1)
+
+        delta = np.zeros((n, len(columns)))
+        np.add.at(delta, (ton, col), height)
+        np.add.at(delta, (tof, col), -height)
+        return np.cumsum(delta, axis=0)[:self.bins]
+
+    def Sample(self, convolved):
+        """
+        Samples the convolved regressors at each scan, and lays out the
+        sessions block-diagonally, followed by one constant per session.
+        """
+        rows  = np.concatenate([[0], np.cumsum(self.scans)])
+        scans = np.arange(self.scans.max()) * self.T + self.T0 - 1 + PADDING
+        n     = len(self.session)
+        X     = np.zeros((rows[-1], n + len(self.scans)))
+        for s, k in enumerate(self.scans):
+            columns = self.Columns(s)
+            X[rows[s]:rows[s + 1], columns] = convolved[scans[:k]][:, columns]
+            X[rows[s]:rows[s + 1], n + s] = 1.0
+        return X
+
+    def Columns(self, session):
+        """The columns of a session (without its constant)"""
+        return np.flatnonzero(self.session == session)
+
+    def Rows(self, session):
+        """The rows (scans) of a session"""
+        start = self.scans[:session].sum()
+        return np.arange(start, start + self.scans[session])
+
+    ## ------------------------------------------------------------ ##
+    ## Checks of the design (before SPM estimates it)
+    ## ------------------------------------------------------------ ##
+
+    def Rank(self):
+        """The rank of the design matrix"""
+        return np.linalg.matrix_rank(self.X)
+
+    def Empty(self):
+        """The regressors that are always 0 (e.g., no events)"""
+        return np.flatnonzero(np.abs(self.X).max(axis=0) == 0)
+
+    def Contrast(self, weights):
+        """
+        A contrast vector as long as the design (the constants get 0s).
+        Contrasts with more weights than regressors raise an Exception.
+        """
+        weights = np.ravel(np.asarray(weights, dtype=float))
+        if len(weights) > self.X.shape[1]:
+            raise Exception, "Contrast has %d weights, but the design has %d columns" % \
+                  (len(weights), self.X.shape[1])
+        return np.concatenate([weights, np.zeros(self.X.shape[1] - len(weights))])
+
+    def Estimable(self, weights, tolerance=1e-6):
+        """True if a contrast is estimable (in the row space of X)"""
+        c = self.Contrast(weights)
+        projected = np.dot(np.dot(c, np.linalg.pinv(self.X)), self.X)
+        return np.abs(projected - c).max() <= tolerance * max(1.0, np.abs(c).max())
+
+    def Efficiency(self, weights):
+        """The efficiency of a contrast: 1 / c (X'X)^-1 c'"""
+        c = self.Contrast(weights)
+        v = np.dot(np.dot(c, np.linalg.pinv(np.dot(self.X.T, self.X))), c)
+        if v <= 0:
+            return np.nan
+        return 1.0 / v
+
+    def Correlations(self, session):
+        """
+        The correlation matrix of the regressors of a session (over
+        the scans of the session).  Empty regressors get NaN.
+        """
+        X     = self.SessionMatrix(session)
+        X     = X - X.mean(axis=0)
+        norms = np.sqrt((X * X).sum(axis=0))
+        norms = np.where(norms > 0, norms, np.nan)
+        return np.dot(X.T, X) / np.outer(norms, norms)
+
+    def VIF(self, session):
+        """
+        The variance inflation factor of each regressor of a session:
+        1 / (1 - R^2), where R^2 is how well the other regressors of
+        the session (and its constant) predict it.  Regressors that
+        are empty, or a combination of the others, get inf.
+        """
+        X   = self.SessionMatrix(session)
+        vif = np.repeat(np.inf, X.shape[1])
+        for j in range(X.shape[1]):
+            y  = X[:, j] - X[:, j].mean()
+            ss = np.dot(y, y)
+            if ss <= 0:
+                continue
+            others = np.column_stack([np.delete(X, j, axis=1), np.ones(len(X))])
+            beta   = np.linalg.lstsq(others, X[:, j], rcond=None)[0]
+            e      = X[:, j] - np.dot(others, beta)
+            r2     = 1.0 - np.dot(e, e) / ss
+            if r2 < 1.0 - 1e-10:
+                vif[j] = 1.0 / (1.0 - r2)
+        return vif
+
+    def SessionMatrix(self, session):
+        """The regressors of a session, over its scans"""
+        return self.X[self.Rows(session)][:, self.Columns(session)]
+
+    def Write(self, filename):
+        """Writes the design matrix as a tab-separated table"""
+        fout = open(filename, 'w')
+        fout.write("\t".join(self.names) + "\n")
+        for row in self.X:
+            fout.write("\t".join(["%.6g" % x for x in row]) + "\n")
+        fout.close()
+
+
+def ReadContrasts(filename):
+    """
+    Reads a contrasts file (lines of 'name : [w1 w2 ... wN]', as
+    written by spec2m.py and the *2m.py scripts).
+    """
+    contrasts = []
+    fin = open(filename, 'rU')
+    for line in fin:
+        if not ":" in line:
+            continue
+        name, weights = line.rsplit(":", 1)
+        weights = weights.strip().strip("[]").replace(",", " ")
+        contrasts.append((name.strip(), [float(x) for x in weights.split()]))
+    fin.close()
+    return contrasts
+
+
+def ReadSessions(filenames):
+    """Reads a list of session .mat files (see conditions.ReadMat)"""
+    sessions = []
+    for i, filename in enumerate(filenames):
+        regressors = ReadMat(filename)
+        sessions.append((i + 1, regressors, [None] * len(regressors)))
+    return sessions
+
+
+HLP_MSG = """
+Usage:
+
+   design.py --tr=<s> --scans=<n>[,<n>...] [--microtime=<T>]
+             [--microtime-onset=<T0>] [--output=<file>]
+             <session1.mat> <session2.mat> ... <sessionN.mat>
+
+Where:
+
+   * <sessionX.mat> are the multiple conditions files of each
+     session (as written by spec2m.py or the *2m.py scripts)
+   * --tr is the repetition time, in seconds
+   * --scans is the number of scans of each session (a single
+     number if they are all the same)
+   * --microtime and --microtime-onset are SPM's fMRI_T and fMRI_T0
+     (default: 16 and 8)
+   * --output is the design matrix table (default: design.tsv)
+"""
+
+if __name__ == "__main__":
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    args    = [x for x in sys.argv[1:] if not x.startswith("--")]
+    TR      = eparse.Option(options, "tr")
+    scans   = eparse.Option(options, "scans")
+    if len(args) == 0 or TR is None or scans is None:
+        print HLP_MSG
+    else:
+        scans  = [int(x) for x in scans.split(",")]
+        if len(scans) == 1:
+            scans = scans[0]
+        design = Design(ReadSessions(args), float(TR), scans,
+                        int(eparse.Option(options, "microtime", MICROTIME_RESOLUTION)),
+                        int(eparse.Option(options, "microtime-onset", MICROTIME_ONSET)))
+        output = eparse.Option(options, "output", "design.tsv")
+        design.Write(output)
+        print "%d scans x %d regressors written to %s" % (design.X.shape + (output,))
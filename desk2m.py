@@ -12,6 +12,7 @@ import sys, os
 from operator import add
 from math import sqrt
 from numpy import mean, std
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -21,19 +22,6 @@ TR     = 2000.0   # The study's TR
 OFFSET = 1        # The number of scans that separate the beginnig
                   # Of a Session from the first recorded event. 
 
-## ---------------------------------------------------------------- ##
-## This is a list of imaging-related variables
-## ---------------------------------------------------------------- ##
-
-BLOCK = 0
-TRIAL = 0
-CONDITION = 0
-STIMULUS_ONSET = 0
-STIMULUS_RT = 0
-STIMULUS_ACC = 0
-INCONGRUENT_INSTRUCTIONS_ONSET = 0
-CONGRUENT_INSTRUCTIONS_ONSET = 0
-DONE = 0
 
 class Block:
     """
@@ -89,8 +77,9 @@ class Trial:
     """
     An abstract class representing a Simon Task 
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         try:
             self.Create(tokens)
             self.Initialize()
@@ -107,23 +96,22 @@ class Trial:
 
     def Create(self, tokens):
         """Performs the necessary initialization"""
-        global BEGIN
-        self.block        = int(tokens[BLOCK])
+        self.block        = int(tokens[self.schema.BLOCK])
         #print self.block
-        self.trial        = int(tokens[TRIAL])
+        self.trial        = int(tokens[self.schema.TRIAL])
         #print self.trial
-        self.stimulusOnset = int(tokens[STIMULUS_ONSET])
+        self.stimulusOnset = int(tokens[self.schema.STIMULUS_ONSET])
         #print self.stimulusOnset
-        self.stimulusRt    = int(tokens[STIMULUS_RT])
-        self.stimulusAcc   = int(tokens[STIMULUS_ACC])
-        self.condition     = tokens[CONDITION]
-        self.done          = int(tokens[DONE])
+        self.stimulusRt    = int(tokens[self.schema.STIMULUS_RT])
+        self.stimulusAcc   = int(tokens[self.schema.STIMULUS_ACC])
+        self.condition     = tokens[self.schema.CONDITION]
+        self.done          = int(tokens[self.schema.DONE])
         
         self.instructionsBegin = 0
         if self.condition == "Congruent":
-            self.instructionsOnset = int(tokens[CONGRUENT_INSTRUCTIONS_ONSET])
+            self.instructionsOnset = int(tokens[self.schema.CONGRUENT_INSTRUCTIONS_ONSET])
         elif self.condition == "Incongruent":
-            self.instructionsOnset = int(tokens[INCONGRUENT_INSTRUCTIONS_ONSET])
+            self.instructionsOnset = int(tokens[self.schema.INCONGRUENT_INSTRUCTIONS_ONSET])
         
 
 
@@ -140,73 +128,67 @@ class Trial:
 def set_variables(colNames):
     """
     Identifies the colums corresponding to specific variables in a list
-    of column names
+    of column names, and returns them as a TableSchema
     """
-    global BLOCK
-    global TRIAL
-    global CONDITION
-    global STIMULUS_ONSET
-    global STIMULUS_RT
-    global STIMULUS_ACC
-    global INCONGRUENT_INSTRUCTIONS_ONSET
-    global CONGRUENT_INSTRUCTIONS_ONSET
-    global DONE
+    schema = TableSchema(colNames, {})
 
     try:
-        BLOCK  = colNames.index("Block")
+        schema.BLOCK  = colNames.index("Block")
     except ValueError as e:
         sys.stderr.write("Cannot find 'Block' info. Aborting\n")
         sys.exit(0)
 
     try:
-        TRIAL  = colNames.index("Trial")
+        schema.TRIAL  = colNames.index("Trial")
     except ValueError as e:
         sys.stderr.write("Cannot find 'Trial' info. Aborting\n")
         sys.exit(0)
 
     try:
-        CONDITION  = colNames.index("Procedure[Block]")
+        schema.CONDITION  = colNames.index("Procedure[Block]")
     except ValueError as e:
         sys.stderr.write("Cannot find 'Procedure' info. Aborting\n")
         sys.exit(0)
 
     try:
-        STIMULUS_ONSET  = colNames.index("Stimulus.OnsetTime[Trial]")
+        schema.STIMULUS_ONSET  = colNames.index("Stimulus.OnsetTime[Trial]")
     except ValueError as e:
         sys.stderr.write("Could not find 'Stimulus.OnsetTime' info at 'Trial' level\n")
-        STIMULUS_ONSET  = colNames.index("Stimulus.OnsetTime")
+        schema.STIMULUS_ONSET  = colNames.index("Stimulus.OnsetTime")
         
     try:
-        STIMULUS_RT     = colNames.index("Stimulus.RT[Trial]")
+        schema.STIMULUS_RT     = colNames.index("Stimulus.RT[Trial]")
     except ValueError as e:
         sys.stderr.write("Could not find 'Stimulus.RT' info at 'Trial' level\n")
-        STIMULUS_RT     = colNames.index("Stimulus.RT")
+        schema.STIMULUS_RT     = colNames.index("Stimulus.RT")
 
     try:
-        STIMULUS_ACC     = colNames.index("Stimulus.ACC[Trial]")
+        schema.STIMULUS_ACC     = colNames.index("Stimulus.ACC[Trial]")
     except ValueError as e:
         sys.stderr.write("Could not find 'Stimulus.ACC' info at 'Trial' level\n")
-        STIMULUS_ACC     = colNames.index("Stimulus.ACC")        
+        schema.STIMULUS_ACC     = colNames.index("Stimulus.ACC")        
     
     try:
-        CONGRUENT_INSTRUCTIONS_ONSET = \
+        schema.CONGRUENT_INSTRUCTIONS_ONSET = \
           colNames.index("CongruentInstructions.OnsetTime[Trial]")
     except ValueError as e:
         sys.stderr.write("Could not find 'CongruentINstructions.OnsetTime' info at 'Trial' level\n")
-        CONGRUENT_INSTRUCTIONS_ONSET = colNames.index("CongruentInstructions.OnsetTime")
+        schema.CONGRUENT_INSTRUCTIONS_ONSET = colNames.index("CongruentInstructions.OnsetTime")
 
     try:
-        INCONGRUENT_INSTRUCTIONS_ONSET = \
+        schema.INCONGRUENT_INSTRUCTIONS_ONSET = \
           colNames.index("IncongruentInstructions.OnsetTime[Trial]")
     except ValueError as e:
         sys.stderr.write("Could not find 'IncongruentINstructions.OnsetTime' info at 'Trial' level\n")
-        INCONGRUENT_INSTRUCTIONS_ONSET = colNames.index("IncongruentInstructions.OnsetTime")
+        schema.INCONGRUENT_INSTRUCTIONS_ONSET = colNames.index("IncongruentInstructions.OnsetTime")
 
     try:
-        DONE = colNames.index("Done.OnsetTime[Trial]")
+        schema.DONE = colNames.index("Done.OnsetTime[Trial]")
     except ValueError as e:
         sys.stderr.write("Could not find 'Done.OnsetTime' info at 'Trial' level\n")
-        DONE = colNames.index("Done.OnsetTime")
+        schema.DONE = colNames.index("Done.OnsetTime")
+
+    return schema
 
 
 def parse_file(filename):
@@ -221,11 +203,11 @@ def parse_file(filename):
     rows     = tokens[1:]
 
     
-    set_variables( colNames )
+    schema = set_variables( colNames )
      
     # Transforming rows into trials and returning them
     
-    trials = [Trial(r) for r in rows]
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials
 
     return trials
@@ -10,6 +10,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -19,14 +20,19 @@ from math import sqrt
 TR     = 1000.0
 OFFSET = 0
 
-PROBE1_ONSET = 0
-PROBE2_ONSET = 0
-PROBE1_RT    = 0
-PROBE2_RT    = 0
-PROBE1_ACC   = 0
-PROBE2_ACC   = 0
-CONDITION    = 0
-TRIAL        = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'PROBE1_ONSET' : "Block1Probe.OnsetTime",
+    'PROBE2_ONSET' : "Block2Probe.OnsetTime",
+    'PROBE1_RT'    : "Block1Probe.RT",
+    'PROBE2_RT'    : "Block2Probe.RT",
+    'PROBE1_ACC'   : "Block1Probe.ACC",
+    'PROBE2_ACC'   : "Block2Probe.ACC",
+    'CONDITION'    : "Condition",
+    }
 
 class Trial:
     """
@@ -34,8 +40,9 @@ class Trial:
     (Encoding, Execution, Response), with associated Onsets and
     Durations (ie. RTs), followed delays.
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         try:
             self.Create(tokens)
@@ -48,18 +55,18 @@ class Trial:
 
     def Create(self, tokens):
         """Performs the necessary initialization"""
-        if len(tokens[PROBE1_ONSET]) > 0 :
+        if len(tokens[self.schema.PROBE1_ONSET]) > 0 :
             self.block = 1
-            self.probeOnset = int(tokens[PROBE1_ONSET])
-            self.probeRt = int(tokens[PROBE1_RT])
-            self.acc = int(tokens[PROBE1_ACC])
+            self.probeOnset = int(tokens[self.schema.PROBE1_ONSET])
+            self.probeRt = int(tokens[self.schema.PROBE1_RT])
+            self.acc = int(tokens[self.schema.PROBE1_ACC])
         else:
             self.block = 2
-            self.probeOnset = int(tokens[PROBE2_ONSET])
-            self.probeRt = int(tokens[PROBE2_RT])
-            self.acc = int(tokens[PROBE2_ACC])
+            self.probeOnset = int(tokens[self.schema.PROBE2_ONSET])
+            self.probeRt = int(tokens[self.schema.PROBE2_RT])
+            self.acc = int(tokens[self.schema.PROBE2_ACC])
 
-        self.condition = tokens[CONDITION]
+        self.condition = tokens[self.schema.CONDITION]
         #self.trial = tokens[TRIAL]
         # Now set up all the other values, based on the Probe values.
 
@@ -99,14 +106,6 @@ class Trial:
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global PROBE1_ONSET
-    global PROBE2_ONSET
-    global PROBE1_RT   
-    global PROBE2_RT   
-    global PROBE1_ACC  
-    global PROBE2_ACC  
-    global CONDITION   
-
     fin      = open(filename, 'rU')
     subject  = filename.split('_')[0]
     lines    = fin.readlines()
@@ -115,15 +114,9 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    PROBE1_ONSET = colNames.index("Block1Probe.OnsetTime")
-    PROBE2_ONSET = colNames.index("Block2Probe.OnsetTime")
-    PROBE1_RT    = colNames.index("Block1Probe.RT")
-    PROBE2_RT    = colNames.index("Block2Probe.RT")
-    PROBE1_ACC   = colNames.index("Block1Probe.ACC")
-    PROBE2_ACC   = colNames.index("Block2Probe.ACC")
-    CONDITION    = colNames.index("Condition")    
-
-    trials = [Trial(r) for r in rows]
+    schema   = TableSchema(colNames, COLUMNS)
+
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     FIRST_TRIALS = []
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+## ---------------------------------------------------------------- ##
+## EPARSE-BENCH.PY                                                  ##
+## ---------------------------------------------------------------- ##
+## Benchmarks for eparse.py.  Generates synthetic Eprime logs (with ##
+## a given nesting depth, number of trials, number of fields, and,  ##
+## optionally, a truncation point to simulate crashed sessions),    ##
+## and times each stage of the parser separately, reporting rows    ##
+## per second and peak memory.                                      ##
+## ---------------------------------------------------------------- ##
+
+HLP_MSG="""
+EPARSE-BENCH.PY
+------------------------------------------------------------
+Generates a synthetic Eprime log and times each stage of
+eparse.py on it.
+------------------------------------------------------------
+Usage:
+
+  $ eparse-bench.py [--depth=<n>] [--trials=<n>] [--fields=<n>]
+                    [--branch=<n>] [--truncate=<fraction>]
+                    [--repeat=<n>] [--utf16] [--keep=<log file>]
+
+Where:
+* --depth is the number of nested levels (default 3: session,
+  blocks, trials).
+* --trials is the number of innermost frames (default 10000).
+* --fields is the number of fields in each frame (default 30).
+* --branch is the number of children of each intermediate
+  frame (default 20).
+* --truncate cuts the log at the given fraction of its lines,
+  like a session that crashed (default: complete log).
+* --repeat runs each stage <n> times and reports the fastest
+  run (default 3).
+* --utf16 writes the log in UTF-16, like Eprime 2.0 does.
+* --keep saves the generated log instead of deleting it.
+
+Each stage runs in a separate process, and the peak memory
+is the maximum resident size of that process (which includes
+the stages the measured one depends on).
+------------------------------------------------------------
+"""
+
+import sys, os, time, tempfile, resource, multiprocessing, codecs
+import eparse
+
+
+## ---------------------------------------------------------------- ##
+## SYNTHETIC LOGS                                                   ##
+## ---------------------------------------------------------------- ##
+
+def FrameLines(level, levelName, index, fields):
+    """Returns the lines of a single LogFrame"""
+    tab   = "\t" * (level - 1)
+    lines = ["%sLevel: %d" % (tab, level), "%s*** LogFrame Start ***" % tab]
+    lines.append("%sProcedure: %sProc" % (tab, levelName))
+    lines.append("%s%s: %d" % (tab, levelName, index))
+    for i in range(fields):
+        if i % 3 == 0:
+            lines.append("%sStim%d.OnsetTime: %d" % (tab, i, 1000 * index + i))
+        elif i % 3 == 1:
+            lines.append("%sStim%d.RT: %d" % (tab, i, 300 + (index * 7 + i) % 900))
+        else:
+            lines.append("%sAttribute%d: Value%d" % (tab, i, (index + i) % 5))
+    lines.append("%s*** LogFrame End ***" % tab)
+    return lines
+
+
+def GenerateLog(filename, depth=3, trials=10000, fields=30, branch=20,
+                truncate=None, utf16=False):
+    """
+    Writes a synthetic log with 'trials' innermost frames at level
+    'depth', and intermediate frames with 'branch' children each.
+    As in real logs, children are written before their parents.
+    If 'truncate' is given, only that fraction of the lines is kept.
+    """
+    names  = ["Session", "Block"] + ["Level%d" % x for x in range(3, depth)] + ["Trial"]
+    names  = names[:depth - 1] + [names[-1]]
+    lines  = ["*** Header Start ***", "VersionPersist: 1"]
+    lines += ["LevelName: %s" % x for x in names]
+    lines += ["Experiment: Benchmark", "Subject: 1", "Session: 1", "*** Header End ***"]
+
+    children = dict([(x, 0) for x in range(2, depth)])   # Of the open frames
+    counter  = dict([(x, 0) for x in range(1, depth + 1)])
+    for t in range(trials):
+        counter[depth] += 1
+        lines += FrameLines(depth, names[depth - 1], counter[depth], fields)
+        # Closes the intermediate frames that are complete
+        level = depth - 1
+        if level > 1:
+            children[level] += 1
+        while level > 1 and (children[level] == branch or t == trials - 1):
+            counter[level] += 1
+            lines += FrameLines(level, names[level - 1], counter[level], 2)
+            children[level] = 0
+            if level - 1 > 1:
+                children[level - 1] += 1
+            level -= 1
+    lines += FrameLines(1, names[0], 1, 2)
+
+    if truncate is not None:
+        lines = lines[:int(len(lines) * truncate)]
+    out  = open(filename, 'wb')
+    text = "\r\n".join(lines) + "\r\n"
+    if utf16:
+        out.write(codecs.BOM_UTF16_LE + text.encode('utf-16-le'))
+    else:
+        out.write(text)
+    out.close()
+
+
+## ---------------------------------------------------------------- ##
+## STAGES                                                           ##
+## ---------------------------------------------------------------- ##
+## Each stage returns the number of rows (or entries) it produced.  ##
+## The work that a stage depends on is done before the timer starts ##
+## ---------------------------------------------------------------- ##
+
+def StageRead(logfile, output):
+    start = time.time()
+    n     = 0
+    for entry in eparse.ReadEprimeLogFile(logfile):
+        n += 1
+    return n, time.time() - start
+
+
+def CountLeaves(frame):
+    """Number of innermost frames (ie, table rows) below a frame"""
+    if len(frame.subframes) == 0:
+        return 1
+    return sum([CountLeaves(x) for x in frame.subframes])
+
+
+def StageParse(logfile, output):
+    start   = time.time()
+    frames  = eparse.ParseEprimeLogFile(logfile)
+    elapsed = time.time() - start
+    return CountLeaves(frames[0]), elapsed
+
+
+def StageAsTable(logfile, output):
+    frames = eparse.ParseEprimeLogFile(logfile)
+    start  = time.time()
+    table  = frames[0].AsTable()
+    return len(table) - 1, time.time() - start
+
+
+def StagePrintTable(logfile, output):
+    table = eparse.ParseEprimeLogFile(logfile)[0].AsTable()
+    start = time.time()
+    eparse.PrintTable(table, output)
+    return len(table) - 1, time.time() - start
+
+
+def StageStream(logfile, output):
+    start = time.time()
+    n     = [0]
+    def Counted(rows):
+        for row in rows:
+            n[0] += 1
+            yield row
+    eparse.PrintTable(Counted(eparse.IterEprimeRows(logfile)), output, sep="\t")
+    return n[0] - 1, time.time() - start
+
+
+STAGES = (("ReadEprimeLogFile", StageRead),
+          ("ParseEprimeLogFile", StageParse),
+          ("LogFrame.AsTable", StageAsTable),
+          ("PrintTable", StagePrintTable),
+          ("IterEprimeRows (stream)", StageStream))
+
+
+def RunStage(stage, logfile, output, queue):
+    """Runs a stage in a child process and reports rows, time, and memory"""
+    n, elapsed = stage(logfile, output)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0   # KB to MB
+    queue.put((n, elapsed, peak))
+
+
+def Benchmark(logfile, repeat=3):
+    """
+    Times every stage on a log file.  Returns a list of (name, rows,
+    seconds, peak MB) tuples; the time is the best of 'repeat' runs.
+    """
+    output  = tempfile.mktemp(suffix=".txt")
+    results = []
+    for name, stage in STAGES:
+        best = None
+        for r in range(repeat):
+            queue   = multiprocessing.Queue()
+            process = multiprocessing.Process(target=RunStage,
+                                              args=(stage, logfile, output, queue))
+            process.start()
+            n, elapsed, peak = queue.get()
+            process.join()
+            if best is None or elapsed < best[1]:
+                best = (n, elapsed, peak)
+        results.append((name,) + best)
+    if os.path.exists(output):
+        os.remove(output)
+    return results
+
+
+if __name__ == '__main__':
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    if "--help" in options:
+        print HLP_MSG
+        sys.exit(0)
+
+    depth    = int(eparse.Option(options, "depth", 3))
+    trials   = int(eparse.Option(options, "trials", 10000))
+    fields   = int(eparse.Option(options, "fields", 30))
+    branch   = int(eparse.Option(options, "branch", 20))
+    repeat   = int(eparse.Option(options, "repeat", 3))
+    truncate = eparse.Option(options, "truncate")
+    if truncate is not None:
+        truncate = float(truncate)
+    keep     = eparse.Option(options, "keep")
+
+    logfile  = keep or tempfile.mktemp(suffix=".txt")
+    GenerateLog(logfile, depth=depth, trials=trials, fields=fields, branch=branch,
+                truncate=truncate, utf16=("--utf16" in options))
+    size     = os.path.getsize(logfile) / (1024.0 * 1024.0)
+
+    print "Log: %d trials, depth %d, %d fields, %.1f MB" % (trials, depth, fields, size)
+    print "%-26s %10s %10s %12s %10s" % ("Stage", "Rows", "Secs", "Rows/sec", "Peak MB")
+    for name, n, elapsed, peak in Benchmark(logfile, repeat=repeat):
+        print "%-26s %10d %10.3f %12.0f %10.1f" % (name, n, elapsed,
+                                                   n / max(elapsed, 1e-9), peak)
+    if keep is None:
+        os.remove(logfile)
@@ -53,17 +53,19 @@ where each row is a stimulus and each column an attribute
 (much like what you see in the EDAT program).
 ------------------------------------------------------------
 Notes:
-* Eparse.py only accepts ASCII-formatted text output.
-  Starting with Eprime 2.0, log files are encoded in UTF-16
-  format; you need to convert them back to ascii before
-  running eparse.  On Unix/Linux, the easiest way to do so
-  is by using iconv:
-
-  $ iconv -f utf-16 -t ascii <inputfile> > <outputfile>
+* Eparse.py accepts both ASCII-formatted text output and
+  the UTF-16 logs written by Eprime 2.0 and later.  The
+  encoding is detected automatically, so there is no need
+  to convert the files with iconv first.
 ------------------------------------------------------------
 Usage:
 
-  $ eparse.py [-<separator>] <eprime file> <output table>
+  $ eparse.py [--stream] [-<separator>] <eprime file> <output table>
+  $ eparse.py --batch [--processes=<n>] [-<separator>] <logs> <output dir>
+  $ eparse.py --merge [--processes=<n>] <logs> <store dir>
+  $ eparse.py --headers [-<separator>] <logs> <output table>
+  $ eparse.py --follow [--check-rt=<columns>] [--timeout=<secs>]
+              [-<separator>] <eprime file> <output table or ->
 
 Where:
 * [separator] (optional) is any character that will be used
@@ -74,10 +76,60 @@ Where:
   script will generate column-formatted files.
 * [eprime file]  is the log file generated by the Eprime
   script.
-* [output table] is the name of the output file.
+* [output table] is the name of the output file.  If its
+  name ends in '.npz', the table is saved as a (NumPy)
+  columnar file instead, with integer columns for onsets,
+  RTs, and accuracies.  See LoadColumnar().
+* --stream (optional) writes rows while the log is being read,
+  without building the whole LogFrame tree in memory.  Rows
+  are separated by tabs unless a separator is given.
+* --batch converts all the logs in a directory (or matching
+  a quoted glob pattern, like "logs/*-1.txt") in parallel.
+  Each log gets a table in <output dir>, and all the tables
+  are merged in <output dir>/study.tsv, with the log's name
+  in the first column.  Files that cannot be parsed are
+  reported, and do not stop the batch.  Tables are tab-
+  separated unless a separator is given; --processes sets
+  the number of parallel processes (default: one per CPU).
+* Parsed tables are cached in ~/.eparse-cache (or in the
+  directory named by the EPARSE_CACHE environment variable,
+  or by --cache-dir=<dir>), keyed by the content of the log
+  file.  Unchanged logs are not parsed again.  The cache is
+  limited to 512MB, removing the least recently used tables
+  first.  --no-cache always parses the logs.  Streamed tables
+  (--stream) are never cached.
+* --merge parses all the logs of a study (a directory or a
+  glob pattern) into a single store: a directory with one
+  columnar .npz file per subject, plus an index of subjects
+  and the merged schema.  Every row starts with the subject
+  and session from its log's header.  See LoadStore().
+* --headers reads only the headers of the logs in a directory
+  (or matching a glob pattern), and writes a table with one
+  row per log (subject, session, date, experiment, ...).
+* --follow reads a log while the experiment is running, and
+  writes every trial (with the header fields) as soon as it
+  is logged; use '-' as output table to print the trials.
+  It stops when the session ends, or after --timeout seconds
+  without new lines.  --check-rt takes a comma-separated list
+  of columns (e.g., Probe.RT) whose values are checked as
+  trials come in; values more than 3 SD away from the mean
+  of the previous trials are reported.
+* --columns=<list> keeps only the fields in a comma-separated
+  list of names or glob patterns, dropping the others as the
+  log is read.  For example:
+
+  $ eparse.py --columns="Subject,Block*,*.OnsetTime,*.RT" ...
 """
 
-import os.path, types, sys, os
+import os.path, types, sys, os, codecs, struct, zipfile, glob, time, math
+import multiprocessing, multiprocessing.pool, hashlib, cPickle, fnmatch
+
+try:
+    import numpy
+except ImportError:
+    numpy = None      # Only needed for columnar (.npz) output
+
+CHUNK_SIZE = 1 << 20   # Bytes read (and decoded) at the time
 
 
 def ToString(obj, floatPrecision=5, fNone=False):
@@ -105,33 +157,277 @@ def ColumnWidths(table):
 
 def PrintTable(table, outputFile, sep=None, spaceBetweenColumns=2, flush='left'):
     """
-    Prints a table as a grid
+    Prints a table as a grid.  When a separator is given, the table
+    can be any iterable of rows (e.g., the IterEprimeRows generator).
     """
-    widths = [x + spaceBetweenColumns for x in ColumnWidths(table)]
     out    = file(outputFile, 'w')
     
     if sep == None:
+        # Each cell is converted only once, and reused for the widths
+        table  = [[ToString(y) for y in x] for x in table]
+        widths = [x + spaceBetweenColumns for x in ColumnWidths(table)]
         for row in table:
             if (flush == 'right' or flush == 'r'):
-                map(lambda field, len: out.write(ToString(field).ljust(len)), row, widths)
+                out.write("".join(map(lambda field, len: field.ljust(len), row, widths)))
             else:
-                map(lambda field, len: out.write(ToString(field).ljust(len)), row, widths)
+                out.write("".join(map(lambda field, len: field.ljust(len), row, widths)))
             out.write('\n')
 
     else:
         for row in table:
-            for col in row[:-1]:
-                out.write(ToString(col)+sep)
-            out.write(ToString(row[-1])+"\n")
+            out.write(sep.join([ToString(col) for col in row]) + "\n")
     out.close()
 
 
+## ---------------------------------------------------------------- ##
+## COLUMNAR OUTPUT                                                  ##
+## ---------------------------------------------------------------- ##
+## Tables can also be saved as uncompressed NumPy .npz files, with  ##
+## one typed array per column.  Timing columns (onsets, RTs and     ##
+## accuracies) become integer arrays; all the others are stored as  ##
+## categorical columns (integer codes plus a table of categories).  ##
+## Since the archive is not compressed, LoadColumnar can memory-map ##
+## each column directly from the file instead of re-reading text.   ##
+## ---------------------------------------------------------------- ##
+INT_COLUMNS = (".OnsetTime", ".RT", ".ACC")
+MISSING_INT = -2147483648   # Empty cells in integer columns
+
+
+class CategoricalColumn:
+    """A column of strings, stored as codes into a list of categories"""
+    def __init__(self, codes, categories):
+        self.codes      = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return "<CategoricalColumn, %d values, %d categories>" % (len(self.codes), len(self.categories))
+
+    def Decode(self):
+        """Returns the column as an array of strings"""
+        return self.categories.take(self.codes)
+
+
+def IntColumn(values):
+    """
+    Converts a list of values into an integer array, or returns None
+    if some of the values are not integers.
+    """
+    ints = []
+    try:
+        for v in values:
+            if v is None or v == "":
+                ints.append(MISSING_INT)
+            else:
+                ints.append(int(v))
+    except ValueError:
+        return None
+    if len(ints) > 0 and max(ints) > 2147483647:
+        return numpy.array(ints, dtype=numpy.int64)
+    return numpy.array(ints, dtype=numpy.int32)
+
+
+def SaveColumnar(table, outputFile):
+    """
+    Saves a table (any iterable of rows, the first one being the
+    column names) as an uncompressed .npz file.
+    """
+    if numpy is None:
+        raise Exception, "NumPy is required to save columnar tables"
+    
+    rows    = iter(table)
+    names   = [ToString(x) for x in rows.next()]
+    columns = [[] for x in names]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+
+    arrays  = {'names' : numpy.array(names, dtype=str)}
+    for i, name in enumerate(names):
+        values = columns[i]
+        array  = None
+        if name.endswith(INT_COLUMNS):
+            array = IntColumn(values)
+        if array is not None:
+            arrays["c%d" % i] = array
+        else:
+            index = {}
+            codes = [index.setdefault(ToString(v), len(index)) for v in values]
+            categories = sorted(index.keys(), key=index.get)
+            arrays["c%d" % i] = numpy.array(codes, dtype=numpy.int32)
+            arrays["c%d_categories" % i] = numpy.array(categories, dtype=str)
+        columns[i] = None   # Free the memory as we go
+    numpy.savez(outputFile, **arrays)
+
+
+def MapNpyMember(filename, info):
+    """
+    Memory-maps an array stored (uncompressed) inside a .npz file
+    """
+    input = open(filename, 'rb')
+    try:
+        input.seek(info.header_offset)
+        local = input.read(30)
+        nameLen, extraLen = struct.unpack("<HH", local[26:30])
+        input.seek(info.header_offset + 30 + nameLen + extraLen)
+        version = numpy.lib.format.read_magic(input)
+        if version == (1, 0):
+            shape, fortran, dtype = numpy.lib.format.read_array_header_1_0(input)
+        else:
+            shape, fortran, dtype = numpy.lib.format.read_array_header_2_0(input)
+        offset = input.tell()
+    finally:
+        input.close()
+
+    if reduce(lambda x, y: x * y, shape, 1) == 0:
+        return numpy.zeros(shape, dtype=dtype)    # Nothing to map
+    order = 'C'
+    if fortran:
+        order = 'F'
+    return numpy.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                        order=order, offset=offset)
+
+
+def LoadColumnar(filename, mmap=True, columns=None):
+    """
+    Loads a table saved by SaveColumnar.  Returns the list of column
+    names and a list of columns (integer arrays or CategoricalColumn
+    objects).  If 'mmap' is True, columns are memory-mapped.  If a
+    list of 'columns' (names or glob patterns) is given, only the
+    matching columns are read.
+    """
+    if numpy is None:
+        raise Exception, "NumPy is required to load columnar tables"
+
+    archive = zipfile.ZipFile(filename)
+    members = dict([(info.filename[:-4], info) for info in archive.infolist()])
+
+    def Load(key):
+        info = members[key]
+        if mmap and info.compress_type == zipfile.ZIP_STORED:
+            return MapNpyMember(filename, info)
+        else:
+            return numpy.lib.format.read_array(archive.open(info))
+
+    try:
+        names = [str(x) for x in Load('names')]
+        keep  = range(len(names))
+        if columns is not None:
+            match = ColumnFilter(columns).Keep
+            keep  = [i for i in keep if match(names[i])]
+
+        result = []
+        for i in keep:
+            if "c%d_categories" % i in members:
+                result.append(CategoricalColumn(Load("c%d" % i),
+                                                Load("c%d_categories" % i)))
+            else:
+                result.append(Load("c%d" % i))
+    finally:
+        archive.close()
+    return [names[i] for i in keep], result
+
+
+## ---------------------------------------------------------------- ##
+## SCHEMA                                                           ##
+## ---------------------------------------------------------------- ##
+## The names of the fields found at each level of a log file.       ##
+## Fields are indexed by a dictionary as soon as they are found,    ##
+## and the (sorted) column order is computed only when it is first  ##
+## requested.  A Schema can be indexed by level, just like the old  ##
+## 'levelFields' dictionary of sorted lists.                        ##
+## ---------------------------------------------------------------- ##
+class Schema:
+    """The fields of each level of a log file"""
+    def __init__(self):
+        self.index  = {}    # Level -> {field : position of first appearance}
+        self.fields = {}    # Level -> fields, in order of appearance
+        self.order  = {}    # Level -> sorted fields (cached)
+        self.pos    = {}    # Level -> positions of the sorted fields (cached)
+
+    def __repr__(self):
+        return "<Schema, %s>" % ", ".join(["Level %d: %d fields" % (x, len(self.fields[x]))
+                                            for x in self.Levels()])
+
+    def __getitem__(self, level):
+        return self.Fields(level)
+
+    def __contains__(self, level):
+        return level in self.fields
+
+    def Levels(self):
+        """Returns the list of known levels"""
+        return sorted(self.fields.keys())
+
+    def AddLevel(self, level):
+        """Makes sure a level is known, even if it has no fields"""
+        if not level in self.fields:
+            self.index[level]  = {}
+            self.fields[level] = []
+
+    def Add(self, level, key):
+        """
+        Adds a field to a level (if it is not there yet), and returns
+        its position in order of appearance.
+        """
+        index = self.index[level]
+        if key in index:
+            return index[key]
+        else:
+            key = intern(key)
+            index[key] = len(self.fields[level])
+            self.fields[level].append(key)
+            if level in self.order:
+                del self.order[level]
+                del self.pos[level]
+            return index[key]
+
+    def Position(self, level, key):
+        """Position of a field in order of appearance, or None"""
+        return self.index[level].get(key)
+
+    def Fields(self, level):
+        """Returns the sorted list of fields of a level"""
+        if not level in self.order:
+            self.order[level] = sorted(self.fields[level])
+            self.pos[level]   = [self.index[level][x] for x in self.order[level]]
+        return self.order[level]
+
+    def Positions(self, level):
+        """Returns the positions of the sorted fields of a level"""
+        self.Fields(level)
+        return self.pos[level]
+
+    def Merge(self, other):
+        """Adds all the levels and fields of another schema"""
+        for level in other.Levels():
+            self.AddLevel(level)
+            for key in other.fields[level]:
+                self.Add(level, key)
+
+    def Names(self, levels=None):
+        """Returns the column names of a set of levels (by default, all)"""
+        if levels is None:
+            levels = self.Levels()
+        names = []
+        for level in levels:
+            names.extend(self.Fields(level))
+        return names
+
+
 ## ---------------------------------------------------------------- ##
 ## LOG FRAME                                                        ##
 ## ---------------------------------------------------------------- ##
 ## An internal representation of a LogFrame                         ##
 ## ---------------------------------------------------------------- ##
-class LogFrame:
+## A log file can contain tens of thousands of LogFrames, so they   ##
+## are kept as small as possible: no per-instance dictionary, and   ##
+## values stored in a list whose positions are given by the level   ##
+## Schema (the keys themselves are stored, interned, only once).    ##
+## ---------------------------------------------------------------- ##
+class LogFrame(object):
     """
     That's the basic component of Eprime files.  
     Hope springs eternal.
@@ -139,14 +435,20 @@ class LogFrame:
     #PROTECTED_FIELDS = ("Running", "Type")
     PROTECTED_FIELDS = ()
 
+    __slots__ = ('level', 'levelName', 'levelFields', 'index', 'values', 'subframes')
+
     def __init__(self, level, index=None, levelName=None, levelFields=None):
         self.level     = int(level)   # Make sure it's an int.
-        self.dict      = {}           # Internal dictionary.
-        self.subframes = []           # List of subframes.
+        self.values    = []           # Values, by position in the schema.
+        self.subframes = ()           # Subframes (a list once one is added).
         if levelName == None:
             self.levelName = "Level%d" % self.level
         else:
             self.levelName = levelName
+        if levelFields == None:
+            # A frame outside of the main tree (e.g., the header)
+            levelFields = Schema()
+        levelFields.AddLevel(self.level)
         self.levelFields = levelFields
         self.index = index
 
@@ -155,29 +457,31 @@ class LogFrame:
 
     def __repr__(self):
         return self.__str__()
+
+    def Get(self, key, default=None):
+        """Returns the value of a key, or 'default' if it is not set"""
+        pos = self.levelFields.Position(self.level, key)
+        if pos is None or pos >= len(self.values) or self.values[pos] is None:
+            return default
+        return self.values[pos]
+
+    @property
+    def dict(self):
+        """The values of this frame, as a dictionary"""
+        fields = self.levelFields.fields[self.level]
+        return dict([(fields[i], v) for i, v in enumerate(self.values) if v is not None])
         
     def Values(self, recursive=True):
         """
         Returns a table containing all the values, 
         recursively transversing the sub-frames
         """
-        myvals = []
-
-        for field in self.Names(recursive=False):
-            if field in self.dict.keys():
-                myvals.append(self.dict[field])
-            else:
-                myvals.append(None)
-        
-        #print self.Names()
-        #for field in self.Names():
-        #    if field in self.dict.keys():
-        #        myvals.append(self.dict[field])
-        #    else:
-        #       myvals.append(None)
+        vals   = self.values
+        n      = len(vals)
+        myvals = [vals[p] if p < n else None
+                  for p in self.levelFields.Positions(self.level)]
 
         if len(self.subframes) == 0 or not recursive:
-            #return [self.dict.values()]
             return [myvals]
 
         else:
@@ -194,12 +498,9 @@ class LogFrame:
         nested logframes.
         """
         mynames = self.levelFields[self.level]
-        mynames
         if len(self.subframes) == 0 or not recursive:
-            #return self.dict.keys()
             return mynames
         else:
-            #return self.dict.keys() + self.subframes[0].Names()
             return mynames + self.subframes[0].Names()
 
 
@@ -212,14 +513,18 @@ class LogFrame:
 
     def Add(self, key, value, line=None):
         """
-        Adds a key : attribute pair to the internal dictionary
+        Adds a key : attribute pair to the frame (and, if needed, the
+        key to the level schema)
         """
-        if self.dict.has_key(key):
+        if key in LogFrame.PROTECTED_FIELDS:
+            key = "%s[%s]" % (key, self.levelName)
+        pos = self.levelFields.Add(self.level, key)
+        if pos < len(self.values) and self.values[pos] is not None:
             print "Warning: Key '%s' already used in logframe (line %s)" % (key, line) 
-        elif key in LogFrame.PROTECTED_FIELDS:
-            self.dict["%s[%s]" % (key, self.levelName)] = value
         else:
-            self.dict[key] = value
+            if pos >= len(self.values):
+                self.values.extend([None] * (pos + 1 - len(self.values)))
+            self.values[pos] = value
 
 
     def AddLogFrame(self, lf):
@@ -231,9 +536,18 @@ class LogFrame:
         if self.level != (lf.level - 1):
             raise Exception, "Cannot add a logframe if not to an immediate ancestor"
         else:
+            if len(self.subframes) == 0:
+                self.subframes = []
             self.subframes.append(lf)
 
 
+    def SetLogFrames(self, frames):
+        """
+        Sets all the subframes at once (used when a frame is closed)
+        """
+        self.subframes = frames
+
+
     def InsertLogFrame(self, lf):
         """
         Inserts a log frame in the first position
@@ -241,6 +555,8 @@ class LogFrame:
         if self.level != (lf.level - 1):
             raise Exception, "Cannot add a logframe if not to an immediate ancestor"
         else:
+            if len(self.subframes) == 0:
+                self.subframes = []
             self.subframes.insert(0, lf)
 
 
@@ -265,27 +581,157 @@ class EprimeLogEntry:
         return "<%s:%s>" % (self.key, self.command)
  
 
+## ---------------------------------------------------------------- ##
+## READ LOG LINES                                                   ##
+## ---------------------------------------------------------------- ##
+## Eprime 2.0 and later write their logs in UTF-16.  Instead of     ##
+## asking users to convert them with iconv, the encoding is guessed ##
+## from the first bytes and the file is decoded incrementally, one  ##
+## large chunk at the time.  Lines are returned as UTF-8 strings,   ##
+## so the rest of the parser does not need to know about encodings. ##
+## ---------------------------------------------------------------- ##
+def DetectEncoding(data):
+    """
+    Guesses the encoding of a log file from its first bytes. Returns
+    None for plain ASCII (or any other 8-bit) files.
+    """
+    if data.startswith(codecs.BOM_UTF16_LE) or data.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    elif data.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    elif len(data) > 1 and data[0] != "\x00" and data[1] == "\x00":
+        return "utf-16-le"     # UTF-16 without BOM
+    elif len(data) > 1 and data[0] == "\x00" and data[1] != "\x00":
+        return "utf-16-be"
+    else:
+        return None
+
+
+def ReadLogLines(file, chunkSize=CHUNK_SIZE, follow=False, interval=1.0, timeout=None):
+    """
+    Generator that yields the lines of a log file (with their line
+    terminators removed), decoding UTF-16 files on the fly.
+
+    In 'follow' mode, the end of the file is not the end of the log:
+    the file is checked again every 'interval' seconds for new lines
+    (like 'tail -f'), until nothing is appended for 'timeout' seconds
+    (or forever, if 'timeout' is None).
+    """
+    input = open(file, 'rb')
+    try:
+        chunk    = input.read(chunkSize)
+        idle     = 0.0
+        while follow and len(chunk) < 2:
+            # Wait for enough bytes to guess the encoding
+            if timeout is not None and idle >= timeout:
+                break
+            time.sleep(interval)
+            idle += interval
+            more  = input.read(chunkSize)
+            if more != "":
+                idle = 0.0
+            chunk += more
+        encoding = DetectEncoding(chunk)
+        decoder  = None
+        if encoding is not None:
+            decoder = codecs.getincrementaldecoder(encoding)()
+        rest = ""
+        while True:
+            if chunk == "":
+                if not follow or (timeout is not None and idle >= timeout):
+                    break
+                time.sleep(interval)
+                idle += interval
+                chunk = input.read(chunkSize)
+                continue
+            idle = 0.0
+            if decoder is not None:
+                chunk = decoder.decode(chunk).encode('utf-8')
+            lines = (rest + chunk).split("\n")
+            rest  = lines.pop()
+            for line in lines:
+                yield line
+            chunk = input.read(chunkSize)
+        if decoder is not None:
+            rest += decoder.decode("", True).encode('utf-8')
+        if rest != "":
+            yield rest
+    finally:
+        input.close()
+
+
+## ---------------------------------------------------------------- ##
+## COLUMN FILTER                                                    ##
+## ---------------------------------------------------------------- ##
+## Most analyses need only a handful of the hundreds of attributes  ##
+## in a log.  A ColumnFilter decides which fields to keep, given a  ##
+## list of names or glob patterns (e.g., '*.RT' or 'Block*'), and   ##
+## remembers its decision for each field.                           ##
+## ---------------------------------------------------------------- ##
+STRUCTURAL_FIELDS = ("Level", "LevelName")   # Always kept
+
+
+class ColumnFilter:
+    """A whitelist of field names and glob patterns"""
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.cache    = {}
+        for x in STRUCTURAL_FIELDS:
+            self.cache[x] = True
+
+    def __repr__(self):
+        return "<ColumnFilter, %s>" % ", ".join(self.patterns)
+
+    def Keep(self, key):
+        """True if a field matches any of the patterns"""
+        try:
+            return self.cache[key]
+        except KeyError:
+            keep = False
+            for pattern in self.patterns:
+                if fnmatch.fnmatchcase(key, pattern):
+                    keep = True
+                    break
+            self.cache[key] = keep
+            return keep
+
+
 ## ---------------------------------------------------------------- ##
 ## READ EPRIME LOG FILE                                             ##
 ## ---------------------------------------------------------------- ##
 ## A quick and simple generator that yields an entry for each line  ##
 ## of the original Eprime log .txt file.                            ##
 ## ---------------------------------------------------------------- ##
-def ReadEprimeLogFile(file):
+def ReadEprimeLogFile(file, follow=False, interval=1.0, timeout=None, columns=None,
+                      chunkSize=CHUNK_SIZE):
     """
     Reads and Eprime log file, returning an Entry at the time
-    by means of a generator
+    by means of a generator.  In 'follow' mode, the file is
+    expected to grow while it is read (see ReadLogLines).
+    If a list of 'columns' (names or glob patterns) is given,
+    only the fields that match are returned.
     """
+    keep = None
+    if columns is not None:
+        keep = ColumnFilter(columns).Keep
+
     if (os.path.exists(file)):
         num   = 1
         data  = None
-        input = open(file, 'r')
-        line  = input.readline().strip()
 
-        while line != '':   # ie, 'til the end of the file. 
+        for line in ReadLogLines(file, chunkSize=chunkSize, follow=follow,
+                                 interval=interval, timeout=timeout):
+            line = line.strip()
+            if line == '':   # ie, 'til the end of the file. 
+                if follow:
+                    num += 1
+                    continue
+                break
+
             if ( line.find(":") >= 0 ):
                 data = [x.strip() for x in line.split(":")]
-                yield EprimeLogEntry(data[0], data[1], num)
+                if keep is None or keep(data[0]):
+                    yield EprimeLogEntry(data[0], data[1], num)
 
             elif ( line.startswith("***") and line.endswith("***") ):
                 #print "Line: ", line
@@ -293,7 +739,6 @@ def ReadEprimeLogFile(file):
                 yield EprimeLogEntry(data[0], data[1], num, logframe=True)
 
             # Proceed with line
-            line = input.readline().strip()
             num += 1
         return
 
@@ -304,10 +749,12 @@ def ReadEprimeLogFile(file):
 ## Parses the logfile, progressively creating logframes, and adding ##
 ## the read entries to the current logframe.                        ##
 ## ---------------------------------------------------------------- ##
-def ParseEprimeLogFile(file):
+def ParseEprimeLogFile(file, columns=None):
     """
     Parses an Eprime log file and returns all the entries as 
-    a nested structure of LogFrames 
+    a nested structure of LogFrames.  If a list of 'columns'
+    (names or glob patterns) is given, all the other fields
+    are dropped as soon as they are read.
     """
     cLogFrame = None
     LogFrames = []
@@ -315,9 +762,9 @@ def ParseEprimeLogFile(file):
     hLogFrame = None
     levelNameCounter = 1
     levelNames       = {}
-    levelFields      = {}
+    levelFields      = Schema()
     levelCounters    = {}
-    for command in ReadEprimeLogFile(file):
+    for command in ReadEprimeLogFile(file, columns=columns):
         if command.logframe:
             if command.key == "Header":
                 # Ignore header information
@@ -338,27 +785,9 @@ def ParseEprimeLogFile(file):
 
                 elif command.value == "End":
                     # If it's an End, let's just close the LogFrame and save it.
-                    levels = [x.level for x in LogFrames]
-                    cLogFrame.Add(cLogFrame.levelName, levels.count(cLogFrame.level)+1, command.line)
-                    
-                    if (len(LogFrames) > 0):
-                        if cLogFrame.level >= LogFrames[-1].level:
-                            LogFrames.append(cLogFrame)
-
-                        else:
-                            i = len(LogFrames) - 1
-                            while i >= 0:
-                                if (LogFrames[i].level > cLogFrame.level):
-                                    cLogFrame.InsertLogFrame(LogFrames[i])
-                                    i -= 1
-                                else:
-                                    break
-                            LogFrames[i+1:] = []
-                            LogFrames.append(cLogFrame)
-                                
-                    else:
-                        LogFrames.append(cLogFrame)
-
+                    # LogFrames works as a stack: the frame adopts all the
+                    # deeper frames on top of it (Eprime logs children first).
+                    CloseLogFrame(cLogFrame, LogFrames, levelCounters)
                     cLogFrame = None
                 else:
                     raise Exception, "Unknown LogFrame value %s at line %s" % (command.value, command.line)
@@ -373,11 +802,9 @@ def ParseEprimeLogFile(file):
         elif command.key == "Level":
             # If we have a "Level" command, then we need to start a new LogFrame
             if cLogFrame == None:
-                cLogFrame = LogFrame(command.value)
-                cLogFrame.levelName = levelNames[cLogFrame.level]
-                if not int(command.value) in levelFields.keys(): 
-                    levelFields[int(command.value)] = []
-                cLogFrame.levelFields = levelFields
+                level     = int(command.value)
+                cLogFrame = LogFrame(level, levelName=levelNames[level],
+                                     levelFields=levelFields)
 
             else:
                 raise Exception, "New level when previous LogFrame not yet closed, %s" % command.line
@@ -387,21 +814,41 @@ def ParseEprimeLogFile(file):
                 #print "Hello!-%s-%s-%d" % (command.key, command.value, command.line)
                 hLogFrame.Add(command.key, command.value, command.line)
             else:
-                # First, check the corresponding level field names.
-                #print "Parsed command", command.key, command.value
-                if not command.key in levelFields[cLogFrame.level]:
-                    #print "Adding Field %s to level %d" % (command.key, cLogFrame.level)
-                    levelFields[cLogFrame.level].append(command.key)
-                    levelFields[cLogFrame.level].sort()
-                    #print levelFields
-                    
+                # The frame also adds the key to the level field names.
                 cLogFrame.Add(command.key, command.value, command.line)
 
+    if cLogFrame != None:
+        print "Discarding unfinished logframe %s" % cLogFrame
+
     #print levelNames
     hLogFrame.levelName = levelNames[1]
     #print levelFields
     #print "Total fields", len(levelFields[1]) + len(levelFields[2]) +len(levelFields[3])
-    return CheckLogFrames(LogFrames, hLogFrame)
+    return CheckLogFrames(LogFrames, hLogFrame, levelNames, levelCounters)
+
+
+def CloseLogFrame(logFrame, logFrames, levelCounters):
+    """
+    Closes a LogFrame: assigns its index within its parent, makes it
+    adopt the (deeper) frames at the top of the 'logFrames' stack,
+    and pushes it on the stack.  Runs in time proportional to the
+    number of adopted frames.
+    """
+    # Counters of the deeper levels restart with each parent
+    level = logFrame.level
+    levelCounters[level] = levelCounters.get(level, 0) + 1
+    for x in levelCounters.keys():
+        if x > level:
+            levelCounters[x] = 0
+    logFrame.index = levelCounters[level]
+
+    i = len(logFrames)
+    while i > 0 and logFrames[i-1].level > level:
+        i -= 1
+    if i < len(logFrames):
+        logFrame.SetLogFrames(logFrames[i:])
+        del logFrames[i:]
+    logFrames.append(logFrame)
 
 
 
@@ -411,66 +858,834 @@ def ParseEprimeLogFile(file):
 # Check the log frame tree structure and attempts a recovery if the  #
 # script broke and some blocks/trials are missing                    #
 # ------------------------------------------------------------------ #
-def CheckLogFrames(logFrames, header):
+def CheckLogFrames(logFrames, header, levelNames={}, levelCounters=None):
     """
     Checks a list of LogFrames for consistentcy.  This is useful when the log file
     is incomplete because Eprime broke (it happens, it happens...)
+
+    In a complete log, only the Session frame is left on the stack.  Otherwise,
+    the missing parent frames are synthesized (from the innermost level up), so
+    that all the completed trials are kept.  The new Session frame gets the
+    values of the header.
     """
     if len(logFrames) > 0:
         if logFrames[-1].level == 1:
             return logFrames
         else:
             print "Broken script, attempting recovery"
-            last = logFrames[-1].level
-            indexes = range(len(logFrames)-1,-1,-1)
-            for i in indexes:
-                # The recovery function just safely deletes all the trials
-                # that cannot be assigned to an intermediate sub-block.
-                #
-                # An alternative strategy would be to create dummy logframes
-                # to wrap up and save the last trials.  This, however, can 
-                # be rather tricky.
-                print "Checking logframe %s in position %d" % (logFrames[i], i)
-                if logFrames[i].level == 2:
-                    break
+            if levelCounters is None:
+                levelCounters = {}
+                for frame in logFrames:
+                    levelCounters[frame.level] = levelCounters.get(frame.level, 0) + 1
+            schema  = logFrames[-1].levelFields
+            deepest = max([x.level for x in logFrames])
+            for level in range(deepest - 1, 0, -1):
+                if logFrames[-1].level <= level:
+                    continue
+                parent = LogFrame(level, levelName=levelNames.get(level),
+                                  levelFields=schema)
+                if level == 1 and header != None:
+                    for key in header.levelFields.fields[header.level]:
+                        parent.Add(key, header.Get(key))
+                CloseLogFrame(parent, logFrames, levelCounters)
+                print "Created %s for %d orphan logframes" % (parent, len(parent.subframes))
+        return logFrames
+
+
+# ------------------------------------------------------------------ #
+# ITER EPRIME ROWS                                                   #
+# ------------------------------------------------------------------ #
+# A streaming alternative to ParseEprimeLogFile. Eprime writes the   #
+# innermost LogFrames first and their parents afterwards, so closed  #
+# frames are kept only until their ancestor at 'flushLevel' closes.  #
+# At that point their rows are flattened, yielded and forgotten.     #
+# ------------------------------------------------------------------ #
+def IterEprimeRows(file, names=None, flushLevel=2, follow=False,
+                   interval=1.0, timeout=None, columns=None, levels=None):
+    """
+    Parses an Eprime log file in a single pass, yielding the column
+    names first and then one flattened row per innermost LogFrame.
+
+    Rows are produced as soon as the enclosing frame at 'flushLevel'
+    (by default, the block) closes, so memory does not grow with the
+    length of the session.  Each row holds the header values followed
+    by the values of the frames from 'flushLevel' down to the trial.
+    Frames above 'flushLevel' (normally the Session frame, which
+    Eprime writes last) are not part of the rows.  If 'flushLevel' is
+    None, it is set to the level of the first frame that closes (ie,
+    the trials), so that every trial is yielded as soon as it ends.
+
+    If 'names' is not given, the column schema is fixed when the first
+    rows are flushed, using the fields seen so far. Later fields that
+    are not part of the schema are dropped.
+
+    In 'follow' mode the log is read while the experiment is still
+    writing it (see ReadLogLines), and the generator ends when the
+    top-level (Session) frame closes.
+
+    If a list of 'columns' (names or glob patterns) is given, all
+    the other fields are dropped as soon as they are read.  If a
+    'levels' list is given, the (level, key) of each column is added
+    to it when the schema is fixed.
+    """
+    header     = True
+    hValues    = {}
+    levelNames = {}
+    fields     = Schema()
+    counters   = {}     # Level -> number of closed frames since parent
+    pending    = []     # Closed frames (level, values, children)
+    current    = None
+    layout     = None   # List of (level, key) pairs
+
+    def Flatten(frame, context):
+        """Yields one chain (level -> values) per leaf of a frame"""
+        level, values, children = frame
+        chain = context.copy()
+        chain[level] = values
+        if len(children) == 0:
+            yield chain
+        else:
+            for child in children:
+                for leaf in Flatten(child, chain):
+                    yield leaf
+
+    def Layout():
+        """Freezes the (level, key) pairs of the output columns"""
+        levels = [0] + [x for x in fields.Levels() if x >= flushLevel]
+        known  = {0 : sorted(hValues.keys())}
+        for level in levels[1:]:
+            known[level] = fields.Fields(level)
+        if names is None:
+            pairs = []
+            for level in levels:
+                pairs.extend([(level, key) for key in known[level]])
+            return pairs
+        else:
+            # Explicit names are taken from the innermost level that has them
+            pairs = []
+            for name in names:
+                match = [x for x in levels if (x == 0 and name in hValues) or
+                         (x > 0 and fields.Position(x, name) is not None)]
+                if len(match) > 0:
+                    pairs.append((match[-1], name))
                 else:
-                    logFrames.pop()
-            
-            i = len(logFrames) - 1
-            while i >= 0:
-                if (logFrames[i].level > header.level):
-                    header.InsertLogFrame(logFrames[i])
+                    pairs.append((None, name))
+            return pairs
+
+    def Rows(frame):
+        """Flattens a frame into rows that follow the layout"""
+        for chain in Flatten(frame, {0 : hValues}):
+            yield [chain.get(level, {}).get(key) for level, key in layout]
+
+    for command in ReadEprimeLogFile(file, follow=follow, interval=interval,
+                                     timeout=timeout, columns=columns):
+        if command.logframe:
+            if command.key == "Header":
+                header = (command.value == "Start")
+
+            elif command.key == "LogFrame" and command.value == "End":
+                if current is None:
+                    raise Exception, "LogFrame closed before being opened, %s" % command.line
+                level, values = current
+                current = None
+                if flushLevel is None:
+                    flushLevel = level
+
+                # Counters of the deeper levels restart with each parent
+                counters[level] = counters.get(level, 0) + 1
+                for x in counters.keys():
+                    if x > level:
+                        counters[x] = 0
+                values[levelNames.get(level, "Level%d" % level)] = counters[level]
+
+                i = len(pending)
+                while i > 0 and pending[i-1][0] > level:
                     i -= 1
-                else:
-                    break
-                logFrames[i+1:] = []
-                logFrames.append(header)
-        return logFrames
+                frame = (level, values, pending[i:])
+                pending[i:] = []
+
+                if level > flushLevel:
+                    pending.append(frame)
+                elif level == flushLevel or len(frame[2]) > 0:
+                    if layout is None:
+                        layout = Layout()
+                        if levels is not None:
+                            levels.extend(layout)
+                        yield [key for level, key in layout]
+                    for row in Rows(frame):
+                        yield row
+
+                if follow and level == 1:
+                    return    # The session is over
+
+        elif command.key == "LevelName":
+            levelNames[len(levelNames) + 1] = command.value
+
+        elif command.key == "Level":
+            if current is None:
+                current = (int(command.value), {})
+                fields.AddLevel(current[0])
+            else:
+                raise Exception, "New level when previous LogFrame not yet closed, %s" % command.line
+
+        elif header:
+            hValues[command.key] = command.value
+
+        elif current is not None:
+            fields.Add(current[0], command.key)
+            current[1][command.key] = command.value
+
+    # If the session broke, the frames that were completed but never
+    # got their parent are flushed as they are.
+    if layout is None:
+        layout = Layout()
+        if levels is not None:
+            levels.extend(layout)
+        yield [key for level, key in layout]
+    for frame in pending:
+        for row in Rows(frame):
+            yield row
+
+
+# ------------------------------------------------------------------ #
+# PARSE CACHE                                                        #
+# ------------------------------------------------------------------ #
+# Parsed tables are kept on disk, keyed by a hash of the content of  #
+# the log file and of the parser version, so that logs that did not  #
+# change are never parsed twice.  The cache has a maximum size; when #
+# it is exceeded, the least recently used tables are removed.        #
+# ------------------------------------------------------------------ #
+PARSER_VERSION = "4"     # Change whenever the parsed tables change
+CACHE_DIR      = os.environ.get("EPARSE_CACHE",
+                                os.path.join(os.path.expanduser("~"), ".eparse-cache"))
+CACHE_SIZE     = 512 * 1024 * 1024
+
+
+class ParseCache:
+    """A size-bounded, least-recently-used cache of parsed tables"""
+    def __init__(self, directory=CACHE_DIR, maxSize=CACHE_SIZE):
+        self.directory = directory
+        self.maxSize   = maxSize
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass   # Somebody else (another process) created it
+
+    def __repr__(self):
+        return "<ParseCache, '%s'>" % self.directory
+
+    def Key(self, file, *options):
+        """
+        Returns the key of a log file: a hash of its content, of the
+        parser version, and of any option that changes the table.
+        """
+        h = hashlib.sha1()
+        h.update("%s|%s|" % (PARSER_VERSION, "|".join([str(x) for x in options])))
+        input = open(file, 'rb')
+        try:
+            chunk = input.read(CHUNK_SIZE)
+            while chunk != "":
+                h.update(chunk)
+                chunk = input.read(CHUNK_SIZE)
+        finally:
+            input.close()
+        return h.hexdigest()
+
+    def Path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def Get(self, key):
+        """Returns the cached (layout, table) for a key, or None"""
+        path = self.Path(key)
+        try:
+            input = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            table = cPickle.load(input)
+        except Exception:
+            table = None   # Truncated or stale entry
+        input.close()
+        if table is not None:
+            try:
+                os.utime(path, None)   # Marks it as recently used
+            except OSError:
+                pass   # Somebody else's entry (e.g., a shared cache)
+        return table
+
+    def Put(self, key, table):
+        """
+        Stores a (layout, table), and evicts old entries if needed.  If the cache
+        cannot be written, the table is simply not cached.
+        """
+        path = self.Path(key)
+        tmp  = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            out = open(tmp, 'wb')
+            try:
+                cPickle.dump(table, out, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                out.close()
+            os.rename(tmp, path)   # Atomic, so readers never see half a file
+            self.Evict()
+        except (IOError, OSError), e:
+            print >> sys.stderr, "Warning: cannot write to the cache in '%s' (%s)" % \
+                  (self.directory, e)
+            if os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def Evict(self):
+        """Removes the least recently used entries above the maximum size"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pickle"):
+                path = os.path.join(self.directory, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+        entries.sort()
+        total = sum([x[1] for x in entries])
+        for mtime, size, path in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def FrameLayout(root):
+    """
+    Returns the (level, field) of each column of a frame's table.
+    The columns follow the first branch of the tree, like Names().
+    """
+    schema = root.levelFields
+    layout = []
+    frame  = root
+    while True:
+        layout.extend([(frame.level, x) for x in schema.Fields(frame.level)])
+        if len(frame.subframes) == 0:
+            return layout
+        frame = frame.subframes[0]
+
+
+def ParseEprimeTable(infile, stream=False, cache=None, columns=None, levels=None):
+    """
+    Parses an Eprime log file into a table (a list of rows, the first
+    one being the column names), using 'cache' if one is given.
+    A 'stream' table is returned as a generator, and is never cached
+    (caching it would mean holding all its rows in memory).  Only the
+    fields that match 'columns' (if given) are kept.  If a 'levels'
+    list is given, the (level, field) of each column is added to it
+    (for a 'stream' table, once its first row has been read).
+    """
+    if levels is None:
+        levels = []
+    if stream:
+        return IterEprimeRows(infile, columns=columns, levels=levels)
+
+    if cache is not None:
+        key   = cache.Key(infile, stream, columns)
+        entry = cache.Get(key)
+        if entry is not None:
+            layout, table = entry
+            levels.extend(layout)
+            return table
+
+    root   = ParseEprimeLogFile(infile, columns=columns)[0]
+    layout = FrameLayout(root)
+    table  = root.AsTable()
+
+    if cache is not None:
+        cache.Put(key, (layout, table))
+    levels.extend(layout)
+    return table
+
+
+def EprimeToTable(infile, outfile, sep=None, stream=False, cache=None, columns=None,
+                  levels=None):
+    """
+    Converts an Eprime log file into a table file.  In 'stream' mode
+    rows are written as they are parsed (this requires a separator,
+    since column-formatted output needs all the rows first).  Output
+    files ending in '.npz' are saved as columnar tables.  If a
+    'levels' list is given, the (level, field) of each column is
+    added to it.
+    """
+    table = ParseEprimeTable(infile, stream=stream, cache=cache, columns=columns,
+                             levels=levels)
+
+    if outfile.endswith(".npz"):
+        SaveColumnar(table, outfile)
+    elif stream and sep is None:
+        PrintTable(table, outfile, sep="\t")
+    else:
+        PrintTable(table, outfile, sep=sep)
+
+
+# ------------------------------------------------------------------ #
+# FOLLOW MODE                                                        #
+# ------------------------------------------------------------------ #
+# Reads a log while the experiment is still running (e.g., during a  #
+# scan), writing every trial as soon as Eprime logs it.  Response    #
+# times can be checked on the fly, to spot problems before the end  #
+# of the session.                                                    #
+# ------------------------------------------------------------------ #
+class RunningStats:
+    """Running mean and standard deviation of a series of values"""
+    def __init__(self):
+        self.n    = 0
+        self.mean = 0.0
+        self.m2   = 0.0
+
+    def Add(self, x):
+        """Adds a value (Welford's algorithm)"""
+        self.n    += 1
+        delta      = x - self.mean
+        self.mean += delta / self.n
+        self.m2   += delta * (x - self.mean)
+
+    def SD(self):
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.n - 1))
+
+
+def FollowEprimeLog(infile, outfile, sep="\t", rtColumns=(), threshold=3.0,
+                    minTrials=10, interval=1.0, timeout=None, columns=None):
+    """
+    Follows a log that is being written, and writes each trial to
+    'outfile' (or to the standard output, if 'outfile' is '-') as
+    soon as it is logged.  The values of the 'rtColumns' are checked
+    against the previous trials: values more than 'threshold' SDs
+    away from the mean (once 'minTrials' trials have been seen) are
+    reported on the standard error.
+    """
+    if outfile == "-":
+        out = sys.stdout
+    else:
+        out = open(outfile, 'w')
+    stats = dict([(x, RunningStats()) for x in rtColumns])
+    rows  = IterEprimeRows(infile, flushLevel=None, follow=True,
+                           interval=interval, timeout=timeout, columns=columns)
+    names = rows.next()
+    out.write(sep.join(names) + "\n")
+    out.flush()
+    for n, row in enumerate(rows):
+        out.write(sep.join([ToString(x) for x in row]) + "\n")
+        out.flush()
+        for column in rtColumns:
+            if not column in names:
+                continue
+            try:
+                rt = float(row[names.index(column)])
+            except (TypeError, ValueError):
+                continue
+            s = stats[column]
+            if s.n >= minTrials and abs(rt - s.mean) > threshold * s.SD():
+                print >> sys.stderr, "Trial %d: %s = %d is an outlier (M = %.1f, SD = %.1f)" % \
+                      (n + 1, column, rt, s.mean, s.SD())
+            s.Add(rt)
+    if out is not sys.stdout:
+        out.close()
+
+
+# ------------------------------------------------------------------ #
+# HEADER SCAN                                                        #
+# ------------------------------------------------------------------ #
+# Subject, session, date, and experiment name are all in the header  #
+# of a log.  To index many logs (e.g., to build a manifest of the    #
+# subjects of a study) only the headers need to be read, and that    #
+# can be done for many files at the same time with a thread pool.    #
+# ------------------------------------------------------------------ #
+HEADER_CHUNK_SIZE = 8192   # Headers are small; no need to read more
+
+
+def ReadEprimeHeader(file):
+    """
+    Reads the header of a log file (and nothing else), and returns
+    it as a LogFrame.
+    """
+    hLogFrame  = LogFrame(1)
+    levelNames = []
+    for command in ReadEprimeLogFile(file, chunkSize=HEADER_CHUNK_SIZE):
+        if command.logframe:
+            if command.key == "Header" and command.value == "End":
+                break
+        elif command.key == "LevelName":
+            levelNames.append(command.value)
+        else:
+            hLogFrame.Add(command.key, command.value, command.line)
+    if len(levelNames) > 0:
+        hLogFrame.levelName = levelNames[0]
+    return hLogFrame
+
+
+def ScanHeader(file):
+    """Reads a header, returning (file, header, error message)"""
+    try:
+        return (file, ReadEprimeHeader(file), None)
+    except Exception, e:
+        return (file, None, "%s: %s" % (e.__class__.__name__, e))
+
+
+def ScanHeaders(files, threads=16):
+    """
+    Reads the headers of a list of files with a pool of threads.
+    Returns a list of (file, header LogFrame, error) tuples, in the
+    same order as the files; either the header or the error is None.
+    """
+    pool    = multiprocessing.pool.ThreadPool(threads)
+    results = pool.map(ScanHeader, files)
+    pool.close()
+    pool.join()
+    return results
+
+
+def HeaderManifest(headers, key="File"):
+    """
+    Turns the results of ScanHeaders into a table with one row per
+    file, and one column for each header field found in any file.
+    """
+    fields = Schema()
+    fields.AddLevel(1)
+    for file, header, error in headers:
+        if header is not None:
+            for name in header.levelFields.fields[1]:
+                fields.Add(1, name)
+    names = fields.fields[1]
+    table = [[key] + names]
+    for file, header, error in headers:
+        if header is not None:
+            table.append([file] + [header.Get(x) for x in names])
+    return table
+
+
+# ------------------------------------------------------------------ #
+# BATCH MODE                                                         #
+# ------------------------------------------------------------------ #
+# Converts all the logs of a study in a single run, spreading the    #
+# files over a pool of processes.  Each log gets its own table, and  #
+# all the tables are then merged into a single study-level table.    #
+# A broken log is reported, but does not stop the batch.             #
+# ------------------------------------------------------------------ #
+TABLE_EXTENSIONS = {"\t" : ".tsv", "," : ".csv"}
+
+
+def FindLogFiles(pattern):
+    """
+    Returns the (sorted) log files in a directory, or matching a
+    glob pattern.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    return sorted(glob.glob(pattern))
+
+
+def BatchJob(job):
+    """
+    Converts a single file of a batch. Returns the input and output
+    names, the (level, field) of each column, the time it took, and
+    the error message (if any).
+    """
+    infile, outfile, sep, stream, cacheDir, columns = job
+    start  = time.time()
+    levels = []
+    try:
+        cache = None
+        if cacheDir is not None:
+            cache = ParseCache(cacheDir)
+        EprimeToTable(infile, outfile, sep=sep, stream=stream, cache=cache,
+                      columns=columns, levels=levels)
+        return (infile, outfile, levels, time.time() - start, None)
+    except Exception, e:
+        return (infile, outfile, None, time.time() - start,
+                "%s: %s" % (e.__class__.__name__, e))
+
+
+def MergeTables(tables, outputFile, sep="\t", key="File"):
+    """
+    Merges a list of (name, table file, layout) tuples into a single
+    table, whose columns are the union of the columns of all the
+    tables.  The layout of a table gives the (level, field) of each
+    of its columns; columns are matched on both, so that 'Procedure'
+    at different levels is kept apart even when the tables do not
+    have the same levels (e.g., a recovered log).  The first column
+    (named 'key') contains the name of the table each row comes from.
+    """
+    study = []
+    for name, table, layout in tables:
+        for x in layout:
+            if not x in study:
+                study.append(x)
+    # Like the study schema of MergeLogs: by level, then by first appearance
+    study.sort(key=lambda x: x[0])
+    position = dict([(x, i) for i, x in enumerate(study)])
+    slots    = [[position[x] for x in layout] for name, table, layout in tables]
+    columns  = [x[1] for x in study]
+
+    def Rows():
+        yield [key] + columns
+        for (name, table, layout), slot in zip(tables, slots):
+            input = open(table, 'r')
+            input.readline()
+            for line in input:
+                row = [None] * len(columns)
+                for i, value in zip(slot, line.rstrip("\r\n").split(sep)):
+                    row[i] = value
+                yield [name] + row
+            input.close()
+
+    PrintTable(Rows(), outputFile, sep=sep)
+
+
+def ParseBatch(pattern, outdir, sep="\t", stream=False, processes=None,
+               merged="study", cacheDir=None, columns=None):
+    """
+    Converts all the log files in a directory (or matching a glob
+    pattern) into tables in 'outdir', using a pool of processes, and
+    merges them into a single study table.  Prints the time taken by
+    each file and returns the list of files that could not be parsed.
+    If 'cacheDir' is given, parsed tables are cached there.  Only the
+    fields that match 'columns' (if given) are kept.
+    """
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    ext  = TABLE_EXTENSIONS.get(sep, ".txt")
+    jobs = []
+    for infile in FindLogFiles(pattern):
+        name    = os.path.splitext(os.path.basename(infile))[0]
+        outfile = os.path.join(outdir, name + ext)
+        if os.path.abspath(outfile) == os.path.abspath(infile):
+            raise Exception, "Output table would overwrite log file %s" % infile
+        jobs.append((infile, outfile, sep, stream, cacheDir, columns))
+
+    start    = time.time()
+    pool     = multiprocessing.Pool(processes)
+    results  = []
+    failures = []
+    layouts  = {}
+    for infile, outfile, levels, elapsed, error in pool.imap_unordered(BatchJob, jobs):
+        if error is None:
+            print "%-40s %8.2fs" % (os.path.basename(infile), elapsed)
+            results.append(infile)
+            layouts[infile] = levels
+        else:
+            print "%-40s %8.2fs  FAILED (%s)" % (os.path.basename(infile), elapsed, error)
+            failures.append(infile)
+    pool.close()
+    pool.join()
+
+    # The study table follows the order of the files, not of completion
+    tables = [(os.path.basename(job[0]), job[1], layouts[job[0]])
+              for job in jobs if job[0] in layouts]
+    if len(tables) > 0:
+        MergeTables(tables, os.path.join(outdir, merged + ext), sep=sep)
+    print "Parsed %d files (%d failed) in %.2fs" % (len(results), len(failures),
+                                                   time.time() - start)
+    return failures
+
+
+# ------------------------------------------------------------------ #
+# STUDY STORE                                                        #
+# ------------------------------------------------------------------ #
+# Merges the logs of a whole study into a single store: the schemas  #
+# of all the logs are merged, every row gets the subject and session #
+# from its log's header, and the rows of each subject are saved as   #
+# a separate columnar file (a "row group").  Analyses can then read  #
+# only the subjects and the columns they need.                       #
+# ------------------------------------------------------------------ #
+STORE_KEYS = ("Subject", "Session")
+
+
+def StoreJob(job):
+    """
+    Parses a log for MergeLogs.  Returns the file, the values of the
+    header keys, the schema, the (level, field) of each column, the
+    rows, and an error message (if the log could not be parsed).
+    """
+    infile, columns = job
+    try:
+        header = ReadEprimeHeader(infile)
+        keys   = [header.Get(x) for x in STORE_KEYS]
+        root   = ParseEprimeLogFile(infile, columns=columns)[0]
+        return (infile, keys, root.levelFields, FrameLayout(root), root.Values(), None)
+    except Exception, e:
+        return (infile, None, None, None, None, "%s: %s" % (e.__class__.__name__, e))
+
+
+def StoreName(subject):
+    """A file name for a subject's row group"""
+    return "".join([(x.isalnum() and x) or "_" for x in subject]) + ".npz"
+
+
+def MergeLogs(files, store, columns=None, processes=None):
+    """
+    Parses a list of log files (in parallel) and merges them into a
+    study store: a directory with one columnar file per subject,
+    an index of the subjects ('index.tsv'), and the merged schema
+    ('schema.tsv').  Returns the list of files that failed.
+    """
+    if not os.path.isdir(store):
+        os.makedirs(store)
+    pool    = multiprocessing.Pool(processes)
+    results = pool.map(StoreJob, [(x, columns) for x in files])
+    pool.close()
+    pool.join()
+
+    study    = Schema()
+    failures = []
+    subjects = {}
+    order    = []
+    for infile, keys, schema, layout, values, error in results:
+        if error is not None:
+            print "%-40s FAILED (%s)" % (os.path.basename(infile), error)
+            failures.append(infile)
+            continue
+        study.Merge(schema)
+        subject = keys[0] or os.path.splitext(os.path.basename(infile))[0]
+        if not subject in subjects:
+            subjects[subject] = []
+            order.append(subject)
+        subjects[subject].append((infile, keys, layout, values))
+
+    layout   = [(level, x) for level in study.Levels() for x in study.Fields(level)]
+    position = dict([(x, i) for i, x in enumerate(layout)])
+    names    = list(STORE_KEYS) + [x[1] for x in layout]
+
+    index = [["Subject", "Rows", "Group", "Files"]]
+    for subject in order:
+        table = [names]
+        for infile, keys, logLayout, values in subjects[subject]:
+            slots = [position[x] for x in logLayout]
+            for row in values:
+                merged = [None] * len(layout)
+                for i, value in zip(slots, row):
+                    merged[i] = value
+                table.append([subject] + keys[1:] + merged)
+        group = StoreName(subject)
+        SaveColumnar(table, os.path.join(store, group))
+        index.append([subject, len(table) - 1, group,
+                      ",".join([os.path.basename(x[0]) for x in subjects[subject]])])
+        print "%-40s %6d rows" % (subject, len(table) - 1)
+
+    PrintTable(index, os.path.join(store, "index.tsv"), sep="\t")
+    PrintTable([["Level", "Field"]] + [list(x) for x in layout],
+               os.path.join(store, "schema.tsv"), sep="\t")
+    return failures
+
+
+def LoadStore(store, columns=None, subjects=None):
+    """
+    Loads (memory-mapped) row groups from a study store.  Returns a
+    list of (subject, names, columns) tuples, one per subject; only
+    the given 'subjects' (if any) and the columns matching 'columns'
+    (names or glob patterns, if any) are read.
+    """
+    input = open(os.path.join(store, "index.tsv"), 'r')
+    input.readline()
+    groups = []
+    for line in input:
+        tokens = line.rstrip("\r\n").split("\t")
+        if subjects is None or tokens[0] in subjects:
+            names, data = LoadColumnar(os.path.join(store, tokens[2]), columns=columns)
+            groups.append((tokens[0], names, data))
+    input.close()
+    return groups
+
+
+def Option(options, name, default=None):
+    """Returns the value of a '--name=value' option, or 'default'"""
+    for option in options:
+        if option.startswith("--%s=" % name):
+            return option.split("=", 1)[1]
+    return default
 
 
 if __name__ == '__main__':
-    L = len(sys.argv)
-    wdir    = os.getcwd()
-    if L == 3:
-        infile  = sys.argv[1]
-        outfile = sys.argv[2]
-        frames  = ParseEprimeLogFile(os.path.join(wdir, infile))
-        PrintTable(frames[0].AsTable(), os.path.join(wdir, outfile))
-    elif L == 4:
-        format  = sys.argv[1]
-        infile  = sys.argv[2]
-        outfile = sys.argv[3]
+    options  = [x for x in sys.argv[1:] if x.startswith("--")]
+    args     = [x for x in sys.argv[1:] if not x.startswith("--")]
+    L        = len(args)
+    wdir     = os.getcwd()
+    stream   = "--stream" in options
+    columns  = Option(options, "columns")
+    cacheDir = None
+    cache    = None
+    if columns is not None:
+        columns = columns.split(",")
+    if not "--no-cache" in options:
+        cacheDir = Option(options, "cache-dir", CACHE_DIR)
+        cache    = ParseCache(cacheDir)
+    if "--batch" in options and L in (2, 3):
+        if L == 3 and args[0].startswith("-") and len(args[0]) > 1:
+            SEPARATOR = args[0][1:]
+        else:
+            SEPARATOR = "\t"
+        processes = Option(options, "processes")
+        if processes is not None:
+            processes = int(processes)
+        failures = ParseBatch(os.path.join(wdir, args[-2]), os.path.join(wdir, args[-1]),
+                              sep=SEPARATOR, stream=stream, processes=processes,
+                              cacheDir=cacheDir, columns=columns)
+        if len(failures) > 0:
+            sys.exit(1)
+    elif "--merge" in options and L == 2:
+        processes = Option(options, "processes")
+        if processes is not None:
+            processes = int(processes)
+        failures = MergeLogs(FindLogFiles(os.path.join(wdir, args[0])),
+                             os.path.join(wdir, args[1]), columns=columns,
+                             processes=processes)
+        if len(failures) > 0:
+            sys.exit(1)
+    elif "--headers" in options and L in (2, 3):
+        if L == 3 and args[0].startswith("-") and len(args[0]) > 1:
+            SEPARATOR = args[0][1:]
+        else:
+            SEPARATOR = "\t"
+        headers = ScanHeaders(FindLogFiles(os.path.join(wdir, args[-2])))
+        for logfile, header, error in headers:
+            if error is not None:
+                print "%-40s FAILED (%s)" % (os.path.basename(logfile), error)
+        PrintTable(HeaderManifest(headers), os.path.join(wdir, args[-1]), sep=SEPARATOR)
+    elif "--follow" in options and L in (2, 3):
+        if L == 3 and args[0].startswith("-") and len(args[0]) > 1:
+            SEPARATOR = args[0][1:]
+        else:
+            SEPARATOR = "\t"
+        rts     = [x for x in Option(options, "check-rt", "").split(",") if x != ""]
+        timeout = Option(options, "timeout")
+        if timeout is not None:
+            timeout = float(timeout)
+        outfile = args[-1]
+        if outfile != "-":
+            outfile = os.path.join(wdir, outfile)
+        FollowEprimeLog(os.path.join(wdir, args[-2]), outfile, sep=SEPARATOR,
+                        rtColumns=rts, timeout=timeout, columns=columns)
+    elif L == 2:
+        infile  = args[0]
+        outfile = args[1]
+        EprimeToTable(os.path.join(wdir, infile), os.path.join(wdir, outfile),
+                      stream=stream, cache=cache, columns=columns)
+    elif L == 3:
+        format  = args[0]
+        infile  = args[1]
+        outfile = args[2]
         if format.startswith("-"):
             if len(format) > 1:
                 SEPARATOR = format[1:]
             else:
                 SEPARATOR =  "\t"
-            frames  = ParseEprimeLogFile(os.path.join(wdir, infile))
-            PrintTable(frames[0].AsTable(), os.path.join(wdir, outfile), sep=SEPARATOR)
+            EprimeToTable(os.path.join(wdir, infile), os.path.join(wdir, outfile),
+                          sep=SEPARATOR, stream=stream, cache=cache, columns=columns)
         else:
             print HLP_MSG
     else:
         print HLP_MSG
-
-        
-        
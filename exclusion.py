@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## EXCLUSION
+## ---------------------------------------------------------------- ##
+## Outlier cutoffs and trial exclusion, on whole arrays of trials.
+##
+## The *2m.py scripts discard the correct trials whose RTs are too
+## long (e.g., above the mean + 3 SD of the correct trials), and
+## model them together with the errors.  Here, the cutoffs can be
+## computed over all the trials of a subject, or separately for
+## each group of trials (blocks, conditions, or any other label),
+## with three methods:
+##
+##   'sd'         : mean +/- n standard deviations
+##   'mad'        : median +/- n median absolute deviations (scaled
+##                  by 1.4826, so that they match SDs for normal data)
+##   'percentile' : the n-th and (100 - n)-th percentiles
+##
+## The statistics of all the groups are computed at once (with
+## bincount and a single sort), and every function returns one
+## value, or one boolean, per trial:
+##
+##   correct  = acc == 1
+##   outlier  = Outliers(rt, correct, groups=block)
+##   included, discarded = Partition(correct, outlier)
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+
+METHODS     = ('sd', 'mad', 'percentile')
+MAD_SCALING = 1.4826
+
+
+def Groups(n, groups=None):
+    """
+    The group index of each of 'n' trials (from 0), and the number of
+    groups.  With no groups, all the trials are in the same one.
+    """
+    if groups is None:
+        return np.zeros(n, dtype=int), 1
+    labels, index = np.unique(np.asarray(groups), return_inverse=True)
+    return index, len(labels)
+
+
+def GroupPercentiles(values, index, k, q):
+    """
+    The q-th percentile (0-100) of the values of each of k groups,
+    interpolated like np.percentile.  Empty groups get NaN.
+    """
+    order  = np.lexsort((values, index))
+    values = values[order]
+    counts = np.bincount(index, minlength=k)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.repeat(np.nan, k)
+    valid  = counts > 0
+    where  = starts[valid] + (counts[valid] - 1) * (q / 100.0)
+    below  = np.floor(where).astype(int)
+    above  = np.ceil(where).astype(int)
+    result[valid] = values[below] + (values[above] - values[below]) * (where - below)
+    return result
+
+
+def Bounds(values, mask=None, groups=None, method='sd', n=3):
+    """
+    The lower and upper cutoffs of each trial, computed over the
+    trials selected by 'mask' (e.g., the correct ones) in its group.
+    """
+    values = np.asarray(values, dtype=float)
+    if mask is None:
+        mask = np.ones(len(values), dtype=bool)
+    mask = np.asarray(mask, dtype=bool) & ~np.isnan(values)
+    if not method in METHODS:
+        raise ValueError, "Unknown cutoff method '%s' (not in %s)" % (method, ", ".join(METHODS))
+
+    index, k = Groups(len(values), groups)
+    x        = values[mask]
+    g        = index[mask]
+    if method == 'sd':
+        counts = np.bincount(g, minlength=k).astype(float)
+        sums   = np.bincount(g, x, minlength=k)
+        means  = sums / np.where(counts > 0, counts, np.nan)
+        ss     = np.bincount(g, (x - means[g]) ** 2, minlength=k)
+        sd     = np.sqrt(ss / np.where(counts > 1, counts - 1, np.nan))
+        lower, upper = means - n * sd, means + n * sd
+    elif method == 'mad':
+        medians = GroupPercentiles(x, g, k, 50)
+        mad     = GroupPercentiles(np.abs(x - medians[g]), g, k, 50) * MAD_SCALING
+        lower, upper = medians - n * mad, medians + n * mad
+    else:
+        lower = GroupPercentiles(x, g, k, n)
+        upper = GroupPercentiles(x, g, k, 100 - n)
+    return lower[index], upper[index]
+
+
+def Cutoff(values, mask=None, groups=None, method='sd', n=3):
+    """The upper cutoff of each trial (see Bounds)"""
+    return Bounds(values, mask, groups, method, n)[1]
+
+
+def Outliers(values, mask=None, groups=None, method='sd', n=3, tails='upper'):
+    """
+    The trials selected by 'mask' whose values are at or beyond the
+    cutoffs of their group: above the upper one only (tails='upper',
+    like long RTs), or also below the lower one (tails='both').
+    """
+    values = np.asarray(values, dtype=float)
+    if mask is None:
+        mask = np.ones(len(values), dtype=bool)
+    lower, upper = Bounds(values, mask, groups, method, n)
+    outliers = values >= upper
+    if tails == 'both':
+        outliers |= values <= lower
+    elif tails != 'upper':
+        raise ValueError, "Unknown tails '%s' (upper or both)" % tails
+    return np.asarray(mask, dtype=bool) & outliers
+
+
+def Partition(correct, *outliers):
+    """
+    Splits the trials into the included ones (correct, and not in any
+    of the 'outliers' masks) and the discarded ones (all the others).
+    """
+    included = np.asarray(correct, dtype=bool).copy()
+    for mask in outliers:
+        included &= ~np.asarray(mask, dtype=bool)
+    return included, ~included
@@ -35,6 +35,8 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
+from trialtable import BlockTiming
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -44,26 +46,27 @@ TR     = 2000.0
 OFFSET = 2
 
 ## ---------------------------------------------------------------- ##
-## These are variable that correspond to column indexes in the 
-## table file. Trial objects need to access them to find the proper
+## These are the table columns that correspond to each variable.
+## When a file is parsed, their indexes are stored in a TableSchema
+## (see tableschema.py), which Trial objects use to find the proper
 ## slot in a list of information tokens.
-## The variables are initialized when initially parsing the eprime 
-## file.
-## ---------------------------------------------------------------- ## 
-
-FIXATION1_START = 0
-FIXATION2_START = 0
-COMPLEXITY      = 0
-PRACTICED       = 0
-ENCODING_START  = 0
-ENCODING_RT     = 0
-EXECUTION_START = 0
-EXECUTION_RT    = 0
-PROBE_START     = 0
-PROBE_ACC       = 0
-PROBE_RT        = 0
-BLOCK           = 0
-FIXATIONS       = []
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'FIXATION1_START' : "Fixation1.OnsetTime",
+    'FIXATION2_START' : "Fixation2.OnsetTime",
+    'COMPLEXITY'      : "Complexity",
+    'PRACTICED'       : "Practiced",
+    'ENCODING_START'  : "TaskEncoding.OnsetTime",
+    'ENCODING_RT'     : "TaskEncoding.RT",
+    'EXECUTION_START' : "TaskExecution.OnsetTime",
+    'EXECUTION_RT'    : "TaskExecution.RT",
+    'PROBE_START'     : "Probe.OnsetTime",
+    'PROBE_ACC'       : "Probe.ACC",
+    'PROBE_RT'        : "Probe.RT",
+    'TRIAL'           : "Trial",
+    'BLOCK'           : "Block",
+    }
 
 ## ---------------------------------------------------------------- ##
 ## Finally, we have some more variables that will be used in the
@@ -181,21 +184,23 @@ def sd(vals):
 ##
 
 class Trial:
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema, timing):
+        self.schema = schema
+        self.timing = timing
         try:
-            self.Block       = int(tokens[BLOCK])
-            self.Complexity  = CONDS[tokens[COMPLEXITY]]
-            self.Practiced   = CONDS[tokens[PRACTICED]]
-            self.Fixation1   = int(tokens[FIXATION1_START])
-            self.Fixation2   = int(tokens[FIXATION2_START])
-            self.Encoding    = int(tokens[ENCODING_START])
-            self.EncodingRT  = int(tokens[ENCODING_RT])
-            self.Execution   = int(tokens[EXECUTION_START])
-            self.ExecutionRT = int(tokens[EXECUTION_RT])
-            self.Probe       = int(tokens[PROBE_START])
-            self.ProbeRT     = int(tokens[PROBE_RT])
-            self.ProbeACC    = int(tokens[PROBE_ACC])
-            self.Offset      = FIXATIONS[self.Block-1] - 4000
+            self.Block       = int(tokens[self.schema.BLOCK])
+            self.Complexity  = CONDS[tokens[self.schema.COMPLEXITY]]
+            self.Practiced   = CONDS[tokens[self.schema.PRACTICED]]
+            self.Fixation1   = int(tokens[self.schema.FIXATION1_START])
+            self.Fixation2   = int(tokens[self.schema.FIXATION2_START])
+            self.Encoding    = int(tokens[self.schema.ENCODING_START])
+            self.EncodingRT  = int(tokens[self.schema.ENCODING_RT])
+            self.Execution   = int(tokens[self.schema.EXECUTION_START])
+            self.ExecutionRT = int(tokens[self.schema.EXECUTION_RT])
+            self.Probe       = int(tokens[self.schema.PROBE_START])
+            self.ProbeRT     = int(tokens[self.schema.PROBE_RT])
+            self.ProbeACC    = int(tokens[self.schema.PROBE_ACC])
+            self.Offset      = self.timing.Begin(self.Block)
 
         except Exception, e:
             print e
@@ -204,24 +209,19 @@ class Trial:
 
     def AbsoluteTime(self, time):
         """Returns the absolute time (in ms) since the experiment began"""
-        return time - (FIXATIONS[0] - 4000)
+        return self.timing.AbsoluteTime(time)
 
     def RelativeTime(self, time):
         """Returns the absolute time from the beginning of the current block"""
-        #print time - self.Offset
-        return time - self.Offset
+        return self.timing.RelativeTime(time, self.Block)
 
     def RelativeScan(self, time):
         """Returns the scan index from the beginning of the block"""
-        return round(self.RelativeTime(time)/TR) 
+        return self.timing.RelativeScan(time, self.Block)
 
     def AbsoluteScan(self, time):
         """Returns the scan index from the beginning of the experiment"""
-        if (self.Block == 1):
-            return self.RelativeScan(time)
-        else:
-            B = self.Block-1
-            return self.RelativeScan(time) + reduce(add, BLOCKS[0:B])
+        return self.timing.AbsoluteScan(time, self.Block)
 
 
 def ReadBlocks(filename):
@@ -234,23 +234,6 @@ def ReadBlocks(filename):
 def Parse(filename):
     """Parses an experiment 'table' file""" 
 
-    # Declare global variables to access them
-
-    global FIXATION1_START 
-    global FIXATION2_START 
-    global COMPLEXITY      
-    global PRACTICED       
-    global ENCODING_START  
-    global ENCODING_RT     
-    global EXECUTION_START 
-    global EXECUTION_RT    
-    global PROBE_START     
-    global PROBE_ACC
-    global PROBE_RT
-    global BLOCK           
-    global FIXATIONS
-    global BLOCK
-    
     #ReadBlocks(filename[0:3]+".blocks.txt")
 
     ## Read the file lines. The first contains the column names.
@@ -265,29 +248,18 @@ def Parse(filename):
     ## New let's read the proper column indexes from the file
     ## header line, and set the appropriate variables.
     
-    FIXATION1_START = colNames.index('Fixation1.OnsetTime')
-    FIXATION2_START = colNames.index('Fixation2.OnsetTime')
-    COMPLEXITY      = colNames.index('Complexity')
-    PRACTICED       = colNames.index('Practiced')
-    ENCODING_START  = colNames.index('TaskEncoding.OnsetTime')
-    ENCODING_RT     = colNames.index('TaskEncoding.RT')
-    EXECUTION_START = colNames.index('TaskExecution.OnsetTime')
-    EXECUTION_RT    = colNames.index('TaskExecution.RT')
-    PROBE_START     = colNames.index('Probe.OnsetTime')
-    PROBE_ACC       = colNames.index('Probe.ACC')
-    PROBE_RT        = colNames.index('Probe.RT')
-    TRIAL           = colNames.index('Trial')
-    BLOCK           = colNames.index('Block')
+    schema   = TableSchema(colNames, COLUMNS)
     
     # Identifies the first trials of each block. This is needed to
     # estimate the beginning of each block--A block begings 4s before
     # the fixation.  The block's beginning will be recorded as each
     # trial as the 'offset' time (see Trial object)
     
-    firstTrials    = [x for x in rows if int(x[TRIAL]) == 1]
-    FIXATIONS      = [int(x[FIXATION1_START]) for x in firstTrials]
+    firstTrials    = [x for x in rows if int(x[schema.TRIAL]) == 1]
+    FIXATIONS      = [int(x[schema.FIXATION1_START]) for x in firstTrials]
+    timing         = BlockTiming([x - 4000 for x in FIXATIONS], BLOCKS, TR)
 
-    trials         = [Trial(x) for x in rows]
+    trials         = [Trial(x, schema, timing) for x in rows]
 
     # get an estimate of the M + 3*SD times for Encoding and Execution
 
@@ -9,6 +9,14 @@
 ## ---------------------------------------------------------------- ##
 ## History
 ##
+## 2026-10-17 : * Onsets and durations are computed once per
+##            :   regressor and written through the sinks of
+##            :   conditions.py (--mat also writes the .mat files,
+##            :   --events the BIDS events.tsv files).  Block times
+##            :   come from a BlockTiming (see trialtable.py), and
+##            :   outliers from exclusion.py.  Discarded trials are
+##            :   listed in chronological order.
+##
 ## 2010-07-15 : * Added regressors for jitter (post-response)
 ##            :   periods
 ##
@@ -32,8 +40,12 @@
 ## ---------------------------------------------------------------- ##
 
 import sys, os
-from operator import add
-from math import sqrt
+import numpy as np
+from tableschema import TableSchema
+from trialtable import BlockTiming
+from exclusion import Outliers, Partition
+from conditions import Regressor, RoundVector, WriteSession, CloseSinks
+from conditions import ObsSink, CondsSink, MCodeSink, MatSink, EventsSink
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -41,28 +53,30 @@ from math import sqrt
 
 TR     = 2000.0
 OFFSET = 2
+TASK   = "inst5"    # The BIDS task label (the same as specs/inst5.py)
 
 ## ---------------------------------------------------------------- ##
-## These are variable that correspond to column indexes in the 
-## table file. Trial objects need to access them to find the proper
+## These are the table columns that correspond to each variable.
+## When a file is parsed, their indexes are stored in a TableSchema
+## (see tableschema.py), which Trial objects use to find the proper
 ## slot in a list of information tokens.
-## The variables are initialized when initially parsing the eprime 
-## file.
-## ---------------------------------------------------------------- ## 
-
-FIXATION1_START = 0
-FIXATION2_START = 0
-COMPLEXITY      = 0
-PRACTICED       = 0
-ENCODING_START  = 0
-ENCODING_RT     = 0
-EXECUTION_START = 0
-EXECUTION_RT    = 0
-PROBE_START     = 0
-PROBE_ACC       = 0
-PROBE_RT        = 0
-BLOCK           = 0
-FIXATIONS       = []
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'FIXATION1_START' : "Fixation1.OnsetTime",
+    'FIXATION2_START' : "Fixation2.OnsetTime",
+    'COMPLEXITY'      : "Complexity",
+    'PRACTICED'       : "Practiced",
+    'ENCODING_START'  : "TaskEncoding.OnsetTime",
+    'ENCODING_RT'     : "TaskEncoding.RT",
+    'EXECUTION_START' : "TaskExecution.OnsetTime",
+    'EXECUTION_RT'    : "TaskExecution.RT",
+    'PROBE_START'     : "Probe.OnsetTime",
+    'PROBE_ACC'       : "Probe.ACC",
+    'PROBE_RT'        : "Probe.RT",
+    'TRIAL'           : "Trial",
+    'BLOCK'           : "Block",
+    }
 
 ## ---------------------------------------------------------------- ##
 ## Finally, we have some more variables that will be used in the
@@ -138,24 +152,36 @@ CONTRASTS       = {
     'd(Exe P-)' : [-0.3333, -0.3333, -0.3333, 1, 0, 0, 0, 0, 0],
 }
 
+## The labels of the regressors in the 'observations' file, and
+## their format in the 'conds' files.  Other scripts parse these
+## files, so they keep their historical layout (including the
+## missing duration labels and the POST_EXECUTION typo); regressors
+## that are not listed (like the discards) are left out.
+
+OBS_LABELS      = {
+    'ENC/P+'      : "ENCODING / P+",
+    'ENC/P-'      : "ENCODING / P-",
+    'EXE/P+'      : "EXECUTION / PRACT : +",
+    'EXE/P-'      : "EXECUTION / PRACT : -",
+    'POST_ENC/P+' : "ENCODING / P+",
+    'POST_ENC/P-' : "ENCODING / P-",
+    'POST_EXE/P+' : "PSOT_EXECUTION / P+",
+    'POST_EXE/P-' : "PSOT_EXECUTION / P-",
+}
 
-def mean(vals):
-    """Calculates the mean of a set of values"""
-    return float(reduce(add, vals))/float(len(vals))
-
-def ss(vals):
-    """Calculates the sum of squares"""
-    return reduce(add, [x*x for x in vals])
-
-def var(vals):
-    """Returns the variance of a list of values"""
-    m = mean(vals)
-    d = [x - m for x in vals]
-    return ss(d)/float(len(d)-1)
-
-def sd(vals):
-    """Returns the St Dev of a list of values"""
-    return sqrt(var(vals))
+CONDS_FORMATS   = {
+    'ENC/P+'      : "ENCODING / P+ / Onsets\t%(onsets)s\n%(durations)s\n",
+    'ENC/P-'      : "ENCODING / P- / Onsets\t%(onsets)s\n%(durations)s\n",
+    'EXE/P+'      : "EXECUTION / P+ / Onsets\t%(onsets)s\n"
+                    "EXECUTION / P+ / Durations\t%(durations)s\n",
+    'EXE/P-'      : "EXECUTION / P- / Onsets\t%(onsets)s\n"
+                    "EXECUTION / P- / Durations\t%(durations)s\n",
+    'Probes'      : "PROBE / Onsets\t%(onsets)sPROBE / Durations\t%(durations)s\n",
+    'POST_ENC/P+' : "POST_ENCODING / P+ / Onsets\t%(onsets)s\n%(durations)s\n",
+    'POST_ENC/P-' : "POST_ENCODING / P- / Onsets\t%(onsets)s\n%(durations)s\n",
+    'POST_EXE/P+' : "POST_EXECUTION / P+ / Onsets\t%(onsets)s\n%(durations)s\n",
+    'POST_EXE/P-' : "POST_EXECUTION / P- / Onsets\t%(onsets)s\n%(durations)s\n",
+}
 
 
 ## ---------------------------------------------------------------- ##
@@ -196,21 +222,23 @@ def sd(vals):
 ##
 
 class Trial:
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema, timing):
+        self.schema = schema
+        self.timing = timing
         try:
-            self.Block       = int(tokens[BLOCK])
-            self.Complexity  = CONDS[tokens[COMPLEXITY]]
-            self.Practiced   = CONDS[tokens[PRACTICED]]
-            self.Fixation1   = int(tokens[FIXATION1_START])
-            self.Fixation2   = int(tokens[FIXATION2_START])
-            self.Encoding    = int(tokens[ENCODING_START])
-            self.EncodingRT  = int(tokens[ENCODING_RT])
-            self.Execution   = int(tokens[EXECUTION_START])
-            self.ExecutionRT = int(tokens[EXECUTION_RT])
-            self.Probe       = int(tokens[PROBE_START])
-            self.ProbeRT     = int(tokens[PROBE_RT])
-            self.ProbeACC    = int(tokens[PROBE_ACC])
-            self.Offset      = FIXATIONS[self.Block-1] - 4000
+            self.Block       = int(tokens[self.schema.BLOCK])
+            self.Complexity  = CONDS[tokens[self.schema.COMPLEXITY]]
+            self.Practiced   = CONDS[tokens[self.schema.PRACTICED]]
+            self.Fixation1   = int(tokens[self.schema.FIXATION1_START])
+            self.Fixation2   = int(tokens[self.schema.FIXATION2_START])
+            self.Encoding    = int(tokens[self.schema.ENCODING_START])
+            self.EncodingRT  = int(tokens[self.schema.ENCODING_RT])
+            self.Execution   = int(tokens[self.schema.EXECUTION_START])
+            self.ExecutionRT = int(tokens[self.schema.EXECUTION_RT])
+            self.Probe       = int(tokens[self.schema.PROBE_START])
+            self.ProbeRT     = int(tokens[self.schema.PROBE_RT])
+            self.ProbeACC    = int(tokens[self.schema.PROBE_ACC])
+            self.Offset      = self.timing.Begin(self.Block)
 
         except Exception, e:
             print e
@@ -219,24 +247,19 @@ class Trial:
 
     def AbsoluteTime(self, time):
         """Returns the absolute time (in ms) since the experiment began"""
-        return time - (FIXATIONS[0] - 4000)
+        return self.timing.AbsoluteTime(time)
 
     def RelativeTime(self, time):
         """Returns the absolute time from the beginning of the current block"""
-        #print time - self.Offset
-        return time - self.Offset
+        return self.timing.RelativeTime(time, self.Block)
 
     def RelativeScan(self, time):
         """Returns the scan index from the beginning of the block"""
-        return round(self.RelativeTime(time)/TR) 
+        return self.timing.RelativeScan(time, self.Block)
 
     def AbsoluteScan(self, time):
         """Returns the scan index from the beginning of the experiment"""
-        if (self.Block == 1):
-            return self.RelativeScan(time)
-        else:
-            B = self.Block-1
-            return self.RelativeScan(time) + reduce(add, BLOCKS[0:B])
+        return self.timing.AbsoluteScan(time, self.Block)
 
 
 
@@ -247,26 +270,44 @@ def ReadBlocks(filename):
     lines = f.readlines()
     BLOCKS = [int(x) for x in lines]
 
-def Parse(filename):
+class Times:
+    """
+    The onset times (from the beginning of their block) and RTs (in
+    ms) of a list of trials, as arrays
+    """
+    def __init__(self, trials, timing):
+        blocks           = np.array([x.Block for x in trials], dtype=int)
+        self.practiced   = np.array([x.Practiced for x in trials], dtype=str)
+        self.accuracy    = np.array([x.ProbeACC for x in trials], dtype=int)
+        self.encoding    = np.array([x.Encoding for x in trials], dtype=float)
+        self.encodingRT  = np.array([x.EncodingRT for x in trials], dtype=float)
+        self.execution   = np.array([x.Execution for x in trials], dtype=float)
+        self.executionRT = np.array([x.ExecutionRT for x in trials], dtype=float)
+        self.probe       = np.array([x.Probe for x in trials], dtype=float)
+        self.probeRT     = np.array([x.ProbeRT for x in trials], dtype=float)
+
+        # All the onsets of a phase are converted at once
+        self.encoding    = timing.RelativeTime(self.encoding, blocks)
+        self.execution   = timing.RelativeTime(self.execution, blocks)
+        self.probe       = timing.RelativeTime(self.probe, blocks)
+
+        # Per-trial columns of the BIDS events files (RTs in s, and
+        # n/a when there was no response)
+        self.columns     = [('practiced', self.practiced),
+                            ('accuracy', self.accuracy),
+                            ('encoding_rt', Seconds(self.encodingRT)),
+                            ('execution_rt', Seconds(self.executionRT)),
+                            ('probe_rt', Seconds(self.probeRT))]
+
+
+def Seconds(rt):
+    """RTs in s, with NaN for the missing (0) ones"""
+    return np.where(rt > 0, rt / 1000.0, np.nan)
+
+
+def Parse(filename, mat=False, events=False):
     """Parses an experiment 'table' file""" 
 
-    # Declare global variables to access them
-
-    global FIXATION1_START 
-    global FIXATION2_START 
-    global COMPLEXITY      
-    global PRACTICED       
-    global ENCODING_START  
-    global ENCODING_RT     
-    global EXECUTION_START 
-    global EXECUTION_RT    
-    global PROBE_START     
-    global PROBE_ACC
-    global PROBE_RT
-    global BLOCK           
-    global FIXATIONS
-    global BLOCK
-    
     #ReadBlocks(filename[0:3]+".blocks.txt")
 
     ## Read the file lines. The first contains the column names.
@@ -281,44 +322,56 @@ def Parse(filename):
     ## New let's read the proper column indexes from the file
     ## header line, and set the appropriate variables.
     
-    FIXATION1_START = colNames.index('Fixation1.OnsetTime')
-    FIXATION2_START = colNames.index('Fixation2.OnsetTime')
-    COMPLEXITY      = colNames.index('Complexity')
-    PRACTICED       = colNames.index('Practiced')
-    ENCODING_START  = colNames.index('TaskEncoding.OnsetTime')
-    ENCODING_RT     = colNames.index('TaskEncoding.RT')
-    EXECUTION_START = colNames.index('TaskExecution.OnsetTime')
-    EXECUTION_RT    = colNames.index('TaskExecution.RT')
-    PROBE_START     = colNames.index('Probe.OnsetTime')
-    PROBE_ACC       = colNames.index('Probe.ACC')
-    PROBE_RT        = colNames.index('Probe.RT')
-    TRIAL           = colNames.index('Trial')
-    BLOCK           = colNames.index('Block')
+    schema   = TableSchema(colNames, COLUMNS)
     
     # Identifies the first trials of each block. This is needed to
     # estimate the beginning of each block--A block begings 4s before
     # the fixation.  The block's beginning will be recorded as each
     # trial as the 'offset' time (see Trial object)
     
-    firstTrials    = [x for x in rows if int(x[TRIAL]) == 1]
-    FIXATIONS      = [int(x[FIXATION1_START]) for x in firstTrials]
-
-    trials         = [Trial(x) for x in rows]
-
-    # get an estimate of the M + 3*SD times for Encoding and Execution
-
-    encodings      = [x.EncodingRT for x in trials if x.ProbeACC == 1]
-    executions     = [x.ExecutionRT for x in trials if x.ProbeACC == 1]
-
-    ENCODING_UPPER = mean(encodings)+3*sd(encodings)
-    EXECUTION_UPPER= mean(executions)+3*sd(executions)
-
-    print ENCODING_UPPER, EXECUTION_UPPER
-
-    # Create the 'observations' file. This will keep track
-    # of the number of correct trials in each block.
-
-    obs            = open(filename[0:3] + ".obs.txt", 'w')
+    firstTrials    = [x for x in rows if int(x[schema.TRIAL]) == 1]
+    FIXATIONS      = [int(x[schema.FIXATION1_START]) for x in firstTrials]
+    timing         = BlockTiming([x - 4000 for x in FIXATIONS], BLOCKS, TR)
+
+    trials         = [Trial(x, schema, timing) for x in rows]
+
+    # Correct trials slower than M + 3*SD (of the correct trials) in
+    # Encoding or Execution are outliers.  The included trials are
+    # the other correct ones, and all the rest (errors and outliers)
+    # are discarded (see exclusion.py)
+
+    blocks         = np.array([x.Block for x in trials])
+    practiced      = np.array([x.Practiced for x in trials])
+    accuracy       = np.array([x.ProbeACC for x in trials])
+    encodings      = np.array([x.EncodingRT for x in trials], dtype=float)
+    executions     = np.array([x.ExecutionRT for x in trials], dtype=float)
+    correct        = accuracy == 1
+
+    outlier        = Outliers(encodings, correct) | Outliers(executions, correct)
+    included, discarded = Partition(correct, outlier)
+
+    def Select(mask):
+        """The trials selected by a mask"""
+        return [trials[i] for i in np.flatnonzero(mask)]
+
+    ## The onsets and durations of every session go to several
+    ## files: the 'observations' file (the number of trials of each
+    ## regressor), one 'conds' file per session, and a single M-file
+    ## for all sessions (plus the .mat files and the BIDS events
+    ## files, if requested).  Each vector is computed and formatted
+    ## once, and each file is written at once (see conditions.py).
+
+    ## All the files go to the current directory, where the M-file
+    ## saves its .mat files too.
+
+    sinks = [ObsSink(filename[0:3] + ".obs.txt", OBS_LABELS),
+             CondsSink(filename[0:3] + ".session%d.conds.txt", CONDS_FORMATS),
+             MCodeSink(filename[0:3] + "sessions.m")]
+    if mat:
+        sinks.append(MatSink())
+    if events:
+        sinks.append(EventsSink("sub-%(subject)s_task-%(task)s_run-%(run)02d_events.tsv",
+                                {'subject' : filename[0:3], 'task' : TASK}))
 
     ## Creates the 'contrast' file. The contrast file contains the
     ## betas for all the conditions of interest.
@@ -329,171 +382,54 @@ def Parse(filename):
     for x in CONTRAST_LIST:
         contrasts[x] = []
 
-    mfile  = open(filename[0:3] + "sessions.m", 'w')
-
     ## All the sessions have exactly 4 blocks of 20 trials each.
     ## Note that what is called a 'block' here is "session" in
     ## SPM and a "run" in AfNI.
 
     for block in range(1,len(FIXATIONS)+1):
-        ##mfile  = open(filename[0:3] + "session%d.m" % block, 'w')
-        conds    = open(filename[0:3] + ".session%d.conds.txt" % block, 'w')
-        correct  = [x for x in trials if x.Block == block and x.ProbeACC==1]
-        errors   = [x for x in trials if x.Block == block and x.ProbeACC==0]
-        subset   = [x for x in correct if x.EncodingRT < ENCODING_UPPER
-                    and x.ExecutionRT < EXECUTION_UPPER]
-        outliers = [x for x in correct if x.EncodingRT >= ENCODING_UPPER
-                    or x.ExecutionRT >= EXECUTION_UPPER]
-        discard  = errors+outliers
-
-        print "Block %d: Errors %d, Outliers %d" % (block, len(errors), len(outliers))
-        ## Initializes the cells in the .mat file
-
-        NUM_ROWS = 5
-        if len(discard) != 0:
-            NUM_ROWS = 8
+        inBlock  = blocks == block
+        subset   = Select(inBlock & included)
+        discard  = Select(inBlock & discarded)
+        selected = dict([(p, Select(inBlock & included & (practiced == p)))
+                         for p in ['+', '-']])
 
-        mfile.write("names=cell(1,%d);\n" % NUM_ROWS)
-        mfile.write("onsets=cell(1,%d);\n" % NUM_ROWS)
-        mfile.write("durations=cell(1,%d);\n" % NUM_ROWS)
-                 
-      
-        ## The ENCODING loop. Writes the onsets and durations of 
-        ## task encoding events, grouped by practice and 
-        ## conditions.
+        print "Block %d: Errors %d, Outliers %d" % (block, (inBlock & ~correct).sum(),
+                                                    (inBlock & outlier).sum())
 
-        COND = 1
+        regressors = []
+
+        ## ENCODING and EXECUTION, grouped by practice. Times are
+        ## in ms, onsets and durations in secs.
 
         for practice in ['+', '-']:
-            selected   = [x for x in subset if x.Practiced == practice]
-                
-            ## Write trial onsets (in secs) 
-            obs.write("SESSION %d / ENCODING / P%s \t %d\n" % (block, practice, len(selected)))
-            conds.write("ENCODING / P%s / Onsets\t" % (practice))
-            mfile.write("names{%d}='ENC/P%s';\n" % (COND, practice))
-            mfile.write("onsets{%d}=[" % COND)
-            for x in selected:
-                conds.write("%1.1f " % round(x.RelativeTime(x.Encoding)/1000.0, 1))
-                mfile.write("%1.1f " % round(x.RelativeTime(x.Encoding)/1000.0, 1))
-            conds.write("\n")
-            mfile.write("];\n")
-                
-            ## Write Trial durarions
-            mfile.write("durations{%d}=[" % COND)
-            for x in selected:
-                conds.write("%1.1f " % round(float(x.EncodingRT)/1000.0, 1))
-                mfile.write("%1.1f " % round(float(x.EncodingRT)/1000.0, 1))
-            conds.write("\n")
-            mfile.write("];\n")
-
-            COND += 1
-
-        # This is the EXECUTION loop. Writes down the onset and 
-        # duration of a task execution event.
+            T = Times(selected[practice], timing)
+            regressors.append(Regressor('ENC/P%s' % practice, T.encoding / 1000.0,
+                                        T.encodingRT / 1000.0, 1, T.columns))
 
         for practice in ['+', '-']:
-            selected   = [x for x in subset if x.Practiced == practice]
-                
-            ## Write trial onsets (in scans) 
-            obs.write("SESSION %d / EXECUTION / PRACT : %s \t %d\n" % (block, practice, len(selected)))
-            conds.write("EXECUTION / P%s / Onsets\t" % (practice))
-            mfile.write("names{%d}='EXE/P%s';\n" % (COND, practice))
-            mfile.write("onsets{%d}=[" % COND)
-            for x in selected:
-                conds.write("%1.1f " % round(x.RelativeTime(x.Execution)/1000.0, 1))
-                mfile.write("%1.1f " % round(x.RelativeTime(x.Execution)/1000.0, 1))
-            conds.write("\n")
-            mfile.write("];\n")
-
-            ## Write trial durations
-            conds.write("EXECUTION / P%s / Durations\t" % (practice))
-            mfile.write("durations{%d}=[" % COND)
-            for x in selected:
-                conds.write("%1.1f " % round(x.ExecutionRT/1000.0, 1))
-                mfile.write("%1.1f " % round(x.ExecutionRT/1000.0, 1))
-            conds.write("\n")
-            mfile.write("];\n")
-
-            COND += 1
+            T = Times(selected[practice], timing)
+            regressors.append(Regressor('EXE/P%s' % practice, T.execution / 1000.0,
+                                        T.executionRT / 1000.0, 1, T.columns))
 
         # Probes
-                
-        conds.write("PROBE / Onsets\t")
-        mfile.write("names{%d}='Probes';\n" % COND)
-        mfile.write("onsets{%d}=[" % COND)
-        for x in subset:
-            conds.write("%1.1f " % round(x.RelativeTime(x.Probe)/1000.0, 1))
-            mfile.write("%1.1f " % round(x.RelativeTime(x.Probe)/1000.0, 1))
-        mfile.write("];\n")
-        conds.write("PROBE / Durations\t")
-        mfile.write("durations{%d}=[" % COND)
-        for x in subset:
-            conds.write("%1.1f " % round(x.ProbeRT/1000.0, 1))
-            mfile.write("%1.1f " % round(x.ProbeRT/1000.0, 1))
-        conds.write("\n")
-        mfile.write("];\n")
-
-        COND += 1
 
-            
-        ## POST ENCODING LOOP
-        for practice in ['+', '-']:
-            selected   = [x for x in subset if x.Practiced == practice]
-        
-            ## Write trial onsets (in secs) 
-            obs.write("SESSION %d / ENCODING / P%s \t %d\n" % (block, practice, len(selected)))
-            conds.write("POST_ENCODING / P%s / Onsets\t" % (practice))
-            mfile.write("names{%d}='POST_ENC/P%s';\n" % (COND, practice))
-            mfile.write("onsets{%d}=[" % COND)
-            for x in selected:
-                t = (x.RelativeTime(x.Encoding)+x.EncodingRT)/1000.0
-                conds.write("%1.1f " % round(t,1))
-                mfile.write("%1.1f " % round(t,1))
-            conds.write("\n")
-            mfile.write("];\n")
-                
-            ## Write Trial durarions
-            mfile.write("durations{%d}=[" % COND)
-            for x in selected:
-                t = (x.RelativeTime(x.Encoding)+x.EncodingRT)/1000.0
-                d = (x.RelativeTime(x.Execution)/1000.0) - round(t,1)
-                conds.write("%1.1f " % round(d,1))
-                mfile.write("%1.1f " % round(d,1))
-            conds.write("\n")
-            mfile.write("];\n")
-
-            COND += 1
-
-
-
-        ## POST EXECUTION
-        for practice in ['+', '-']:
-            selected   = [x for x in subset if x.Practiced == practice]
-            ## Write trial onsets (in secs) 
-            obs.write("SESSION %d / PSOT_EXECUTION / P%s \t %d\n" % (block, practice, len(selected)))
-            conds.write("POST_EXECUTION / P%s / Onsets\t" % (practice))
-            mfile.write("names{%d}='POST_EXE/P%s';\n" % (COND, practice))
-            mfile.write("onsets{%d}=[" % COND)
-            for x in selected:
-                t = (x.RelativeTime(x.Execution)+x.ExecutionRT)/1000.0
-                conds.write("%1.1f " % round(t,1))
-                mfile.write("%1.1f " % round(t,1))
-            conds.write("\n")
-            mfile.write("];\n")
-                
-            ## Write Trial durarions
-            mfile.write("durations{%d}=[" % COND)
-            for x in selected:
-                t = (x.RelativeTime(x.Execution)+x.ExecutionRT)/1000.0
-                d = (x.RelativeTime(x.Probe)/1000.0) - round(t,1)
-                conds.write("%1.1f " % round(d,1))
-                mfile.write("%1.1f " % round(d,1))
-            conds.write("\n")
-            mfile.write("];\n")
-
-            COND += 1
+        T = Times(subset, timing)
+        regressors.append(Regressor('Probes', T.probe / 1000.0, T.probeRT / 1000.0, 1, T.columns))
 
+        ## POST ENCODING and POST EXECUTION: from the end of a phase
+        ## (rounded) to the beginning of the next one.
 
+        for practice in ['+', '-']:
+            T = Times(selected[practice], timing)
+            t = RoundVector((T.encoding + T.encodingRT) / 1000.0, 1)[0]
+            regressors.append(Regressor('POST_ENC/P%s' % practice, t,
+                                        T.execution / 1000.0 - t, 1, T.columns))
+
+        for practice in ['+', '-']:
+            T = Times(selected[practice], timing)
+            t = RoundVector((T.execution + T.executionRT) / 1000.0, 1)[0]
+            regressors.append(Regressor('POST_EXE/P%s' % practice, t,
+                                        T.probe / 1000.0 - t, 1, T.columns))
 
         ## Now it's time to Create the appropriate contrasts
         
@@ -507,65 +443,20 @@ def Parse(filename):
             # DISCARD (ERRORS + OUTLIERS)
             # Errors are modeled apart from the other conditions. There are
             # separate error columns for encoding, executing, and responding.
-            
-            ## This is the loop for Errors/Encodinf phase
-            
-            mfile.write("names{%d}='ENC/Discard';\n" % COND)
-
-            mfile.write("onsets{%d}=[" % COND)
-            for x in discard:
-                mfile.write("%1.1f " % round(x.RelativeTime(x.Encoding)/1000.0, 1))
-            mfile.write("];\n")
-                
-            mfile.write("durations{%d}=[" % COND)
-            for x in discard:
-                mfile.write("%1.1f " % round(x.EncodingRT/1000.0, 1))
-            mfile.write("];\n")
-
-            COND += 1
-
-            # This is the loop for discards, executing phase
-        
-            mfile.write("names{%d}='EXE/Discard';\n" % COND)
-        
-            mfile.write("onsets{%d}=[" % COND)
-            for x in discard:
-                mfile.write("%1.1f " % round(x.RelativeTime(x.Execution)/1000.0, 1))
-            mfile.write("];\n")
+            # Unanswered probes last 2s.
 
-            mfile.write("durations{%d}=[" % COND)
-            for x in discard:
-                mfile.write("%1.1f " % round(x.ExecutionRT/1000.0, 1))
-            mfile.write("];\n")
+            T = Times(discard, timing)
+            regressors.append(Regressor('ENC/Discard', T.encoding / 1000.0,
+                                        T.encodingRT / 1000.0, 1, T.columns))
+            regressors.append(Regressor('EXE/Discard', T.execution / 1000.0,
+                                        T.executionRT / 1000.0, 1, T.columns))
+            probeRT = np.where(T.probeRT == 0, 2000, T.probeRT)
+            regressors.append(Regressor('PROBE/Discard', T.probe / 1000.0,
+                                        probeRT / 1000.0, 1, T.columns))
 
-            COND += 1
+        WriteSession(sinks, block, regressors)
 
-            # And this is the loops for discards, probe phase
-        
-            mfile.write("names{%d}='PROBE/Discard';\n" % COND)
-            
-            mfile.write("onsets{%d}=[" % COND)
-            for x in discard:
-                mfile.write("%1.1f " % round(x.RelativeTime(x.Probe)/1000.0, 1))
-            mfile.write("];\n")
-
-            mfile.write("durations{%d}=[" %COND)
-            for x in discard:
-                if x.ProbeRT == 0:
-                    mfile.write("2.0 ")
-                else:
-                    mfile.write("%1.1f " % round(x.ProbeRT/1000.0, 1))
-            mfile.write("];\n")
-        # Now the M-code to save the file as a mat file
-        mfile.write("save('session%d.mat', 'names', 'onsets', 'durations')\n" % block)
-
-        # Flush the file buffers and close the streams.
-        conds.flush()
-        mfile.flush()
-        conds.close()
-
-    mfile.close()    
-    obs.close()
+    CloseSinks(sinks)
 
     for x in CONTRAST_LIST:
         contrasts[x] = [float(i)/len(FIXATIONS) for i in contrasts[x]]
@@ -575,6 +466,6 @@ def Parse(filename):
     cfile.close()
 
 if __name__ == '__main__':
-    filename = sys.argv[1]
+    filename = [x for x in sys.argv[1:] if not x.startswith("--")][0]
     print filename
-    Parse(filename)
+    Parse(filename, mat="--mat" in sys.argv[1:], events="--events" in sys.argv[1:])
@@ -11,6 +11,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -19,19 +20,26 @@ from math import sqrt
 TR     = 2000.0
 OFFSET = 2
 
-DELAY1             = 0
-DELAY2             = 0
-BLOCK              = 0
-TRIAL              = 0
-PRACTICED          = 0
-FIXATION_ONSET     = 0
-ENCODING_ONSET     = 0
-ENCODING_RT        = 0
-EXECUTION_ONSET    = 0
-EXECUTION_RT       = 0
-PROBE_ONSET        = 0
-PROBE_RT           = 0
-PROBE_ACC          = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'DELAY1'          : "Delay1",
+    'DELAY2'          : "Delay2",
+    'BLOCK'           : "BlockNum",
+    'TRIAL'           : "Trials",
+    'PRACTICED'       : "Practiced",
+    'FIXATION_ONSET'  : "Fixation1.OnsetTime",
+    'ENCODING_ONSET'  : "Encoding.OnsetTime",
+    'ENCODING_RT'     : "Encoding.RT",
+    'EXECUTION_ONSET' : "Execution.OnsetTime",
+    'EXECUTION_RT'    : "Execution.RT",
+    'PROBE_ONSET'     : "Probe.OnsetTime",
+    'PROBE_RT'        : "Probe.RT",
+    'PROBE_ACC'       : "Probe.ACC",
+    }
+
 
 class Trial:
     """
@@ -39,8 +47,9 @@ class Trial:
     (Encoding, Execution, Response), with associated Onsets and
     Durations (ie. RTs), followed by randomly-varying Delays.
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         try:
             self.Create(tokens)
@@ -53,20 +62,20 @@ class Trial:
 
     def Create(self, tokens):
         """Performs the necessary initialization"""
-        self.delay1 = int(tokens[DELAY1])
-        self.delay2 = int(tokens[DELAY2])
-        self.block = int(tokens[BLOCK])
-        self.trial = int(tokens[TRIAL])
-        self.practiced = tokens[PRACTICED]
-        self.fixationOnset = int(tokens[FIXATION_ONSET])
-        self.encodingOnset = int(tokens[ENCODING_ONSET])
-        self.encodingRt = int(tokens[ENCODING_RT])
-        self.executionOnset = int(tokens[EXECUTION_ONSET])
-        self.executionRt = int(tokens[EXECUTION_RT])
-        self.probeOnset = int(tokens[PROBE_ONSET])
-        self.probeRt = int(tokens[PROBE_RT])
-        self.probeAcc = int(tokens[PROBE_ACC])
-        self.acc = int(tokens[PROBE_ACC])
+        self.delay1 = int(tokens[self.schema.DELAY1])
+        self.delay2 = int(tokens[self.schema.DELAY2])
+        self.block = int(tokens[self.schema.BLOCK])
+        self.trial = int(tokens[self.schema.TRIAL])
+        self.practiced = tokens[self.schema.PRACTICED]
+        self.fixationOnset = int(tokens[self.schema.FIXATION_ONSET])
+        self.encodingOnset = int(tokens[self.schema.ENCODING_ONSET])
+        self.encodingRt = int(tokens[self.schema.ENCODING_RT])
+        self.executionOnset = int(tokens[self.schema.EXECUTION_ONSET])
+        self.executionRt = int(tokens[self.schema.EXECUTION_RT])
+        self.probeOnset = int(tokens[self.schema.PROBE_ONSET])
+        self.probeRt = int(tokens[self.schema.PROBE_RT])
+        self.probeAcc = int(tokens[self.schema.PROBE_ACC])
+        self.acc = int(tokens[self.schema.PROBE_ACC])
         self.blockBegin = 0
         self.blockOffset = 0
 
@@ -120,20 +129,6 @@ class Trial:
 
 def Parse(filename, blockLengths):
     """Parses a Table-format logfile"""
-    global DELAY1
-    global DELAY2
-    global BLOCK           
-    global TRIAL           
-    global PRACTICED       
-    global FIXATION_ONSET
-    global ENCODING_ONSET  
-    global ENCODING_RT     
-    global EXECUTION_ONSET 
-    global EXECUTION_RT    
-    global PROBE_ONSET     
-    global PROBE_RT        
-    global PROBE_ACC       
-
     fin      = open(filename, 'rU')
     subject  = filename.split('.')[0].split('-')[-1]
     lines    = fin.readlines()
@@ -142,21 +137,9 @@ def Parse(filename, blockLengths):
     colNames = tokens[0]
     rows     = tokens[1:]
 
-    DELAY1             = colNames.index("Delay1")
-    DELAY2             = colNames.index("Delay2")
-    BLOCK              = colNames.index("BlockNum")
-    TRIAL              = colNames.index("Trials")
-    PRACTICED          = colNames.index("Practiced")
-    FIXATION_ONSET     = colNames.index("Fixation1.OnsetTime")
-    ENCODING_ONSET     = colNames.index("Encoding.OnsetTime")
-    ENCODING_RT        = colNames.index("Encoding.RT")
-    EXECUTION_ONSET    = colNames.index("Execution.OnsetTime")
-    EXECUTION_RT       = colNames.index("Execution.RT")
-    PROBE_ONSET        = colNames.index("Probe.OnsetTime")
-    PROBE_RT           = colNames.index("Probe.RT")
-    PROBE_ACC          = colNames.index("Probe.ACC")
-
-    trials = [Trial(r) for r in rows]
+    schema   = TableSchema(colNames, COLUMNS)
+
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes trials where values are missing
     FIRST_TRIALS = []
     previous = None
@@ -13,6 +13,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
              
              
@@ -48,22 +49,27 @@ def expand_contrast_vector(lst, num):
 TR     = 2000.0
 OFFSET = 2
 
-DELAY1               = 0
-DELAY2               = 0
-BLOCK                = 0
-TRIAL                = 0
-PRACTICED            = 0
-ENCODING_ONSET       = 0
-ENCODING_RT          = 0
-EXECUTION_ONSET      = 0
-EXECUTION_RT         = 0
-RECALL_PROBE_ONSET   = 0
-RECALL_PROBE_RT      = 0
-RECALL_PROBE_ACC     = 0
-ROTATION_PROBE_ONSET = 0
-ROTATION_PROBE_RT    = 0
-ROTATION_PROBE_ACC   = 0
-OPERATOR1            = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'DELAY1'               : "Delay1[Trial]",
+    'DELAY2'               : "Delay2[Trial]",
+    'BLOCK'                : "BlockNum",
+    'PRACTICED'            : "Practiced",
+    'ENCODING_ONSET'       : "Encoding.OnsetTime",
+    'ENCODING_RT'          : "Encoding.RT",
+    'EXECUTION_ONSET'      : "Execution.OnsetTime",
+    'EXECUTION_RT'         : "Execution.RT",
+    'RECALL_PROBE_ONSET'   : "RecallProbe.OnsetTime",
+    'RECALL_PROBE_RT'      : "RecallProbe.RT",
+    'RECALL_PROBE_ACC'     : "RecallProbe.ACC",
+    'ROTATION_PROBE_ONSET' : "RotationProbe.OnsetTime",
+    'ROTATION_PROBE_RT'    : "RotationProbe.RT",
+    'ROTATION_PROBE_ACC'   : "RotationProbe.ACC",
+    'OPERATOR1'            : "Operator1[Trial]",
+    }
 
 class Trial:
     """
@@ -71,8 +77,9 @@ class Trial:
     (Encoding, Execution, Response), with associated Onsets and
     Durations (ie. RTs), followed by randomly-varying Delays.
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         try:
             self.Create(tokens)
@@ -86,30 +93,30 @@ class Trial:
     def Create(self, tokens):
         """Performs the necessary initialization"""
         
-        self.delay1 = int(tokens[DELAY1])
-        self.delay2 = int(tokens[DELAY2])
-        self.block = int(tokens[BLOCK])
+        self.delay1 = int(tokens[self.schema.DELAY1])
+        self.delay2 = int(tokens[self.schema.DELAY2])
+        self.block = int(tokens[self.schema.BLOCK])
         #self.trial = int(tokens[TRIAL])
-        self.practiced = tokens[PRACTICED]
-        self.encodingOnset = int(tokens[ENCODING_ONSET])
-        self.encodingRt = int(tokens[ENCODING_RT])
-        self.executionOnset = int(tokens[EXECUTION_ONSET])
-        self.executionRt = int(tokens[EXECUTION_RT])
-        self.type = tokens[OPERATOR1]
+        self.practiced = tokens[self.schema.PRACTICED]
+        self.encodingOnset = int(tokens[self.schema.ENCODING_ONSET])
+        self.encodingRt = int(tokens[self.schema.ENCODING_RT])
+        self.executionOnset = int(tokens[self.schema.EXECUTION_ONSET])
+        self.executionRt = int(tokens[self.schema.EXECUTION_RT])
+        self.type = tokens[self.schema.OPERATOR1]
         
         # In ROI, there are two types of probes: Recalls
         # and Rotations. They need to be considered 
         # separately.
         
         if self.type == "RECALL":
-            self.probeAcc = int(tokens[RECALL_PROBE_ACC])
-            self.probeRt = int(tokens[RECALL_PROBE_RT])
-            self.probeOnset = int(tokens[RECALL_PROBE_ONSET])
+            self.probeAcc = int(tokens[self.schema.RECALL_PROBE_ACC])
+            self.probeRt = int(tokens[self.schema.RECALL_PROBE_RT])
+            self.probeOnset = int(tokens[self.schema.RECALL_PROBE_ONSET])
 
         elif self.type == "ROTATE":
-            self.probeAcc = int(tokens[ROTATION_PROBE_ACC])
-            self.probeRt = int(tokens[ROTATION_PROBE_RT])
-            self.probeOnset = int(tokens[ROTATION_PROBE_ONSET])
+            self.probeAcc = int(tokens[self.schema.ROTATION_PROBE_ACC])
+            self.probeRt = int(tokens[self.schema.ROTATION_PROBE_RT])
+            self.probeOnset = int(tokens[self.schema.ROTATION_PROBE_ONSET])
 
         else:
             # If type != RECALL | ROTATE, then we have a serious
@@ -167,23 +174,6 @@ class Trial:
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global DELAY1
-    global DELAY2
-    global BLOCK           
-    global TRIAL           
-    global PRACTICED       
-    global ENCODING_ONSET  
-    global ENCODING_RT     
-    global EXECUTION_ONSET 
-    global EXECUTION_RT    
-    global RECALL_PROBE_ONSET     
-    global RECALL_PROBE_RT        
-    global RECALL_PROBE_ACC       
-    global ROTATION_PROBE_ONSET     
-    global ROTATION_PROBE_RT        
-    global ROTATION_PROBE_ACC       
-    global OPERATOR1
-
     fin      = open(filename, 'rU')
     subject  = filename.split('.')[0].split('-')[5]
     lines    = fin.readlines()
@@ -192,24 +182,10 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    DELAY1               = colNames.index("Delay1[Trial]")
-    DELAY2               = colNames.index("Delay2[Trial]")
-    BLOCK                = colNames.index("BlockNum")
+    schema   = TableSchema(colNames, COLUMNS)
     #TRIAL                = colNames.index("Trials")
-    PRACTICED            = colNames.index("Practiced")
-    ENCODING_ONSET       = colNames.index("Encoding.OnsetTime")
-    ENCODING_RT          = colNames.index("Encoding.RT")
-    EXECUTION_ONSET      = colNames.index("Execution.OnsetTime")
-    EXECUTION_RT         = colNames.index("Execution.RT")
-    RECALL_PROBE_ONSET   = colNames.index("RecallProbe.OnsetTime")
-    RECALL_PROBE_RT      = colNames.index("RecallProbe.RT")
-    RECALL_PROBE_ACC     = colNames.index("RecallProbe.ACC")
-    ROTATION_PROBE_ONSET = colNames.index("RotationProbe.OnsetTime")
-    ROTATION_PROBE_RT    = colNames.index("RotationProbe.RT")
-    ROTATION_PROBE_ACC   = colNames.index("RotationProbe.ACC")
-    OPERATOR1            = colNames.index("Operator1[Trial]")
-
-    trials = [Trial(r) for r in rows]
+
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     FIRST_TRIALS = []
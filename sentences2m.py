@@ -11,6 +11,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -20,11 +21,16 @@ from math import sqrt
 TR     = 1000.0
 OFFSET = 0
 
-COMP_ONSET = 0
-COMP_ACC   = 0
-COMP_RT    = 0
-CONDITION  = 0
-TRIAL      = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'COMP_ONSET' : "Comp.OnsetTime",
+    'COMP_RT'    : "Comp.RT",
+    'COMP_ACC'   : "Comp.ACC",
+    'CONDITION'  : "Condition",
+    }
 
 class Trial:
     """
@@ -32,8 +38,9 @@ class Trial:
     (Sentence and Comprehension probe), with associated Onsets and
     Durations (ie. RTs), followed by delays.
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         try:
             self.Create(tokens)
@@ -47,10 +54,10 @@ class Trial:
     def Create(self, tokens):
         """Performs the necessary initialization"""
         self.block = 1
-        self.compOnset = int(tokens[COMP_ONSET])
-        self.compRt = int(tokens[COMP_RT])
-        self.acc = int(tokens[COMP_ACC])
-        self.condition = tokens[CONDITION]
+        self.compOnset = int(tokens[self.schema.COMP_ONSET])
+        self.compRt = int(tokens[self.schema.COMP_RT])
+        self.acc = int(tokens[self.schema.COMP_ACC])
+        self.condition = tokens[self.schema.CONDITION]
         
         # Now set up all the other values, based on the Probe values.
 
@@ -86,11 +93,6 @@ class Trial:
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global COMP_ONSET
-    global COMP_RT   
-    global COMP_ACC  
-    global CONDITION   
-
     fin      = open(filename, 'rU')
     subject  = filename.split('_')[0]
     lines    = fin.readlines()
@@ -99,12 +101,9 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    COMP_ONSET = colNames.index("Comp.OnsetTime")
-    COMP_RT    = colNames.index("Comp.RT")
-    COMP_ACC   = colNames.index("Comp.ACC")
-    CONDITION    = colNames.index("Condition")    
+    schema   = TableSchema(colNames, COLUMNS)
 
-    trials = [Trial(r) for r in rows]
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     FIRST_TRIALS = []
@@ -0,0 +1,508 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## SPEC2M
+## ---------------------------------------------------------------- ##
+## A generic version of the *2m.py scripts.  All of them do the
+## same things: they read the table produced by eparse.py, find the
+## columns they need, compute the beginning of each block, split
+## the trials into conditions (and errors), and write the onsets
+## and durations of each condition for SPM, one session per block
+## (as .mat files, and optionally as M-code).  Here, all the
+## study-specific information lives in a 'spec' file (see the
+## specs/ folder), and the engine does the rest, working on whole
+## columns of the table at once.
+## ---------------------------------------------------------------- ##
+##
+## A spec is a Python file that defines the following variables:
+##
+##  COLUMNS    : A dictionary of variable names -> table columns.
+##  FACTORS    : The variables that are strings (all the others are
+##               numbers).  Trials with non-numeric values in a
+##               numeric variable are skipped.
+##  OPTIONAL   : (Optional) Numeric variables that can be missing
+##               (as NaN) without skipping the trial.
+##  DERIVED    : (Optional) A list of (variable, expression) pairs,
+##               evaluated in order, that add or replace variables.
+##  BLOCK      : The variable with the block (SPM session) number.
+##  BLOCK_BEGIN: An expression, evaluated on the first trial of each
+##               block, giving the beginning of the block (in ms).
+##  PHASES     : A dictionary of phase names -> (onset, duration)
+##               expressions, in ms.  A duration can also be
+##               until(t): from the onset, as written (i.e., rounded
+##               to PRECISION), to the time t.
+##  CORRECT    : An expression that selects the trials to model.
+##  OUTLIER    : (Optional) An expression that selects the correct
+##               trials that should be discarded anyway.
+##  CONDITIONS : A list of (name, phase, expression) regressors.
+##               Each regressor gets the correct (non-outlier)
+##               trials for which the expression is true.
+##  DISCARD    : (Optional) A list of (name, phase, expression)
+##               regressors for the discarded trials (errors and
+##               outliers), added only if they are not empty.
+##  SKIP_EMPTY : (Optional) If True, empty CONDITIONS are left out.
+##  CONTRASTS  : (Optional) A list of (name, weights) pairs, with
+##               one weight per regressor in CONDITIONS.
+##  CONTRAST_SCALING : (Optional) How the weights of all sessions
+##               are scaled: 'blocks' divides them by the number
+##               of blocks (like inst2m5.py), 'normalize' makes the
+##               positive and negative weights sum to 1 and -1 (like
+##               roi2m.py).
+##  SUBJECT    : (Optional) A regular expression whose first group
+##               extracts the subject from the table's file name.
+##  OUTPUT     : The M-file name (%(subject)s is replaced).
+##  MAT_OUTPUT : (Optional) The .mat file name of each session (%d
+##               is replaced by the block number).
+##  CONTRASTS_OUTPUT : The contrasts file name.
+##  EVENT_COLUMNS : (Optional) A list of (column, expression) pairs
+##               with the per-trial values (RTs, accuracy, ...) of
+##               the BIDS events files.
+##  EVENTS_OUTPUT : (Optional) The BIDS events file name of each
+##               session (%(subject)s, %(study)s and %(run)d are
+##               replaced).
+##  PRECISION  : (Optional) Decimals of onsets and durations (in s).
+##
+## Expressions are ordinary Python expressions over the variables,
+## which are NumPy arrays with one value per trial, so "acc == 1"
+## or "(rt > 0) & (practiced == 'Yes')" select trials.  NumPy's
+## functions are available, as well as cutoff(x, n=3, method='sd',
+## by=None), the mean plus n standard deviations of x over the
+## correct trials (or the median plus n MADs with method='mad', or
+## the (100 - n)-th percentile with method='percentile'), computed
+## separately for each value of 'by' (e.g., by=block), if given.
+## ---------------------------------------------------------------- ##
+
+import sys, os, re
+import numpy as np
+
+import eparse
+import exclusion
+from trialtable import TrialTable
+from conditions import Regressor, RoundVector, EventsSink, WriteMats, WriteMCode
+
+## Change whenever the same spec and table would produce different
+## outputs (cohort2m.py uses it to decide what needs rebuilding)
+ENGINE_VERSION = "3"
+
+## ---------------------------------------------------------------- ##
+## Default values for the optional parts of a spec
+## ---------------------------------------------------------------- ##
+
+SPEC_DEFAULTS = {
+    'DERIVED'          : [],
+    'OPTIONAL'         : (),
+    'OUTLIER'          : None,
+    'DISCARD'          : [],
+    'SKIP_EMPTY'       : False,
+    'CONTRASTS'        : [],
+    'CONTRAST_SCALING' : 'blocks',
+    'SUBJECT'          : None,
+    'OUTPUT'           : "%(subject)s_sessions.m",
+    'MAT_OUTPUT'       : "session%d.mat",
+    'CONTRASTS_OUTPUT' : "%(subject)s.contrasts.txt",
+    'EVENT_COLUMNS'    : [],
+    'EVENTS_OUTPUT'    : "sub-%(subject)s_task-%(study)s_run-%(run)02d_events.tsv",
+    'PRECISION'        : 3,
+    }
+
+SPEC_REQUIRED = ('COLUMNS', 'FACTORS', 'BLOCK', 'BLOCK_BEGIN', 'PHASES',
+                 'CORRECT', 'CONDITIONS')
+
+
+def LoadSpec(filename):
+    """Loads a study spec file, and returns it as a dictionary"""
+    spec = {}
+    execfile(filename, spec)
+    for key in SPEC_REQUIRED:
+        if not key in spec:
+            raise Exception, "Spec %s does not define %s" % (filename, key)
+    for key, value in SPEC_DEFAULTS.items():
+        spec.setdefault(key, value)
+    spec['NAME'] = os.path.splitext(os.path.basename(filename))[0]
+    return spec
+
+
+def Subject(spec, filename):
+    """Extracts the subject ID from a table's file name"""
+    name = os.path.basename(filename)
+    if spec['SUBJECT'] is not None:
+        match = re.search(spec['SUBJECT'], name)
+        if match is not None:
+            return match.group(1)
+    return name.split('.')[0]
+
+
+## ---------------------------------------------------------------- ##
+## TABLES
+## ---------------------------------------------------------------- ##
+## Reads the table written by eparse.py (a tab-separated file, or a
+## columnar .npz file) as a dictionary of column name -> values.
+## ---------------------------------------------------------------- ##
+
+def ReadTable(filename):
+    """Reads an eparse table into a dictionary of columns"""
+    if filename.endswith(".npz"):
+        names, columns = eparse.LoadColumnar(filename)
+        table = {}
+        for name, column in zip(names, columns):
+            if isinstance(column, eparse.CategoricalColumn):
+                column = column.Decode()
+            else:
+                column = np.where(column == eparse.MISSING_INT, np.nan, column)
+            table.setdefault(name, column)
+        return table
+
+    fin      = open(filename, 'rU')
+    colNames = [x.strip() for x in fin.readline().split('\t')]
+    rows     = [[y.strip() for y in x.split('\t')] for x in fin]
+    fin.close()
+    table    = {}
+    for i, name in enumerate(colNames):
+        # Like colNames.index(), the first column with a name wins
+        if not name in table:
+            table[name] = np.array([(i < len(r) and r[i]) or "" for r in rows])
+    return table
+
+
+def Numeric(values):
+    """
+    Converts an array of values into floats.  Returns the array and a
+    mask of the values that could not be converted.
+    """
+    try:
+        return values.astype(float), np.zeros(len(values), dtype=bool)
+    except ValueError:
+        result = np.empty(len(values))
+        bad    = np.zeros(len(values), dtype=bool)
+        for i, v in enumerate(values):
+            try:
+                result[i] = float(v)
+            except ValueError:
+                result[i] = np.nan
+                bad[i]    = True
+        return result, bad
+
+
+class Until:
+    """A phase that lasts until a time (in ms), see Trials.Phase"""
+    def __init__(self, end):
+        self.end = end
+
+
+def Evaluate(expression, variables):
+    """Evaluates a spec expression over the trial variables"""
+    return eval(expression, {'np' : np, '__builtins__' : __builtins__}, variables)
+
+
+## ---------------------------------------------------------------- ##
+## TRIALS
+## ---------------------------------------------------------------- ##
+## All the trials of a table, as a TrialTable (a structured array
+## sorted by block; see trialtable.py)
+## ---------------------------------------------------------------- ##
+
+class Trials:
+    """The trials of a table, as seen through a study spec"""
+    def __init__(self, spec, table, verbose=True):
+        self.spec = spec
+        variables = {}
+        valid     = None
+        for name, column in spec['COLUMNS'].items():
+            if not column in table:
+                raise Exception, "Column '%s' (%s) not found" % (column, name)
+            values = table[column]
+            if name in spec['FACTORS']:
+                variables[name] = values.astype(str)
+            else:
+                variables[name], bad = Numeric(values)
+                if name in spec['OPTIONAL']:
+                    continue
+                if valid is None:
+                    valid = ~bad
+                else:
+                    valid &= ~bad
+
+        # Trials with missing numbers (e.g., warmup trials) are skipped
+        if valid is not None and not valid.all():
+            if verbose:
+                print "Skipping %d trials with missing values" % (~valid).sum()
+            for name in variables.keys():
+                variables[name] = variables[name][valid]
+
+        namespace = Namespace(variables)
+        for name, expression in spec['DERIVED']:
+            variables[name] = Evaluate(expression, namespace)
+            namespace[name] = variables[name]
+
+        self.table  = TrialTable(variables, spec['BLOCK'])
+        self.block  = self.table.block
+        self.blocks = self.table.blocks
+        self.begin  = self.table.First(Evaluate(spec['BLOCK_BEGIN'],
+                                                Namespace(self.table.Variables())))
+        self.Partition()
+
+    def __len__(self):
+        return len(self.table)
+
+    def Partition(self):
+        """Splits trials into the modeled ones and the discarded ones"""
+        namespace    = Namespace(self.table.Variables())
+        self.correct = self.Mask(self.spec['CORRECT'], namespace)
+        correct      = self.correct
+
+        def cutoff(x, n=3, method='sd', by=None):
+            """Upper cutoff of the correct trials (see exclusion.py)"""
+            return exclusion.Cutoff(x, correct, by, method, n)
+
+        namespace['correct'] = correct
+        namespace['cutoff']  = cutoff
+        self.outlier = np.zeros(len(self), dtype=bool)
+        if self.spec['OUTLIER'] is not None:
+            self.outlier = correct & self.Mask(self.spec['OUTLIER'], namespace)
+        self.included, self.discarded = exclusion.Partition(correct, self.outlier)
+        self.namespace = namespace
+
+    def Phase(self, phase):
+        """Onsets and durations (in s, from the block beginning) of a phase"""
+        onset, duration = self.spec['PHASES'][phase]
+        onsets    = self.table.RelativeTime(Evaluate(onset, self.namespace), self.begin)
+        durations = Evaluate(duration, self.namespace)
+        if isinstance(durations, Until):
+            # From the onset as written (rounded) to the end, so that
+            # the phase ends exactly where the next one begins
+            start     = RoundVector(onsets, self.spec['PRECISION'])[0]
+            durations = self.table.RelativeTime(durations.end, self.begin) - start
+        else:
+            durations = durations / 1000.0
+        # Constant durations become one value per trial
+        return onsets, durations + np.zeros(len(self))
+
+    def Mask(self, expression, namespace=None):
+        """The trials for which an expression is true"""
+        if namespace is None:
+            namespace = self.namespace
+        mask = np.asarray(Evaluate(expression, namespace), dtype=bool)
+        return mask | np.zeros(len(self), dtype=bool)
+
+    def Split(self, mask):
+        """The indexes of the trials selected by a mask, in each block"""
+        return self.table.Split(mask)
+
+
+def Namespace(variables):
+    """The names that spec expressions can use"""
+    namespace = dict([(x, getattr(np, x)) for x in dir(np) if not x.startswith("_")])
+    namespace['until'] = Until
+    namespace.update(variables)
+    return namespace
+
+
+## ---------------------------------------------------------------- ##
+## MODEL
+## ---------------------------------------------------------------- ##
+## Computes the regressors of every block: a list of (name, onsets,
+## durations) for each session, plus the contrast weights.
+## ---------------------------------------------------------------- ##
+
+def Counts(trials):
+    """Returns a list of (block, trials, errors, outliers) counts"""
+    table = trials.table
+    return zip(trials.blocks, table.Count(np.ones(len(trials), dtype=bool)),
+               table.Count(~trials.correct), table.Count(trials.outlier))
+
+
+def Selections(spec, trials):
+    """
+    Returns, for every block, a list of (name, phase, indexes, weight)
+    tuples: the regressors of the block, with the indexes of their
+    trials in the table, and the index of the regressor in CONDITIONS
+    (or None for the discarded trials).
+    """
+    conditions = [(n, p, trials.Split(trials.included & trials.Mask(e)))
+                  for n, p, e in spec['CONDITIONS']]
+    discards   = [(n, p, trials.Split(trials.discarded & trials.Mask(e)))
+                  for n, p, e in spec['DISCARD']]
+    blocks     = []
+
+    for j, b in enumerate(trials.blocks):
+        selections = []
+        for i, (name, phase, selected) in enumerate(conditions):
+            if spec['SKIP_EMPTY'] and len(selected[j]) == 0:
+                continue
+            selections.append((name, phase, selected[j], i))
+
+        for name, phase, selected in discards:
+            if len(selected[j]) > 0:
+                selections.append((name, phase, selected[j], None))
+
+        blocks.append((b, selections))
+    return blocks
+
+
+def Model(spec, trials, verbose=True):
+    """
+    Returns a list of (block, regressors, weights) tuples, where the
+    regressors are (name, onsets, durations) triples, and the weights
+    are the index of the regressor in CONDITIONS (or None for the
+    discarded trials).
+    """
+    phases   = dict([(p, trials.Phase(p)) for p in spec['PHASES'].keys()])
+    sessions = []
+    for b, selections in Selections(spec, trials):
+        regressors = []
+        weights    = []
+        for name, phase, indexes, weight in selections:
+            onsets, durations = phases[phase]
+            regressors.append((name, onsets[indexes], durations[indexes]))
+            weights.append(weight)
+        sessions.append((b, regressors, weights))
+
+    if verbose:
+        for counts in Counts(trials):
+            print "Block %d: %d trials, %d errors, %d outliers" % counts
+    return sessions
+
+
+def Events(spec, trials):
+    """
+    Returns a list of (block, Regressors) pairs, where each Regressor
+    also carries the EVENT_COLUMNS of its trials (see conditions.py).
+    """
+    phases  = dict([(p, trials.Phase(p)) for p in spec['PHASES'].keys()])
+    columns = []
+    for column, expression in spec['EVENT_COLUMNS']:
+        values = np.asarray(Evaluate(expression, trials.namespace))
+        if values.ndim == 0:
+            values = np.repeat(values, len(trials))
+        columns.append((column, values))
+    events  = []
+    for b, selections in Selections(spec, trials):
+        regressors = []
+        for name, phase, indexes, weight in selections:
+            onsets, durations = phases[phase]
+            regressors.append(Regressor(name, onsets[indexes], durations[indexes],
+                                        spec['PRECISION'],
+                                        [(c, v[indexes]) for c, v in columns]))
+        events.append((b, regressors))
+    return events
+
+
+def NormalizeContrast(v):
+    """Scales the positive and negative weights to sum to 1 and -1"""
+    v   = np.array(v, dtype=float)
+    pos = v[v > 0].sum()
+    neg = -v[v < 0].sum()
+    if pos > 0:
+        v[v > 0] = np.round(v[v > 0] / pos, 2)
+    if neg > 0:
+        v[v < 0] = np.round(v[v < 0] / neg, 2)
+    return v
+
+
+def WriteContrasts(filename, contrasts, sessions, scaling='blocks'):
+    """
+    Writes the contrasts file.  The weights of each contrast are
+    repeated for every session (with 0s for the discarded trials),
+    and then scaled (see CONTRAST_SCALING above).
+    """
+    fout = open(filename, 'w')
+    for name, vector in contrasts:
+        weights = []
+        for block, regressors, indexes in sessions:
+            for i in indexes:
+                if i is None:
+                    weights.append(0.0)
+                else:
+                    weights.append(float(vector[i]))
+        if scaling == 'normalize':
+            weights = NormalizeContrast(weights)
+        else:
+            weights = np.array(weights) / len(sessions)
+        fout.write("%s : [%s]\n" % (name, " ".join(["%g" % x for x in weights])))
+    fout.close()
+
+
+def Parse(spec, filename, outdir=".", mat=True, mcode=False, subject=None,
+          verbose=True, events=False):
+    """
+    Generates the onsets (and contrasts) for a table file.  The
+    sessions are written as .mat files (if 'mat' is True), as M-code
+    (if 'mcode' is True), and as BIDS events files (if 'events' is
+    True).  The output directory can contain
+    %(subject)s, and it is created if it does not exist.  If the
+    subject is not given, it is taken from the file name.  Returns
+    the sessions, the counts of each block (see Counts), and the
+    names of the files written.
+    """
+    if subject is None:
+        subject = Subject(spec, filename)
+    trials   = Trials(spec, ReadTable(filename), verbose)
+    sessions = Model(spec, trials, verbose)
+    names    = {'subject' : subject, 'study' : spec['NAME']}
+    outdir   = outdir % names
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    outputs  = []
+    if mat:
+        outputs += WriteMats(outdir, sessions, spec['PRECISION'], spec['MAT_OUTPUT'])
+    if mcode:
+        outputs.append(os.path.join(outdir, spec['OUTPUT'] % names))
+        WriteMCode(outputs[-1], sessions, spec['PRECISION'], spec['MAT_OUTPUT'])
+    if len(spec['CONTRASTS']) > 0:
+        outputs.append(os.path.join(outdir, spec['CONTRASTS_OUTPUT'] % names))
+        WriteContrasts(outputs[-1], spec['CONTRASTS'], sessions,
+                       spec['CONTRAST_SCALING'])
+    if events:
+        sink = EventsSink(os.path.join(outdir, spec['EVENTS_OUTPUT']), names)
+        for block, regressors in Events(spec, trials):
+            sink.Session(block, regressors)
+        outputs += sink.Close()
+    return sessions, Counts(trials), outputs
+
+
+HLP_MSG = """
+Usage:
+
+   spec2m.py [--outdir=<dir>] [--mcode] [--no-mat] [--events] <spec file>
+             <table1> <table2> ... <tableN>
+
+Where:
+
+   * <spec file> describes a study (see the specs/ folder)
+   * <tableX> is a table generated by eparse.py (tab-separated,
+     or a columnar .npz file)
+   * --outdir is the output directory (default: the current one,
+     or %(subject)s when there are several tables).  It can contain
+     %(subject)s, e.g. --outdir=%(subject)s/behav
+   * --mcode also writes the M-code that creates the .mat files
+   * --no-mat does not write the .mat files (only the M-code)
+   * --events also writes a BIDS events.tsv file per session
+
+The session .mat files (and contrast files) are written in the
+output directory.  Since the .mat files of all the subjects have
+the same names, several tables need an output directory with
+%(subject)s, and must belong to different subjects.
+"""
+
+if __name__ == "__main__":
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    args    = [x for x in sys.argv[1:] if not x.startswith("--")]
+    if len(args) < 2:
+        print HLP_MSG
+    else:
+        spec   = LoadSpec(args[0])
+        mcode  = "--mcode" in options or "--no-mat" in options
+        outdir = "."
+        if len(args) > 2:
+            # Otherwise every table overwrites the .mat files of the previous one
+            outdir   = "%(subject)s"
+            subjects = [Subject(spec, x) for x in args[1:]]
+            for subject in subjects:
+                if subjects.count(subject) > 1:
+                    raise Exception, "Several tables of subject %s would write the same files" % subject
+        outdir = eparse.Option(options, "outdir", outdir)
+        if len(args) > 2 and not "%(subject)s" in outdir:
+            raise Exception, "With several tables, --outdir must contain %(subject)s"
+        for filename in args[1:]:
+            print filename
+            Parse(spec, filename, outdir, not "--no-mat" in options, mcode,
+                  events="--events" in options)
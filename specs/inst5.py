@@ -0,0 +1,134 @@
+## ---------------------------------------------------------------- ##
+## INST (version 5)
+## ---------------------------------------------------------------- ##
+## Spec for spec2m.py that reproduces inst2m5.py.  Encoding and
+## Execution are divided by Practice (+/-), and are followed by
+## 'post' phases that last until the next phase begins.  Correct
+## trials slower than mean + 3 SD (in Encoding or Execution) are
+## discarded together with the errors.  Each block begins 4s before
+## the fixation of its first trial.
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'block'          : "Block",
+    'trial'          : "Trial",
+    'practiced'      : "Practiced",
+    'fixation'       : "Fixation1.OnsetTime",
+    'encoding'       : "TaskEncoding.OnsetTime",
+    'encodingRt'     : "TaskEncoding.RT",
+    'execution'      : "TaskExecution.OnsetTime",
+    'executionRt'    : "TaskExecution.RT",
+    'probe'          : "Probe.OnsetTime",
+    'probeRt'        : "Probe.RT",
+    'acc'            : "Probe.ACC",
+    }
+
+FACTORS = ('practiced',)
+
+DERIVED = [
+    ('practice', "in1d(practiced, ['T', 'HIGH'])"),
+    ]
+
+BLOCK       = 'block'
+BLOCK_BEGIN = "fixation - 4000"
+
+PHASES = {
+    'Encoding'      : ("encoding", "encodingRt"),
+    'Execution'     : ("execution", "executionRt"),
+    'Probe'         : ("probe", "probeRt"),
+    # Post phases last from the end of a phase (rounded, like the
+    # onsets) to the beginning of the next one
+    'PostEncoding'  : ("encoding + encodingRt", "until(execution)"),
+    'PostExecution' : ("execution + executionRt", "until(probe)"),
+    # Discarded probes without a response last 2s
+    'DiscardProbe'  : ("probe", "where(probeRt == 0, 2000, probeRt)"),
+    }
+
+CORRECT = "acc == 1"
+OUTLIER = "(encodingRt >= cutoff(encodingRt)) | (executionRt >= cutoff(executionRt))"
+
+CONDITIONS = [
+    ('ENC/P+',      'Encoding',      "practice"),
+    ('ENC/P-',      'Encoding',      "~practice"),
+    ('EXE/P+',      'Execution',     "practice"),
+    ('EXE/P-',      'Execution',     "~practice"),
+    ('Probes',      'Probe',         "True"),
+    ('POST_ENC/P+', 'PostEncoding',  "practice"),
+    ('POST_ENC/P-', 'PostEncoding',  "~practice"),
+    ('POST_EXE/P+', 'PostExecution', "practice"),
+    ('POST_EXE/P-', 'PostExecution', "~practice"),
+    ]
+
+DISCARD = [
+    ('ENC/Discard',   'Encoding',     "True"),
+    ('EXE/Discard',   'Execution',    "True"),
+    ('PROBE/Discard', 'DiscardProbe', "True"),
+    ]
+
+CONTRASTS = [
+    ('Enc P+', [1, 0, 0, 0, 0, 0, 0, 0, 0]),
+    ('Enc P-', [0, 1, 0, 0, 0, 0, 0, 0, 0]),
+    ('Exe P+', [0, 0, 1, 0, 0, 0, 0, 0, 0]),
+    ('Exe P-', [0, 0, 0, 1, 0, 0, 0, 0, 0]),
+    ('Probe',  [0, 0, 0, 0, 1, 0, 0, 0, 0]),
+
+    ('PostEnc P+', [0, 0, 0, 0, 0, 1, 0, 0, 0]),
+    ('PostEnc P-', [0, 0, 0, 0, 0, 0, 1, 0, 0]),
+    ('PostExe P+', [0, 0, 0, 0, 0, 0, 0, 1, 0]),
+    ('PostExe P-', [0, 0, 0, 0, 0, 0, 0, 0, 1]),
+
+    ('Enc', [0.5, 0.5, 0, 0, 0,  0, 0, 0, 0]),
+    ('Exe', [0, 0, 0.5, 0.5, 0,  0, 0, 0, 0]),
+
+    ('Enc > Exe', [0.5, 0.5, -0.5, -0.5, 0,  0, 0, 0, 0]),
+    ('Exe > Enc', [-0.5, -0.5, 0.5, 0.5, 0,  0, 0, 0, 0]),
+
+    ('PostEnc', [0, 0, 0, 0, 0,  0.5, 0.5, 0, 0]),
+    ('PostExe', [0, 0, 0, 0, 0,  0, 0, 0.5, 0.5]),
+
+    ('PostEnc > PostExe', [0, 0, 0, 0, 0,  0.5, 0.5, 0, 0]),
+    ('PostExe > PostEnc', [0, 0, 0, 0, 0,  0, 0, 0.5, 0.5]),
+
+    ('P-', [0, 0.5, 0, 0.5, 0,  0, 0, 0, 0]),
+    ('P+', [0.5, 0, 0.5, 0, 0,  0, 0, 0, 0]),
+
+    ('P- > P+', [-0.5, 0.5, -0.5, 0.5, 0,  0, 0, 0, 0]),
+    ('P+ > P-', [0.5, -0.5, 0.5, -0.5, 0,  0, 0, 0, 0]),
+
+    ('PostP-', [0, 0, 0, 0, 0, 0, 0.5, 0, 0.5]),
+    ('PostP+', [0, 0, 0, 0, 0, 0.5, 0, 0.5, 0]),
+
+    ('PostP- > PostP+', [0, 0, 0, 0, 0, -0.5, 0.5, -0.5, 0.5]),
+    ('PostP+ > PostP-', [0, 0, 0, 0, 0, 0.5, -0.5, 0.5, -0.5]),
+
+    ('P- > P+ | Enc', [-1, 1, 0, 0, 0,  0, 0, 0, 0]),
+    ('P+ > P- | Enc', [1, -1, 0, 0, 0,  0, 0, 0, 0]),
+    ('P- > P+ | Exe', [0, 0, -1, 1, 0,  0, 0, 0, 0]),
+    ('P+ > P- | Exe', [0, 0, 1, -1, 0,  0, 0, 0, 0]),
+
+    ('Enc > Exe | P-', [0, 1, 0, -1, 0, 0, 0, 0, 0]),
+    ('Enc > Exe | P+', [1, 0, -1, 0, 0, 0, 0, 0, 0]),
+    ('Exe > Enc | P-', [0, -1, 0, 1, 0, 0, 0, 0, 0]),
+    ('Exe > Enc | P+', [-1, 0, 1, 0, 0, 0, 0, 0, 0]),
+
+    ('d(Exe P+)', [-0.3333, -0.3333, 1, -0.3333, 0, 0, 0, 0, 0]),
+    ('d(Exe P-)', [-0.3333, -0.3333, -0.3333, 1, 0, 0, 0, 0, 0]),
+    ('d(Enc P+)', [1, -0.3333, -0.3333, -0.3333, 0, 0, 0, 0, 0]),
+    ('d(Enc P-)', [-0.3333, 1, -0.3333, -0.3333, 0, 0, 0, 0, 0]),
+    ]
+
+# Per-trial columns of the BIDS events files (RTs in s, and n/a
+# when there was no response)
+EVENT_COLUMNS = [
+    ('practiced',    "practiced"),
+    ('accuracy',     "acc"),
+    ('encoding_rt',  "where(encodingRt > 0, encodingRt / 1000.0, nan)"),
+    ('execution_rt', "where(executionRt > 0, executionRt / 1000.0, nan)"),
+    ('probe_rt',     "where(probeRt > 0, probeRt / 1000.0, nan)"),
+    ]
+
+PRECISION        = 1
+
+SUBJECT          = r"^(.{3})"
+OUTPUT           = "%(subject)ssessions.m"
+CONTRASTS_OUTPUT = "%(subject)s.contrasts.txt"
@@ -0,0 +1,77 @@
+## ---------------------------------------------------------------- ##
+## RITL
+## ---------------------------------------------------------------- ##
+## Spec for spec2m.py that reproduces ritl2m.py.  Each trial has
+## three phases (Encoding, Execution, Probe), and the Encoding and
+## Execution phases are divided by Practice (Yes/No).  Each block
+## begins 4s before the first fixation.
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'delay1'         : "Delay1",
+    'delay2'         : "Delay2",
+    'block'          : "BlockNum",
+    'trial'          : "Trials",
+    'practiced'      : "Practiced",
+    'fixation'       : "Fixation1.OnsetTime",
+    'encoding'       : "Encoding.OnsetTime",
+    'encodingRt'     : "Encoding.RT",
+    'execution'      : "Execution.OnsetTime",
+    'executionRt'    : "Execution.RT",
+    'probe'          : "Probe.OnsetTime",
+    'probeRt'        : "Probe.RT",
+    'acc'            : "Probe.ACC",
+    }
+
+FACTORS = ('practiced',)
+
+# RTs that are 0s are estimated from the next phase's onset, and
+# trials that still have negative RTs were aborted (out of time).
+DERIVED = [
+    ('encodingRt',  "where(encodingRt == 0, execution - encoding - delay1 - 2000, encodingRt)"),
+    ('executionRt', "where(executionRt == 0, probe - execution - delay2 - 1000, executionRt)"),
+    ('aborted',     "(encodingRt <= 0) | (executionRt <= 0)"),
+    ('executionRt', "where(aborted, -1, executionRt)"),
+    ('probeRt',     "where(aborted, -1, probeRt)"),
+    ('acc',         "where(aborted, 0, acc)"),
+    ]
+
+BLOCK       = 'block'
+BLOCK_BEGIN = "fixation - 4000"
+
+PHASES = {
+    'Encoding'  : ("encoding", "encodingRt"),
+    'Execution' : ("execution", "executionRt"),
+    'Probe'     : ("probe", "probeRt"),
+    }
+
+CORRECT = "acc == 1"
+
+CONDITIONS = [
+    ('Encoding/Practiced',  'Encoding',  "practiced == 'Yes'"),
+    ('Execution/Practiced', 'Execution', "practiced == 'Yes'"),
+    ('Encoding/Novel',      'Encoding',  "practiced == 'No'"),
+    ('Execution/Novel',     'Execution', "practiced == 'No'"),
+    ('Probe',               'Probe',     "True"),
+    ]
+
+# Aborted trials might have encoding errors only, or encoding and
+# execution errors only.
+DISCARD = [
+    ('Encoding/Error',  'Encoding',  "(encoding > 0) & (encodingRt > 0)"),
+    ('Execution/Error', 'Execution', "(execution > 0) & (executionRt > 0)"),
+    ('Probe/Error',     'Probe',     "(probe > 0) & (probeRt > 0)"),
+    ]
+
+# Per-trial columns of the BIDS events files (RTs in s, and n/a
+# when there was no response)
+EVENT_COLUMNS = [
+    ('practiced',    "practiced"),
+    ('accuracy',     "acc"),
+    ('encoding_rt',  "where(encodingRt > 0, encodingRt / 1000.0, nan)"),
+    ('execution_rt', "where(executionRt > 0, executionRt / 1000.0, nan)"),
+    ('probe_rt',     "where(probeRt > 0, probeRt / 1000.0, nan)"),
+    ]
+
+SUBJECT = r"^(?:[^.]*-)?([^-.]*)"
+OUTPUT  = "s%(subject)s_sessions.m"
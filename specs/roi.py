@@ -0,0 +1,164 @@
+## ---------------------------------------------------------------- ##
+## ROI
+## ---------------------------------------------------------------- ##
+## Spec for spec2m.py that reproduces roi2m.py.  Like RITL, but
+## there are two types of operations (RECALL and ROTATE), each one
+## with its own probe columns.  Each block begins two scans before
+## the first encoding.
+## ---------------------------------------------------------------- ##
+
+TR     = 2000.0
+OFFSET = 2
+
+COLUMNS = {
+    'delay1'         : "Delay1[Trial]",
+    'delay2'         : "Delay2[Trial]",
+    'block'          : "BlockNum",
+    'practiced'      : "Practiced",
+    'optype'         : "Operator1[Trial]",
+    'encoding'       : "Encoding.OnsetTime",
+    'encodingRt'     : "Encoding.RT",
+    'execution'      : "Execution.OnsetTime",
+    'executionRt'    : "Execution.RT",
+    'recallProbe'    : "RecallProbe.OnsetTime",
+    'recallRt'       : "RecallProbe.RT",
+    'recallAcc'      : "RecallProbe.ACC",
+    'rotationProbe'  : "RotationProbe.OnsetTime",
+    'rotationRt'     : "RotationProbe.RT",
+    'rotationAcc'    : "RotationProbe.ACC",
+    }
+
+FACTORS = ('practiced', 'optype')
+
+# Each trial has either a recall or a rotation probe
+OPTIONAL = ('recallProbe', 'recallRt', 'recallAcc',
+            'rotationProbe', 'rotationRt', 'rotationAcc')
+
+DERIVED = [
+    ('recall',      "optype == 'RECALL'"),
+    ('probe',       "where(recall, recallProbe, rotationProbe)"),
+    ('probeRt',     "where(recall, recallRt, rotationRt)"),
+    ('acc',         "where(recall, recallAcc, rotationAcc)"),
+    ('encodingRt',  "where(encodingRt == 0, execution - encoding - delay1 - 2000, encodingRt)"),
+    ('executionRt', "where(executionRt == 0, probe - execution - delay2 - 1000, executionRt)"),
+    ('aborted',     "(encodingRt <= 0) | (executionRt <= 0)"),
+    ('executionRt', "where(aborted, -1, executionRt)"),
+    ('probeRt',     "where(aborted, -1, probeRt)"),
+    ('acc',         "where(aborted, 0, acc)"),
+    ]
+
+BLOCK       = 'block'
+BLOCK_BEGIN = "encoding - %f" % (OFFSET * TR)
+
+PHASES = {
+    'Encoding'  : ("encoding", "encodingRt"),
+    'Execution' : ("execution", "executionRt"),
+    'Probe'     : ("probe", "probeRt"),
+    }
+
+CORRECT = "acc == 1"
+
+CONDITIONS = []
+for optype in ['RECALL', 'ROTATE']:
+    for practice, label in [('Yes', 'Practiced'), ('No', 'Novel')]:
+        for phase in ['Encoding', 'Execution']:
+            CONDITIONS.append(("%s/%s/%s" % (optype.lower(), phase, label), phase,
+                               "(optype == '%s') & (practiced == '%s')" % (optype, practice)))
+    CONDITIONS.append(("%s/Probe" % optype.lower(), 'Probe', "optype == '%s'" % optype))
+
+DISCARD = [
+    ('Encoding/Error',  'Encoding',  "(encoding > 0) & (encodingRt > 0)"),
+    ('Execution/Error', 'Execution', "(execution > 0) & (executionRt > 0)"),
+    ('Probe/Error',     'Probe',     "(probe > 0) & (probeRt > 0)"),
+    ]
+
+SKIP_EMPTY = True
+
+# Order: ReIP ReXP ReIN ReXN ReR RoIP RoXP RoIN RoXN RoR
+CONTRASTS = [
+    ('ReIP', [1, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReXP', [0, 1, 0, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReIN', [0, 0, 1, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReXN', [0, 0, 0, 1, 0, 0, 0, 0, 0, 0]),
+    ('ReR',  [0, 0, 0, 0, 1, 0, 0, 0, 0, 0]),
+    ('RoIP', [0, 0, 0, 0, 0, 1, 0, 0, 0, 0]),
+    ('RoXP', [0, 0, 0, 0, 0, 0, 1, 0, 0, 0]),
+    ('RoIN', [0, 0, 0, 0, 0, 0, 0, 1, 0, 0]),
+    ('RoXN', [0, 0, 0, 0, 0, 0, 0, 0, 1, 0]),
+    ('RoR',  [0, 0, 0, 0, 0, 0, 0, 0, 0, 1]),
+
+    # Factor 1
+    ('Re > Ro', [1, 1, 1, 1, 1, -1, -1, -1, -1, -1]),
+    ('Ro > Re', [-1, -1, -1, -1, -1, 1, 1, 1, 1, 1]),
+
+    # Factor 2
+    ('I > X', [1, -1, 1, -1, 0, 1, -1, 1, -1, 0]),
+    ('X > I', [-1, 1, -1, 1, 0, -1, 1, -1, 1, 0]),
+
+    # Factor 3
+    ('P > N', [1, 1, -1, -1, 0, 1, 1, -1, -1, 0]),
+    ('N > P', [-1, -1, 1, 1, 0, -1, -1, 1, 1, 0]),
+
+    # Factor 1 * Factor 2
+    ('ReI > RoI', [1, 0, 1, 0, 0, -1, 0, -1, 0, 0]),
+    ('RoI > ReI', [-1, 0, -1, 0, 0, 1, 0, 1, 0, 0]),
+    ('ReX > RoX', [0, 1, 0, 1, 0, 0, -1, 0, -1, 0]),
+    ('RoX > ReX', [0, -1, 0, -1, 0, 0, 1, 0, 1, 0]),
+    ('ReR > RoR', [0, 0, 0, 0, 1, 0, 0, 0, 0, -1]),
+    ('RoR > ReR', [0, 0, 0, 0, -1, 0, 0, 0, 0, 1]),
+
+    # Factor 2 * Factor 3
+    ('IP > XP', [1, -1, 0, 0, 0, 1, -1, 0, 0, 0]),
+    ('XP > IP', [-1, 1, 0, 0, 0, -1, 1, 0, 0, 0]),
+    ('IN > XN', [0, 0, 1, -1, 0, 0, 0, 1, -1, 0]),
+    ('XN > IN', [0, 0, -1, 1, 0, 0, 0, -1, 1, 0]),
+
+    # Factor 1 * Factor 3
+    ('ReP > ReN', [1, 1, -1, -1, 0, 0, 0, 0, 0, 0]),
+    ('ReN > ReP', [-1, -1, 1, 1, 0, 0, 0, 0, 0, 0]),
+    ('RoP > RoN', [0, 0, 0, 0, 0, 1, 1, -1, -1, 0]),
+    ('RoN > RoP', [0, 0, 0, 0, 0, -1, -1, 1, 1, 0]),
+
+    # Factor 1 * Factor 2 * Factor 3
+    ('ReIP > RoIP', [1, 0, 0, 0, 0, -1, 0, 0, 0, 0]),
+    ('RoIP > ReIP', [-1, 0, 0, 0, 0, 1, 0, 0, 0, 0]),
+    ('ReXP > RoXP', [0, 1, 0, 0, 0, 0, -1, 0, 0, 0]),
+    ('RoXP > ReXP', [0, -1, 0, 0, 0, 0, 1, 0, 0, 0]),
+    ('ReIN > RoIN', [0, 0, 1, 0, 0, 0, 0, -1, 0, 0]),
+    ('RoIN > ReIN', [0, 0, -1, 0, 0, 0, 0, 1, 0, 0]),
+    ('ReXN > RoXN', [0, 0, 0, 1, 0, 0, 0, 0, -1, 0]),
+    ('RoXN > ReXN', [0, 0, 0, -1, 0, 0, 0, 0, 1, 0]),
+    ('ReIP > ReXP', [1, -1, 0, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReXP > ReIP', [-1, 1, 0, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReIN > ReXN', [0, 0, 1, -1, 0, 0, 0, 0, 0, 0]),
+    ('ReXN > ReIN', [0, 0, -1, 1, 0, 0, 0, 0, 0, 0]),
+    ('RoIP > RoXP', [0, 0, 0, 0, 0, 1, -1, 0, 0, 0]),
+    ('RoXP > RoIP', [0, 0, 0, 0, 0, -1, 1, 0, 0, 0]),
+    ('RoIN > RoXN', [0, 0, 0, 0, 0, 0, 0, 1, -1, 0]),
+    ('RoXN > RoIN', [0, 0, 0, 0, 0, 0, 0, -1, 1, 0]),
+    ('ReIP > ReIN', [1, 0, -1, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReIN > ReIP', [-1, 0, 1, 0, 0, 0, 0, 0, 0, 0]),
+    ('ReXP > ReXN', [0, 1, 0, -1, 0, 0, 0, 0, 0, 0]),
+    ('ReXN > ReXP', [0, -1, 0, 1, 0, 0, 0, 0, 0, 0]),
+    ('RoIP > RoIN', [0, 0, 0, 0, 0, 1, 0, -1, 0, 0]),
+    ('RoIN > RoIP', [0, 0, 0, 0, 0, -1, 0, 1, 0, 0]),
+    ('RoXP > RoXN', [0, 0, 0, 0, 0, 0, 1, 0, -1, 0]),
+    ('RoXN > RoXP', [0, 0, 0, 0, 0, 0, -1, 0, 1, 0]),
+    ]
+
+CONTRAST_SCALING = 'normalize'
+
+# Per-trial columns of the BIDS events files (RTs in s, and n/a
+# when there was no response)
+EVENT_COLUMNS = [
+    ('operation',    "optype"),
+    ('practiced',    "practiced"),
+    ('accuracy',     "acc"),
+    ('encoding_rt',  "where(encodingRt > 0, encodingRt / 1000.0, nan)"),
+    ('execution_rt', "where(executionRt > 0, executionRt / 1000.0, nan)"),
+    ('probe_rt',     "where(probeRt > 0, probeRt / 1000.0, nan)"),
+    ]
+
+SUBJECT          = r"^(?:[^-.]*-){5}([^-.]*)"
+OUTPUT           = "s%(subject)s_sessions.m"
+CONTRASTS_OUTPUT = "s%(subject)s_contrasts.txt"
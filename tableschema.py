@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## TABLESCHEMA
+## ---------------------------------------------------------------- ##
+## The column indexes of a table file generated by eparse.py.
+##
+## The *2m.py scripts used to keep the position of each column in
+## module-level variables (BLOCK, ENCODING_RT, ...), set through
+## 'global' when parsing a file.  Two files could not be processed
+## at the same time in one process, because the second one would
+## overwrite the indexes of the first.  A TableSchema holds the
+## indexes of a single file instead, and is passed to each Trial:
+##
+##   COLUMNS = {'BLOCK' : "BlockNum", 'PROBE_RT' : "Probe.RT"}
+##   schema  = TableSchema(colNames, COLUMNS)
+##   block   = int(tokens[schema.BLOCK])
+## ---------------------------------------------------------------- ##
+
+
+class TableSchema:
+    """The positions of a set of named columns in a table file"""
+    def __init__(self, colNames, columns, optional=()):
+        """
+        Finds the position of every column in 'columns' (a dictionary
+        of variable -> column name) in 'colNames', the first line of
+        a table file.  A column name can also be a tuple of alternative
+        names, and the first one that exists is used.  Missing columns
+        raise ValueError, like colNames.index(), unless their variable
+        is in 'optional' (then their index is None).
+        """
+        self.colNames = colNames
+        self.columns  = {}
+        for variable, names in columns.items():
+            if isinstance(names, str):
+                names = (names,)
+            index = None
+            for name in names:
+                if name in colNames:
+                    index = colNames.index(name)
+                    break
+            if index is None and not variable in optional:
+                raise ValueError, "Column %s not found" % " or ".join(names)
+            self.columns[variable] = index
+            setattr(self, variable, index)
+
+    def __contains__(self, variable):
+        return getattr(self, variable, None) is not None
+
+    def __str__(self):
+        indexes = [x for x in sorted(vars(self).items()) if x[0].isupper()]
+        return "<Schema: %s>" % ", ".join(["%s=%s" % x for x in indexes])
+
+    def __repr__(self):
+        return self.__str__()
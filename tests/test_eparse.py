@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+## ---------------------------------------------------------------- ##
+## Tests of eparse.py.  Run from the repository (or from this       ##
+## directory) with:  python -m unittest discover tests              ##
+## ---------------------------------------------------------------- ##
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import eparse
+
+
+HEADER = ["*** Header Start ***",
+          "VersionPersist: 1",
+          "LevelName: Session",
+          "LevelName: Block",
+          "LevelName: Trial",
+          "Experiment: test",
+          "Subject: 7",
+          "Session: 1",
+          "*** Header End ***"]
+
+
+def Frame(level, fields):
+    """The lines of a LogFrame"""
+    tab = "\t" * (level - 1)
+    return [tab + x for x in ["Level: %d" % level, "*** LogFrame Start ***"] +
+            ["%s: %s" % x for x in fields] + ["*** LogFrame End ***"]]
+
+
+def MakeLog(path, blocks=2, trials=3, complete=True):
+    """
+    Writes a log with 'Procedure' at the session, block and trial
+    levels.  An incomplete log stops before the last block and the
+    session are closed, as when Eprime breaks.
+    """
+    lines = list(HEADER)
+    for b in range(blocks):
+        for t in range(trials):
+            lines += Frame(3, [("Procedure", "TrialProc"), ("Cond", "AB"[t % 2]),
+                               ("Stim.RT", 300 + t)])
+        if complete or b < blocks - 1:
+            lines += Frame(2, [("Procedure", "BlockProc"), ("BlockNum", b + 1)])
+    if complete:
+        lines += Frame(1, [("Procedure", "SessionProc"), ("Experiment", "test")])
+    open(path, "w").write("\r\n".join(lines) + "\r\n")
+
+
+class MergeTablesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testRecoveredLog(self):
+        """A recovered log (no session Procedure) keeps its columns"""
+        MakeLog(os.path.join(self.dir, "complete.txt"))
+        MakeLog(os.path.join(self.dir, "recovered.txt"), complete=False)
+        outdir   = os.path.join(self.dir, "out")
+        failures = eparse.ParseBatch(os.path.join(self.dir, "*.txt"), outdir,
+                                     processes=1)
+        self.assertEqual(failures, [])
+
+        lines = open(os.path.join(outdir, "study.tsv")).read().splitlines()
+        names = lines[0].split("\t")
+        procs = [i for i, x in enumerate(names) if x == "Procedure"]
+        self.assertEqual(len(procs), 3)
+        rows  = [x.split("\t") for x in lines[1:]]
+        self.assertEqual(len(rows), 12)
+        for row in rows:
+            # The block synthesized by the recovery has no values
+            block = (row[names.index("BlockNum")] and "BlockProc") or ""
+            self.assertEqual([row[i] for i in procs[1:]], [block, "TrialProc"])
+            self.assertTrue(row[names.index("Cond")] in ("A", "B"))
+        self.assertEqual(set([row[procs[0]] for row in rows if row[0] == "complete.txt"]),
+                         set(["SessionProc"]))
+        self.assertEqual(set([row[procs[0]] for row in rows if row[0] == "recovered.txt"]),
+                         set([""]))
+
+
+if __name__ == "__main__":
+    unittest.main()
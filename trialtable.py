@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+## ---------------------------------------------------------------- ##
+## TRIALTABLE
+## ---------------------------------------------------------------- ##
+## The trials of an experiment, held in a structured NumPy array
+## (one record per trial, one field per variable).
+##
+## The records are sorted by block once, when the table is created
+## (a stable sort, so trials keep their order within each block),
+## and the table remembers where each block begins and ends.  Any
+## selection of trials (a boolean mask, such as a condition) can
+## then be split into blocks with a single binary search, instead
+## of scanning all the trials once per block and condition.
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+
+
+class TrialTable:
+    """A structured array of trials, sorted and indexed by block"""
+    def __init__(self, variables, block):
+        """
+        Creates a table from a dictionary of variable name -> values
+        (all with the same length).  'block' is the name of the variable
+        that contains the block number.
+        """
+        names      = sorted(variables.keys())
+        arrays     = [np.asarray(variables[x]) for x in names]
+        self.order = np.argsort(arrays[names.index(block)].astype(int), kind='mergesort')
+        self.data  = np.rec.fromarrays([x[self.order] for x in arrays], names=names)
+        self.block = self.data[block].astype(int)
+
+        # Group index: the first (and one past the last) record of
+        # each block.
+        n           = len(self.block)
+        changes     = np.flatnonzero(self.block[1:] != self.block[:-1]) + 1
+        self.starts = np.concatenate(([0], changes)) if n > 0 else np.zeros(0, dtype=int)
+        self.ends   = np.concatenate((self.starts[1:], [n])).astype(int)
+        self.blocks = self.block[self.starts]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def __contains__(self, name):
+        return name in self.data.dtype.names
+
+    def Names(self):
+        """The names of the variables"""
+        return self.data.dtype.names
+
+    def Variables(self):
+        """A dictionary of variable name -> values (sorted by block)"""
+        return dict([(x, self.data[x]) for x in self.data.dtype.names])
+
+    def Block(self, i):
+        """The records of the i-th block (as a slice of the table)"""
+        return slice(self.starts[i], self.ends[i])
+
+    def First(self, values):
+        """For every trial, the value of its block's first trial"""
+        values = np.asarray(values)
+        return np.repeat(values[self.starts], self.ends - self.starts)
+
+    def RelativeTime(self, times, begin):
+        """Times (in ms) since the beginning of each block, in s"""
+        return (np.asarray(times, dtype=float) - begin) / 1000.0
+
+    def Split(self, mask):
+        """
+        Splits the trials selected by a boolean mask by block.  Returns
+        one array of record indexes for each block.
+        """
+        indexes = np.flatnonzero(mask)
+        return np.split(indexes, np.searchsorted(indexes, self.starts[1:]))
+
+    def Count(self, mask):
+        """Number of trials selected by a mask in each block"""
+        if len(self.starts) == 0:
+            return np.zeros(0, dtype=int)
+        return np.add.reduceat(np.asarray(mask, dtype=int), self.starts)
+
+
+## ---------------------------------------------------------------- ##
+## BLOCK TIMING
+## ---------------------------------------------------------------- ##
+## The beginning (in ms) and the length (in scans) of each block of
+## an experiment, to convert times into times and scans relative to
+## the block (one SPM session per block) or to the whole experiment
+## (concatenated sessions, DCM).  The cumulative number of scans
+## before each block is computed once, so that every conversion is a
+## lookup, and works on single times as well as whole arrays.
+## ---------------------------------------------------------------- ##
+
+class BlockTiming:
+    """The beginning and length of the blocks of an experiment"""
+    def __init__(self, begins, scans=None, TR=2000.0):
+        """
+        'begins' are the beginnings of blocks 1, 2, ... N (in ms), and
+        'scans' their lengths (in scans), if known.  TR is in ms.
+        """
+        self.begins = np.asarray(begins)
+        self.TR     = float(TR)
+        self.scans  = None
+        self.first  = None
+        if scans is not None and len(scans) > 0:
+            self.scans = np.asarray(scans, dtype=int)
+            self.first = np.concatenate(([0], np.cumsum(self.scans)))
+
+    def __len__(self):
+        return len(self.begins)
+
+    def Begin(self, blocks):
+        """The beginning of the given blocks (numbered from 1)"""
+        return self.begins[np.asarray(blocks) - 1]
+
+    def AbsoluteTime(self, times):
+        """Times (in ms) since the beginning of the experiment"""
+        return np.asarray(times) - self.begins[0]
+
+    def RelativeTime(self, times, blocks):
+        """Times (in ms) since the beginning of their blocks"""
+        return np.asarray(times) - self.Begin(blocks)
+
+    def RelativeScan(self, times, blocks):
+        """The scan of each time, from the beginning of its block"""
+        return Round(self.RelativeTime(times, blocks) / self.TR)
+
+    def AbsoluteScan(self, times, blocks):
+        """The scan of each time, from the beginning of the experiment"""
+        blocks = np.asarray(blocks)
+        if self.first is None:
+            if (blocks > 1).any():
+                raise Exception, "The length of the blocks is unknown"
+            return self.RelativeScan(times, blocks)
+        return self.RelativeScan(times, blocks) + self.first[blocks - 1]
+
+
+def Round(x):
+    """Rounds to the nearest integer, halves away from 0 (like round())"""
+    x = np.asarray(x, dtype=float)
+    return np.sign(x) * np.floor(np.abs(x) + 0.5)
@@ -11,6 +11,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -19,24 +20,32 @@ from math import sqrt
 TR     = 2000.0
 OFFSET = 2
 
-BLOCK_NUM          = 0
-LANGUAGE_CONDITION = 0
-TASK_CONDITION     = 0
-STIMULUS_ONSET     = 0
-STIMULUS_RT        = 0
-STIMULUS_ACC       = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'BLOCK_NUM'          : "BlockNum",
+    'LANGUAGE_CONDITION' : "LanguageCondition",
+    'TASK_CONDITION'     : "TaskCondition",
+    'STIMULUS_ONSET'     : "StimPresentation.OnsetTime",
+    'STIMULUS_RT'        : "StimPresentation.RT",
+    'STIMULUS_ACC'       : "StimPresentation.ACC",
+    'TRIAL'              : "Stimuli.Sample",
+    }
 
 
 class Trial:
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Inits a trial from a tokenized Eprime row"""
-        self.block             = int(tokens[BLOCK_NUM])
-        self.languageCondition = tokens[LANGUAGE_CONDITION]
-        self.taskCondition     = tokens[TASK_CONDITION]
-        self.onset             = int(tokens[STIMULUS_ONSET])
-        self.rt                = int(tokens[STIMULUS_RT])
-        self.acc               = int(tokens[STIMULUS_ACC])
-        self.trial             = int(tokens[TRIAL])
+        self.schema = schema
+        self.block             = int(tokens[self.schema.BLOCK_NUM])
+        self.languageCondition = tokens[self.schema.LANGUAGE_CONDITION]
+        self.taskCondition     = tokens[self.schema.TASK_CONDITION]
+        self.onset             = int(tokens[self.schema.STIMULUS_ONSET])
+        self.rt                = int(tokens[self.schema.STIMULUS_RT])
+        self.acc               = int(tokens[self.schema.STIMULUS_ACC])
+        self.trial             = int(tokens[self.schema.TRIAL])
         self.blockBegin        = 0
 
     def RelativeTime(self):
@@ -50,14 +59,6 @@ class Trial:
 
 def Parse(filename):
     """Parses an Eprime table file"""
-    global BLOCK_NUM
-    global LANGUAGE_CONDITION
-    global TASK_CONDITION
-    global STIMULUS_ONSET
-    global STIMULUS_RT
-    global STIMULUS_ACC
-    global TRIAL
-
     fin       = open(filename, 'rU')
     lines    = fin.readlines()
     tokens   = [x.split('\t') for x in lines]
@@ -69,15 +70,9 @@ def Parse(filename):
     ## New let's read the proper column indexes from the file
     ## header line, and set the appropriate variables.
     
-    BLOCK_NUM          = colNames.index('BlockNum')
-    LANGUAGE_CONDITION = colNames.index('LanguageCondition')
-    TASK_CONDITION     = colNames.index('TaskCondition')
-    STIMULUS_ONSET     = colNames.index('StimPresentation.OnsetTime')
-    STIMULUS_RT        = colNames.index('StimPresentation.RT')
-    STIMULUS_ACC       = colNames.index('StimPresentation.ACC')
-    TRIAL              = colNames.index('Stimuli.Sample')
-
-    trials = [Trial(r) for r in rows] 
+    schema   = TableSchema(colNames, COLUMNS)
+
+    trials = [Trial(r, schema) for r in rows] 
     FIRST_TRIALS = [t for t in trials if (t.trial % 49) == 1]
     
     for f in FIRST_TRIALS:
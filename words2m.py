@@ -11,6 +11,7 @@
 import sys, os
 from operator import add
 from math import sqrt
+from tableschema import TableSchema
 
 ## ---------------------------------------------------------------- ##
 ## This is a list of imaging-related variables
@@ -20,13 +21,20 @@ from math import sqrt
 TR     = 1000.0
 OFFSET = 0
 
-CHOICE_ONSET = 0
-CHOICE_RT    = 0
-CHOICE_ACC   = 0
-CHOICE_RESP  = 0
-CONDITION    = 0
-CHOICE1 = 0
-CHOICE2 = 0
+## ---------------------------------------------------------------- ##
+## The table columns of each variable (see tableschema.py)
+## ---------------------------------------------------------------- ##
+
+COLUMNS = {
+    'CHOICE_ONSET' : "Choice1.OnsetTime",
+    'CHOICE_RT'    : "Choice1.RT",
+    'CHOICE_ACC'   : "Choice1.ACC",
+    'CHOICE_RESP'  : "Choice1.RESP",
+    'CONDITION'    : "Condition",
+    'CHOICE1'      : "Choice1Type",
+    'CHOICE2'      : "Choice2Type",
+    }
+
 
 class Trial:
     """
@@ -34,8 +42,9 @@ class Trial:
     (Sentence and Comprehension probe), with associated Onsets and
     Durations (ie. RTs), followed by delays.
     """
-    def __init__(self, tokens):
+    def __init__(self, tokens, schema):
         """Initializes and catches eventual errors"""
+        self.schema = schema
         self.ok = True
         try:
             self.Create(tokens)
@@ -49,13 +58,13 @@ class Trial:
     def Create(self, tokens):
         """Performs the necessary initialization"""
         self.block = 1
-        self.choiceOnset = int(tokens[CHOICE_ONSET])
-        self.choiceRt = int(tokens[CHOICE_RT])
-        self.acc = int(tokens[CHOICE_ACC])
-        self.resp = tokens[CHOICE_RESP]
-        self.condition = tokens[CONDITION]
-        self.choice1 = tokens[CHOICE1]   # Left option
-        self.choice2 = tokens[CHOICE2]   # Right option
+        self.choiceOnset = int(tokens[self.schema.CHOICE_ONSET])
+        self.choiceRt = int(tokens[self.schema.CHOICE_RT])
+        self.acc = int(tokens[self.schema.CHOICE_ACC])
+        self.resp = tokens[self.schema.CHOICE_RESP]
+        self.condition = tokens[self.schema.CONDITION]
+        self.choice1 = tokens[self.schema.CHOICE1]   # Left option
+        self.choice2 = tokens[self.schema.CHOICE2]   # Right option
 
         # Now set up all the other values, based on the Choice values.
 
@@ -113,14 +122,6 @@ class Trial:
 
 def Parse(filename):
     """Parses a Table-format logfile"""
-    global CHOICE_ONSET
-    global CHOICE_RT   
-    global CHOICE_ACC
-    global CHOICE_RESP
-    global CONDITION   
-    global CHOICE1
-    global CHOICE2
-
     fin      = open(filename, 'rU')
     subject  = filename.split('_')[0]
     lines    = fin.readlines()
@@ -129,16 +130,10 @@ def Parse(filename):
     colNames = tokens[0]
     rows     = tokens[1:]
     
-    CHOICE_ONSET = colNames.index("Choice1.OnsetTime")
-    CHOICE_RT    = colNames.index("Choice1.RT")
-    CHOICE_ACC   = colNames.index("Choice1.ACC")
-    CHOICE_RESP  = colNames.index("Choice1.RESP")
-    CONDITION    = colNames.index("Condition")    
-    CHOICE1      = colNames.index("Choice1Type")
-    CHOICE2      = colNames.index("Choice2Type")
+    schema   = TableSchema(colNames, COLUMNS)
 
     print(CHOICE_RESP)
-    trials = [Trial(r) for r in rows]
+    trials = [Trial(r, schema) for r in rows]
     trials = [t for t in trials if t.ok]   # Excludes warmup trials 
 
     FIRST_TRIALS = []